@@ -0,0 +1,110 @@
+"""
+無意味英字列判定（gibberish_score）の精度と速度を測る。
+
+  python bench/bench_gibberish.py [しきい値]   # 省略時は調整用の行で選んだしきい値で評価する
+
+bench/gibberish_corpus.tsv（label\tname、1=無意味列）を名前のハッシュで
+調整用（tune）と評価用（held-out、約3割）に固定で分ける。しきい値は調整用だけで選び
+（誤検知0のまま最も多く検知できる値から1段階下げた値）、精度・再現率は評価用の行で出す。
+しきい値ごとの誤検知（実在ハンドルをタイムアウトしてしまう件数）も両方の行で一覧する。
+"""
+import os
+import sys
+import time
+import zlib
+
+os.environ.setdefault("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+CORPUS = os.path.join(os.path.dirname(__file__), "gibberish_corpus.tsv")
+HELDOUT_PERCENT = 30
+SWEEP = [round(-4.0 + 0.1 * i, 1) for i in range(16)]   # -4.0 .. -2.5
+MARGIN = 0.1   # 誤検知が出始める手前ぎりぎりを避け、1段階ぶん余裕を持たせる
+
+
+def load_corpus() -> list[tuple[int, str]]:
+    rows = []
+    with open(CORPUS, encoding="utf-8") as f:
+        for line in f:
+            if not line.strip() or line.startswith("#"):
+                continue
+            label, name = line.rstrip("\n").split("\t")
+            rows.append((int(label), name))
+    return rows
+
+
+def split_corpus(rows):
+    """名前の CRC32 で調整用 / 評価用に分ける（実行ごとに変わらない）"""
+    tune, heldout = [], []
+    for row in rows:
+        (heldout if zlib.crc32(row[1].encode()) % 100 < HELDOUT_PERCENT else tune).append(row)
+    return tune, heldout
+
+
+def choose_threshold(rows, scores) -> float:
+    """調整用の行で誤検知0を保つ最大のしきい値（大きいほど多く検知する）から MARGIN だけ下げた値"""
+    best = SWEEP[0]
+    for t in SWEEP:
+        if confusion(rows, scores, t)[1] == 0:
+            best = t
+    return round(best - MARGIN, 1)
+
+
+def confusion(rows, scores, threshold):
+    tp = fp = tn = fn = 0
+    for (label, _), score in zip(rows, scores):
+        pred = score is not None and score < threshold
+        if pred and label:
+            tp += 1
+        elif pred:
+            fp += 1
+        elif label:
+            fn += 1
+        else:
+            tn += 1
+    return tp, fp, tn, fn
+
+
+def report(title, rows, scores, threshold):
+    tp, fp, tn, fn = confusion(rows, scores, threshold)
+    print(f"{title}: rows={len(rows)} threshold={threshold}")
+    print(f"  accuracy={(tp + tn) / len(rows):.3f} precision={tp / max(tp + fp, 1):.3f} recall={tp / max(tp + fn, 1):.3f}")
+    print(f"  TP={tp} FP={fp} TN={tn} FN={fn}")
+    for (label, name), score in zip(rows, scores):
+        pred = score is not None and score < threshold
+        if pred != bool(label):
+            print(f"    {'FP' if pred else 'FN'} {name} score={score}")
+
+
+def main(threshold: float | None):
+    rows = load_corpus()
+    names = [n for _, n in rows]
+    tune, heldout = split_corpus(rows)
+    tune_scores = bot.gibberish_scores([n for _, n in tune])
+    heldout_scores = bot.gibberish_scores([n for _, n in heldout])
+
+    chosen = choose_threshold(tune, tune_scores)
+    print(f"corpus={len(rows)} tune={len(tune)} held-out={len(heldout)}")
+    print(f"threshold chosen on tune set: {chosen}  (bot.GIBBERISH_THRESHOLD={bot.GIBBERISH_THRESHOLD})")
+    if threshold is None:
+        threshold = chosen
+    report("held-out", heldout, heldout_scores, threshold)
+
+    print("threshold sweep (tune / held-out):")
+    for t in SWEEP:
+        tp, fp, tn, fn = confusion(tune, tune_scores, t)
+        htp, hfp, htn, hfn = confusion(heldout, heldout_scores, t)
+        print(f"  {t:5.1f}: tune FP={fp:3d} FN={fn:3d}  held-out FP={hfp:3d} FN={hfn:3d} "
+              f"precision={htp / max(htp + hfp, 1):.3f} recall={htp / max(htp + hfn, 1):.3f}")
+
+    batch = names * 200
+    start = time.perf_counter()
+    bot.gibberish_scores(batch)
+    elapsed = time.perf_counter() - start
+    print(f"speed: {len(batch) / elapsed:,.0f} names/s ({len(batch)} names in {elapsed:.3f}s)")
+
+
+if __name__ == "__main__":
+    main(float(sys.argv[1]) if len(sys.argv) > 1 else None)
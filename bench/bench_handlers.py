@@ -0,0 +1,342 @@
+"""
+bot.py のハンドラをライブのギルドなしで測るオフラインベンチ。
+
+  python bench/bench_handlers.py [--latency-ms 0] [--time-scale 0] [--only NAME ...] [--verbose]
+
+Discord 側は bench/discord_fakes.py のスタンドインとモックRESTで置き換える。
+シナリオごとに スループット / p50・p99 レイテンシ / REST呼び出し数 を出すので、
+変更前後で比較すれば回帰が見える。
+
+  reaction_storm   1件の募集に ✋/↩️ のリアクションを大量に送る（埋め込み編集がまとまるか）
+  join_burst       on_member_join に100人を一気に流す（既定の JOIN_THRESHOLD でレイド封じ込めに入る）
+  join_onboarding  同じ100人をレイド判定なしで流す（案内メッセージ送信まで通す）
+  daily_cleanup    1万チャンネルのギルドで daily_cleanup_shard を1回実行
+  cleanup_shards   2シャード（削除20件のギルドと400件のギルド）のクリーンアップを同時に走らせ、
+                   少ない方のシャードが多い方を待たずに報告まで終わるかを見る
+  parse_events     bench/fixtures のイベントページを _parse_events で解析
+  parse_monsters   bench/fixtures のモンスターページを _parse_monsters で解析
+  party_500        /201_メンバー分け に500人がリアクションし、締切ボタンから編成結果の送信まで
+  party_balance    1000人を武器バランス＋直近4回の組み合わせ回避で4人ずつに分ける（plan_parties のみ）
+
+--time-scale は bot.py 内の asyncio.sleep に掛ける倍率（既定0＝固定の待ち時間を除いて処理だけを測る）。
+--latency-ms はモックRESTの1回あたりの遅延。レイテンシは1回のハンドラ呼び出し、
+スループットは裏で予約された編集・送信が捌け切るまでを含めた1秒あたりの処理件数。
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+os.environ.setdefault("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+from discord_fakes import (  # noqa: E402
+    FakeApplicationContext, FakeGuild, MockREST, ScaledAsyncio, drain, percentile, reaction_payload, standard_guild,
+)
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+class Scenario:
+    def __init__(self, name: str, rest: MockREST):
+        self.name = name
+        self.rest = rest
+        self.latencies: list[float] = []
+        self.ops = 0
+        self.elapsed = 0.0
+        self.notes: list[str] = []
+
+    async def timed(self, coro):
+        started = time.perf_counter()
+        await coro
+        self.latencies.append(time.perf_counter() - started)
+        self.ops += 1
+
+    def report(self) -> str:
+        tput = self.ops / self.elapsed if self.elapsed else 0.0
+        lines = [
+            f"{self.name:<16} ops={self.ops:<6} {tput:>10,.0f} ops/s  "
+            f"p50={percentile(self.latencies, 0.5) * 1000:8.3f}ms  p99={percentile(self.latencies, 0.99) * 1000:8.3f}ms  "
+            f"rest={self.rest.total()}"
+        ]
+        lines += [f"{'':<16}   {n:>6}  {route}" for route, n in self.rest.calls.most_common(3)]
+        lines += [f"{'':<16}   {note}" for note in self.notes]
+        return "\n".join(lines)
+
+
+def _new_guild(rest: MockREST) -> FakeGuild:
+    return standard_guild(bot, rest)
+
+
+def _reset_bot_state():
+    bot.bot._connection._guilds.clear()
+    bot.RECRUITS.clear()
+    bot.guide_messages.clear()
+    bot.TEMP_VCS.clear()
+    bot.TEMP_VC_INDEX.clear()
+    bot.REACTION_ROUTES.clear()
+    bot.RAID_STATE.clear()
+    bot._recruit_last_embed.clear()
+    bot._MESSAGE_CACHE.clear()
+
+
+async def scenario_reaction_storm(rest: MockREST, n_users: int = 500, rounds: int = 4) -> Scenario:
+    guild = _new_guild(rest)
+    channel = guild.add_text_channel("募集")
+    owner = guild.add_member("owner")
+    msg = await channel.send("recruit")
+    bot.RECRUITS[msg.id] = {
+        "owner_id": owner.id, "channel_id": channel.id, "time_text": "今から", "content_text": "フリー",
+        "vc_name": None, "limit": None, "participants": set(), "closed": False, "created_at": time.time(),
+    }
+    bot._route_add(msg.id, bot.ROUTE_RECRUIT)
+    bot._remember_message(msg)
+    users = [guild.add_member(f"hunter{i}") for i in range(n_users)]
+    # 参加 → 取り消し → 再参加 … に加えて重複参加（警告DM）も混ぜる
+    payloads = []
+    for r in range(rounds):
+        emoji = bot.EMOJI_JOIN if r % 2 == 0 else bot.EMOJI_LEAVE
+        payloads += [reaction_payload(guild, channel.id, msg.id, u.id, emoji) for u in users]
+    payloads += [reaction_payload(guild, channel.id, msg.id, u.id, bot.EMOJI_LEAVE) for u in users[: n_users // 10]]
+
+    sc = Scenario("reaction_storm", rest)
+    rest.reset()
+    baseline = asyncio.all_tasks()
+    started = time.perf_counter()
+    for p in payloads:
+        await sc.timed(bot.on_raw_reaction_add(p))
+    await drain(bot, baseline)
+    sc.elapsed = time.perf_counter() - started
+    return sc
+
+
+async def scenario_join_burst(rest: MockREST, n: int = 100, raid_guard: bool = True) -> Scenario:
+    guild = _new_guild(rest)
+    members = [guild.add_member(f"newcomer{i}") for i in range(n)]
+    saved = bot.JOIN_THRESHOLD, bot.RAID_CONTAINMENT_SEC
+    if not raid_guard:
+        bot.JOIN_THRESHOLD = 10**9
+    bot.RAID_CONTAINMENT_SEC = 0.2   # 報告ループが実時間で回り続けないよう短縮
+    sc = Scenario("join_burst" if raid_guard else "join_onboarding", rest)
+    rest.reset()
+    baseline = asyncio.all_tasks()
+    started = time.perf_counter()
+    try:
+        await asyncio.gather(*(sc.timed(bot.on_member_join(m)) for m in members))
+        await drain(bot, baseline)
+    finally:
+        bot.JOIN_THRESHOLD, bot.RAID_CONTAINMENT_SEC = saved
+    sc.elapsed = time.perf_counter() - started
+    return sc
+
+
+async def scenario_daily_cleanup(rest: MockREST, n_channels: int = 10_000) -> Scenario:
+    guild = _new_guild(rest)
+    sentinel = guild.add_role("BotTempVC")
+    bot.GUILD_CONFIG[guild.id] = {**bot.DEFAULT_GUILD_CONFIG, "temp_vc_sentinel_role_id": sentinel.id}
+    # 1/4 がBot作成（センチネル付き）、1/8 が既定名のみ、残りは通常のVC
+    for i in range(n_channels):
+        if i % 4 == 0:
+            guild.add_voice_channel(f"{bot.TEMP_VC_NAME_PREFIX}{i}", overwrites={sentinel: object()})
+        elif i % 8 == 1:
+            guild.add_voice_channel(f"{bot.TEMP_VC_NAME_PREFIX}{i}")
+        else:
+            guild.add_voice_channel(f"雑談{i}")
+    bot._seed_temp_vc_index(guild)
+
+    sc = Scenario("daily_cleanup", rest)
+    rest.reset()
+    baseline = asyncio.all_tasks()
+    started = time.perf_counter()
+    try:
+        await sc.timed(bot.daily_cleanup_shard(guild.shard_id))
+        await drain(bot, baseline)
+    finally:
+        bot.GUILD_CONFIG.pop(guild.id, None)
+    sc.elapsed = time.perf_counter() - started
+    sc.ops = n_channels   # スループットは走査したチャンネル数で見る
+    return sc
+
+
+async def scenario_cleanup_shards(rest: MockREST, sizes: tuple[int, ...] = (20, 400)) -> Scenario:
+    """シャードごとのループが、それぞれのギルドだけを片付けて独立に終わるか"""
+    saved_shards = getattr(bot.bot, "shards", None)
+    guilds = []
+    for shard_id, n in enumerate(sizes):
+        guild = _new_guild(rest)
+        guild.shard_id = shard_id
+        sentinel = guild.add_role("BotTempVC")
+        bot.GUILD_CONFIG[guild.id] = {**bot.DEFAULT_GUILD_CONFIG, "temp_vc_sentinel_role_id": sentinel.id}
+        for i in range(n):
+            guild.add_voice_channel(f"{bot.TEMP_VC_NAME_PREFIX}{i}", overwrites={sentinel: object()})
+        bot._seed_temp_vc_index(guild)
+        guilds.append(guild)
+    bot.bot.shards = {shard_id: object() for shard_id in range(len(sizes))}
+
+    sc = Scenario("cleanup_shards", rest)
+    rest.reset()
+    baseline = asyncio.all_tasks()
+    started = time.perf_counter()
+    finished: dict[int, float] = {}
+
+    async def _run_shard(shard_id: int):
+        await bot.daily_cleanup_shard(shard_id)
+        finished[shard_id] = time.perf_counter() - started
+
+    try:
+        shard_ids = bot._local_shard_ids()
+        await asyncio.gather(*(sc.timed(_run_shard(s)) for s in shard_ids))
+        await drain(bot, baseline)
+    finally:
+        for guild in guilds:
+            bot.GUILD_CONFIG.pop(guild.id, None)
+        if saved_shards is None:
+            del bot.bot.shards
+        else:
+            bot.bot.shards = saved_shards
+    sc.elapsed = time.perf_counter() - started
+    left = sum(len(bot.TEMP_VC_INDEX.get(g.id, {})) for g in guilds)
+    sc.notes.append(
+        "per shard: " + "  ".join(f"shard{s} vcs={n} {finished[s] * 1000:.0f}ms" for s, n in zip(shard_ids, sizes))
+        + f"  left={left}"
+    )
+    return sc
+
+
+def _fixtures(prefix: str) -> list[bytes]:
+    paths = sorted(p for p in os.listdir(FIXTURE_DIR) if p.startswith(prefix) and p.endswith(".html"))
+    return [open(os.path.join(FIXTURE_DIR, p), "rb").read() for p in paths]
+
+
+async def scenario_parse(rest: MockREST, name: str, prefix: str, parser, repeat: int = 20) -> Scenario:
+    pages = _fixtures(prefix)
+    sc = Scenario(name, rest)
+    rest.reset()
+    started = time.perf_counter()
+    for _ in range(repeat):
+        for html in pages:
+            t0 = time.perf_counter()
+            parser(html)
+            sc.latencies.append(time.perf_counter() - t0)
+            sc.ops += 1
+    sc.elapsed = time.perf_counter() - started
+    return sc
+
+
+async def scenario_party(rest: MockREST, n_participants: int = 500, runs: int = 20) -> Scenario:
+    guild = _new_guild(rest)
+    organizer = guild.add_member("organizer")
+    hunters = [guild.add_member(f"hunter{i}") for i in range(n_participants)]
+    bot_member = guild.add_member("nemunemu", bot=True, member_id=bot.bot.user.id)
+    other_bot = guild.add_member("otherbot", bot=True)
+    deadline = bot.PARTY_MAX_DEADLINE_SEC
+    # 締切のタイマーは止めておき、主催者の「今すぐ締め切る」で集計を終える
+    saved_asyncio = bot.asyncio
+    bot.asyncio = ScaledAsyncio(saved_asyncio.scale, hold_at=deadline)
+
+    sc = Scenario("party_500", rest)
+    rest.reset()
+    baseline = asyncio.all_tasks()
+    started = time.perf_counter()
+    try:
+        for r in range(runs):
+            # 同じチャンネルの編集間隔の制限で測定が埋もれないよう、1回ごとに別チャンネルで行う
+            channel = guild.add_text_channel(f"パーティ{r}")
+            command = asyncio.create_task(bot.party.callback(FakeApplicationContext(guild, channel, organizer), 4, deadline))
+            while not bot.PARTY_SESSIONS:
+                await asyncio.sleep(0)
+            message_id, session = next(iter(bot.PARTY_SESSIONS.items()))
+            # Bot自身・他のBot・別の絵文字・参加の取り消しも混ぜる
+            for m in (bot_member, other_bot, *hunters):
+                await bot.on_raw_reaction_add(reaction_payload(guild, channel.id, message_id, m.id, bot.EMOJI_PARTY))
+            for m in hunters[:10]:
+                await bot.on_raw_reaction_add(reaction_payload(guild, channel.id, message_id, m.id, "👍"))
+            for m in hunters[: n_participants // 10]:
+                await bot.on_raw_reaction_remove(reaction_payload(guild, channel.id, message_id, m.id, bot.EMOJI_PARTY))
+            t0 = time.perf_counter()
+            session["closed"].set()
+            await command
+            sc.latencies.append(time.perf_counter() - t0)
+            sc.ops += 1
+        await drain(bot, baseline)
+    finally:
+        bot.asyncio = saved_asyncio
+    sc.elapsed = time.perf_counter() - started
+    return sc
+
+
+async def scenario_party_balance(rest: MockREST, n_participants: int = 1000, size: int = 4, runs: int = 20) -> Scenario:
+    rng = random.Random(0)
+    guild_id = 1
+    user_ids = list(range(10_000, 10_000 + n_participants))
+    # 武器の人気に偏りをつける（先頭ほど多い）・1割は未申告
+    popularity = [len(bot.WEAPONS) - i for i in range(len(bot.WEAPONS))]
+    weapons = {uid: rng.choices(bot.WEAPONS, popularity)[0] for uid in user_ids if rng.random() > 0.1}
+    bot.PARTY_HISTORY.pop(guild_id, None)
+    for _ in range(bot.PARTY_HISTORY_EVENTS):
+        groups, _ = bot.plan_parties(user_ids, size, weapons, bot._recent_partners(guild_id, user_ids), rng=rng)
+        bot._remember_party_history(guild_id, groups)
+
+    sc = Scenario("party_balance", rest)
+    rest.reset()
+    repeats, worst_spread = [], 0
+    started = time.perf_counter()
+    for _ in range(runs):
+        t0 = time.perf_counter()
+        groups, rep = bot.plan_parties(user_ids, size, weapons, bot._recent_partners(guild_id, user_ids), rng=rng)
+        sc.latencies.append(time.perf_counter() - t0)
+        sc.ops += 1
+        sizes = [len(g) for g in groups]
+        assert sum(sizes) == n_participants and max(sizes) - min(sizes) <= 1, sizes
+        repeats.append(rep)
+        # 武器ごとに、1パーティあたりの人数の最大と最小の差
+        per_group = [Counter(weapons.get(uid) for uid in g) for g in groups]
+        for w in set(weapons.values()):
+            counts = [c[w] for c in per_group]
+            worst_spread = max(worst_spread, max(counts) - min(counts))
+    sc.elapsed = time.perf_counter() - started
+    bot.PARTY_HISTORY.pop(guild_id, None)
+    sc.notes.append(f"parties={len(groups)} repeated_pairs max={max(repeats)} weapon_spread max={worst_spread}")
+    return sc
+
+
+SCENARIOS = {
+    "reaction_storm": scenario_reaction_storm,
+    "join_burst": lambda rest: scenario_join_burst(rest, raid_guard=True),
+    "join_onboarding": lambda rest: scenario_join_burst(rest, raid_guard=False),
+    "daily_cleanup": scenario_daily_cleanup,
+    "cleanup_shards": scenario_cleanup_shards,
+    "parse_events": lambda rest: scenario_parse(rest, "parse_events", "gamewith_events", bot._parse_events),
+    "parse_monsters": lambda rest: scenario_parse(rest, "parse_monsters", "gamewith_monsters", bot._parse_monsters),
+    "party_500": scenario_party,
+    "party_balance": scenario_party_balance,
+}
+
+
+async def main(args):
+    bot.asyncio = ScaledAsyncio(args.time_scale)
+    rest = MockREST(latency=args.latency_ms / 1000)
+    names = args.only or list(SCENARIOS)
+    print(f"latency={args.latency_ms}ms time_scale={args.time_scale}")
+    for name in names:
+        _reset_bot_state()
+        sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+        with sink:
+            sc = await SCENARIOS[name](rest)
+        print(sc.report(), flush=True)
+    print(f"recruit embed edits: {bot.RECRUIT_EDIT_STATS}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="モックRESTの1回あたりの遅延（ミリ秒）")
+    parser.add_argument("--time-scale", type=float, default=0.0, help="bot.py 内の asyncio.sleep に掛ける倍率")
+    parser.add_argument("--only", nargs="*", choices=list(SCENARIOS), help="実行するシナリオ")
+    parser.add_argument("--verbose", action="store_true", help="bot.py のログを表示する")
+    asyncio.run(main(parser.parse_args()))
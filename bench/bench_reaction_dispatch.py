@@ -0,0 +1,54 @@
+"""
+on_raw_reaction_add の振り分けコスト（1イベントあたり）を測るマイクロベンチ。
+
+  python bench/bench_reaction_dispatch.py [件数]
+
+索引（REACTION_ROUTES）に無いメッセージへのリアクション＝サーバー内の大半のイベントが
+ギルド解決前に捨てられることを確認する。比較用に、索引に載っているが本人以外の
+案内メッセージへのリアクション（ギルド解決まで進むケース）も測る。
+"""
+import asyncio
+import os
+import sys
+import time
+from types import SimpleNamespace
+
+os.environ.setdefault("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+
+
+def _payload(message_id: int, user_id: int = 2) -> SimpleNamespace:
+    return SimpleNamespace(message_id=message_id, user_id=user_id, guild_id=1, channel_id=1, emoji="✋")
+
+
+async def _measure(payloads: list) -> float:
+    handler = bot.on_raw_reaction_add
+    start = time.perf_counter()
+    for p in payloads:
+        await handler(p)
+    return (time.perf_counter() - start) / len(payloads)
+
+
+async def main(n: int):
+    # 関係するメッセージを1万件登録しておく（索引のサイズに依存しないことの確認）
+    for mid in range(10_000):
+        bot._route_add(10_000_000 + mid, bot.ROUTE_RECRUIT)
+    bot._route_add(1, bot.ROUTE_ONBOARDING)
+    # bot.user は未ログインだと None なので、索引ヒット時の比較用に差し替える
+    bot.bot._connection.user = SimpleNamespace(id=999)
+
+    irrelevant = [_payload(100 + i) for i in range(n)]
+    routed = [_payload(1) for _ in range(n)]
+    await _measure(irrelevant[:1000])  # ウォームアップ
+
+    per_irrelevant = await _measure(irrelevant)
+    per_routed = await _measure(routed)
+    print(f"events={n}")
+    print(f"irrelevant: {per_irrelevant * 1e9:8.0f} ns/event  ({1 / per_irrelevant:,.0f} events/s)")
+    print(f"routed    : {per_routed * 1e9:8.0f} ns/event  ({1 / per_routed:,.0f} events/s)  ※ギルド未解決で終了")
+
+
+if __name__ == "__main__":
+    asyncio.run(main(int(sys.argv[1]) if len(sys.argv) > 1 else 200_000))
@@ -0,0 +1,124 @@
+"""
+RUN_MODE=http を空の BOT_DATA_DIR で起動し、HTTP ワーカーが応答するかを確かめる。
+
+  python bench/check_http_mode.py [--workers 2] [--timeout 20]
+
+新しいチェックアウト（data/ が無い状態）からの起動を再現するため、毎回まだ存在しない
+一時ディレクトリを BOT_DATA_DIR に渡す。`/` の応答、/webhook の受付とジョブ参照
+（SQLite キュー経由）を確認する。続けて、受け付けたジョブを実行中（running）のまま
+止まったことにして再起動し、やり直されずに unknown になることも確かめる。
+1つでも失敗すれば終了コード1で終わる。
+"""
+import argparse
+import json
+import os
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.error
+import urllib.request
+
+ROOT = os.path.join(os.path.dirname(__file__), "..")
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def _request(url: str, method: str = "GET", headers: dict | None = None) -> tuple[int, str]:
+    req = urllib.request.Request(url, method=method, headers=headers or {}, data=b"{}" if method == "POST" else None)
+    try:
+        with urllib.request.urlopen(req, timeout=5) as res:
+            return res.status, res.read().decode()
+    except urllib.error.HTTPError as e:
+        return e.code, e.read().decode()
+
+
+def _start(env: dict) -> subprocess.Popen:
+    return subprocess.Popen([sys.executable, "bot.py"], cwd=ROOT, env=env, start_new_session=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.STDOUT, text=True)
+
+
+def _stop(proc: subprocess.Popen) -> str:
+    if proc.poll() is None:
+        os.killpg(proc.pid, signal.SIGTERM)
+    return proc.communicate(timeout=10)[0]
+
+
+def _wait_ready(proc: subprocess.Popen, base: str, timeout: float) -> tuple[int, str]:
+    deadline = time.monotonic() + timeout
+    while True:
+        if proc.poll() is not None:
+            raise RuntimeError(f"bot.py が終了しました（code={proc.returncode}）")
+        try:
+            return _request(f"{base}/")
+        except OSError:
+            if time.monotonic() > deadline:
+                raise RuntimeError("時間内に応答がありませんでした")
+            time.sleep(0.2)
+
+
+def main(args) -> int:
+    data_dir = os.path.join(tempfile.mkdtemp(), "data")   # まだ存在しないディレクトリ
+    port = _free_port()
+    env = {
+        **os.environ, "RUN_MODE": "http", "PORT": str(port), "HTTP_WORKERS": str(args.workers),
+        "BOT_DATA_DIR": data_dir, "PROMPT_TEXT": os.environ.get("PROMPT_TEXT", "check"),
+        "REPRESENTATIVE_COUNCIL_CHANNEL_ID": os.environ.get("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0"),
+    }
+    base = f"http://127.0.0.1:{port}"
+    db_path = os.path.join(data_dir, "ipc.db")
+    failures, output = [], ""
+    proc = _start(env)
+    try:
+        status, body = _wait_ready(proc, base, args.timeout)
+        print(f"GET /            {status} {body.strip()}")
+        if status != 200:
+            failures.append(f"GET / -> {status}")
+        status, body = _request(f"{base}/webhook", "POST", {"Idempotency-Key": "check", "Content-Type": "application/json"})
+        print(f"POST /webhook    {status} {body.strip()}")
+        if status not in (200, 202):
+            failures.append(f"POST /webhook -> {status}")
+        else:
+            status_url = base + json.loads(body)["status_url"]
+            status, body = _request(status_url)
+            print(f"GET status_url   {status} {body.strip()}")
+            if status != 200:
+                failures.append(f"GET status_url -> {status}")
+            if not os.path.exists(db_path):
+                failures.append("ipc.db が作成されていません")
+            else:
+                # 実行中に落ちたことにして再起動する → 再実行されず unknown になるはず
+                output += _stop(proc)
+                with sqlite3.connect(db_path) as conn:
+                    conn.execute("UPDATE webhook_jobs SET status = 'running', finished_at = NULL, tweet = NULL, error = NULL")
+                proc = _start(env)
+                _wait_ready(proc, base, args.timeout)
+                status, body = _request(status_url)
+                print(f"after restart    {status} {body.strip()}")
+                if status != 200 or json.loads(body).get("status") != "unknown":
+                    failures.append("中断されたジョブが unknown になっていません")
+    except RuntimeError as e:
+        failures.append(str(e))
+    finally:
+        output += _stop(proc)
+    if failures:
+        print(output)
+        for f in failures:
+            print(f"FAIL: {f}")
+        return 1
+    print("OK")
+    return 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", type=int, default=2, help="HTTP_WORKERS")
+    parser.add_argument("--timeout", type=float, default=20.0, help="起動を待つ秒数")
+    sys.exit(main(parser.parse_args()))
@@ -0,0 +1,82 @@
+"""
+bench/fixtures に保存した GameWith のページで _parse_events / _parse_monsters の結果と速度を確かめる。
+
+  python bench/check_parsers.py [--repeat 10]
+
+使える解析器（html.parser と、入っていれば lxml）ごとに、保存済みの期待値
+（*.expected.json）と一致するかを比べ、1ページあたりの解析時間を出す。
+比較のため、部分木に絞らずページ全体を html.parser で組み立てた場合の時間も出す。
+どれか1つでも期待値と違えば終了コード1で終わる。
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+os.environ.setdefault("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+from bs4 import BeautifulSoup  # noqa: E402
+from discord_fakes import percentile  # noqa: E402
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), "fixtures")
+
+
+def _available_parsers() -> list[str]:
+    parsers = ["html.parser"]
+    try:
+        import lxml  # noqa: F401
+        parsers.append("lxml")
+    except ImportError:
+        pass
+    return parsers
+
+
+def _events_as_json(html: bytes, parser: str) -> dict:
+    current, upcoming = bot._parse_events(html, parser)
+    return {"current": current, "upcoming": upcoming}
+
+
+def _full_tree(html: bytes, parser: str):
+    """部分木に絞らない場合の比較用（ページ全体を組み立てるだけ）"""
+    return BeautifulSoup(html, parser)
+
+
+CHECKS = [
+    ("events", "gamewith_events", _events_as_json),
+    ("monsters", "gamewith_monsters", lambda html, parser: bot._parse_monsters(html, parser)),
+]
+
+
+def _timed(fn, html: bytes, parser: str, repeat: int) -> list[float]:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn(html, parser)
+        samples.append(time.perf_counter() - t0)
+    return samples
+
+
+def main(args) -> int:
+    failures = 0
+    print(f"default parser={bot.HTML_PARSER} available={_available_parsers()}")
+    for name, stem, parse in CHECKS:
+        html = open(os.path.join(FIXTURE_DIR, f"{stem}.html"), "rb").read()
+        with open(os.path.join(FIXTURE_DIR, f"{stem}.expected.json"), encoding="utf-8") as f:
+            expected = json.load(f)
+        full = _timed(_full_tree, html, "html.parser", args.repeat)
+        print(f"{name:<9} full tree (html.parser)  p50={percentile(full, 0.5) * 1000:8.1f}ms")
+        for parser in _available_parsers():
+            ok = parse(html, parser) == expected
+            failures += not ok
+            samples = _timed(parse, html, parser, args.repeat)
+            print(f"{name:<9} {parser:<24} p50={percentile(samples, 0.5) * 1000:8.1f}ms  {'OK' if ok else 'MISMATCH'}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--repeat", type=int, default=10, help="1ページあたりの解析回数")
+    sys.exit(main(parser.parse_args()))
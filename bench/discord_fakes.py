@@ -0,0 +1,352 @@
+"""
+ベンチ用の Discord スタンドイン（Guild/Member/Channel/Message/Reaction）とモックRESTレイヤ。
+
+bot.py のハンドラが触る属性・メソッドだけを持つ。REST を伴う操作はすべて MockREST.call を通り、
+呼び出し回数を数えつつ設定した遅延だけ待つ（実際の通信はしない）。
+bot.py 側の isinstance 判定に合わせ、ボイスチャンネルだけは discord.VoiceChannel を継承している。
+"""
+import asyncio
+import itertools
+import random
+import time
+from collections import Counter, deque
+from types import SimpleNamespace
+
+import discord
+
+_ids = itertools.count(10**17)
+
+
+def next_id() -> int:
+    return next(_ids)
+
+
+class MockREST:
+    """REST 呼び出しの回数をルート別に数え、latency 秒（±jitter の割合）だけ待つ"""
+
+    def __init__(self, latency: float = 0.0, jitter: float = 0.2, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.calls: Counter[str] = Counter()
+        self._rnd = random.Random(seed)
+
+    async def call(self, route: str):
+        self.calls[route] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency * (1 + self._rnd.uniform(-self.jitter, self.jitter)))
+        else:
+            await asyncio.sleep(0)
+
+    def total(self) -> int:
+        return sum(self.calls.values())
+
+    def reset(self):
+        self.calls.clear()
+
+
+class ScaledAsyncio:
+    """
+    bot.py の asyncio 参照を差し替えるためのプロキシ。sleep だけ scale 倍にする。
+    参加直後の5秒待ちなど、固定の待ち時間で計測が埋もれないようにするため。
+    hold_at を指定すると、それ以上の長さの sleep はキャンセルされるまで終わらない
+    （/201 の締切のように「締切より先にボタンで閉じる」流れを scale=0 でも再現するため）。
+    """
+
+    def __init__(self, scale: float, hold_at: float | None = None):
+        self.scale = scale
+        self.hold_at = hold_at
+
+    def __getattr__(self, name):
+        return getattr(asyncio, name)
+
+    async def sleep(self, delay, result=None):
+        if self.hold_at is not None and delay >= self.hold_at:
+            await asyncio.Event().wait()
+        return await asyncio.sleep(delay * self.scale, result)
+
+
+class FakeRole:
+    def __init__(self, guild: "FakeGuild", name: str, role_id: int | None = None):
+        self.id = role_id if role_id is not None else next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<@&{self.id}>"
+
+
+class FakeMessage:
+    def __init__(self, channel, content: str | None = None, embed=None, message_id: int | None = None):
+        self.id = message_id if message_id is not None else next_id()
+        self.channel = channel
+        self.guild = channel.guild
+        self.content = content
+        self.embed = embed
+        self.reactions: list[FakeReaction] = []
+        self._rest: MockREST = channel._rest
+
+    async def edit(self, content=None, embed=None, **kwargs):
+        await self._rest.call("PATCH /channels/{channel_id}/messages/{message_id}")
+        if content is not None:
+            self.content = content
+        if embed is not None:
+            self.embed = embed
+        return self
+
+    async def delete(self, *, delay=None, reason=None):
+        await self._rest.call("DELETE /channels/{channel_id}/messages/{message_id}")
+
+    async def add_reaction(self, emoji):
+        await self._rest.call("PUT /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/@me")
+
+    async def remove_reaction(self, emoji, member):
+        await self._rest.call("DELETE /channels/{channel_id}/messages/{message_id}/reactions/{emoji}/{user_id}")
+
+
+class FakeReactionUsers:
+    """Reaction.users() の戻り値。flatten() は100件ずつページングして REST を数える"""
+    PAGE = 100
+
+    def __init__(self, reaction: "FakeReaction"):
+        self._reaction = reaction
+
+    async def flatten(self) -> list:
+        users = self._reaction._users
+        rest = self._reaction.message._rest
+        for _ in range(max(1, -(-len(users) // self.PAGE))):
+            await rest.call("GET /channels/{channel_id}/messages/{message_id}/reactions/{emoji}")
+        return list(users)
+
+
+class FakeReaction:
+    def __init__(self, message: FakeMessage, emoji: str, users: list):
+        self.message = message
+        self.emoji = emoji
+        self._users = users
+        self.count = len(users)
+
+    def users(self) -> FakeReactionUsers:
+        return FakeReactionUsers(self)
+
+
+class FakeTextChannel:
+    def __init__(self, guild: "FakeGuild", name: str, channel_id: int | None = None):
+        self.id = channel_id if channel_id is not None else next_id()
+        self.name = name
+        self.guild = guild
+        self.mention = f"<#{self.id}>"
+        self._rest = guild._rest
+        self._messages: dict[int, FakeMessage] = {}
+        self._next_ids: deque[int] = deque()
+
+    def preassign_ids(self, message_ids):
+        """以後の send() が返すメッセージIDを順に指定する（記録の再生で本番と同じIDにするため）"""
+        self._next_ids.extend(message_ids)
+
+    async def send(self, content=None, *, embed=None, view=None, **kwargs) -> FakeMessage:
+        await self._rest.call("POST /channels/{channel_id}/messages")
+        msg = FakeMessage(self, content, embed, self._next_ids.popleft() if self._next_ids else None)
+        self._messages[msg.id] = msg
+        return msg
+
+    def get_partial_message(self, message_id: int) -> FakeMessage:
+        return self._messages.get(message_id) or FakeMessage(self, message_id=message_id)
+
+    async def fetch_message(self, message_id: int) -> FakeMessage:
+        await self._rest.call("GET /channels/{channel_id}/messages/{message_id}")
+        msg = self._messages.get(message_id)
+        if msg is None:
+            raise discord.NotFound(SimpleNamespace(status=404, reason="Not Found"), "Unknown Message")
+        return msg
+
+
+class FakeVoiceChannel(discord.VoiceChannel):
+    """bot.py の isinstance(ch, discord.VoiceChannel) を通すため本物を継承し、初期化だけ差し替える"""
+
+    def __init__(self, guild: "FakeGuild", name: str, overwrites: dict | None = None, channel_id: int | None = None):
+        self.id = channel_id if channel_id is not None else next_id()
+        self.name = name
+        self.guild = guild
+        self._fake_overwrites = overwrites or {}
+        self._rest = guild._rest
+
+    @property
+    def overwrites(self):
+        return self._fake_overwrites
+
+    async def delete(self, *, reason=None):
+        await self._rest.call("DELETE /channels/{channel_id}")
+        self.guild._channels.pop(self.id, None)
+
+    def __repr__(self):
+        return f"<FakeVoiceChannel id={self.id} name={self.name!r}>"
+
+
+class FakeMember:
+    def __init__(self, guild: "FakeGuild", name: str, *, bot: bool = False, admin: bool = False, member_id: int | None = None):
+        self.id = member_id if member_id is not None else next_id()
+        self.name = name
+        self.display_name = name
+        self.mention = f"<@{self.id}>"
+        self.bot = bot
+        self.guild = guild
+        self.roles: list[FakeRole] = []
+        self.guild_permissions = SimpleNamespace(administrator=admin)
+        self._rest = guild._rest
+        self._dm_open = False
+
+    async def add_roles(self, *roles, reason=None):
+        for role in roles:
+            await self._rest.call("PUT /guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+            if role not in self.roles:
+                self.roles.append(role)
+
+    async def remove_roles(self, *roles, reason=None):
+        for role in roles:
+            await self._rest.call("DELETE /guilds/{guild_id}/members/{user_id}/roles/{role_id}")
+            if role in self.roles:
+                self.roles.remove(role)
+
+    async def edit(self, *, reason=None, **fields):
+        await self._rest.call("PATCH /guilds/{guild_id}/members/{user_id}")
+
+    async def send(self, content=None, **kwargs):
+        if not self._dm_open:
+            await self._rest.call("POST /users/@me/channels")
+            self._dm_open = True
+        await self._rest.call("POST /channels/{channel_id}/messages")
+
+
+class FakeGuild:
+    def __init__(self, rest: MockREST, name: str = "bench-guild", guild_id: int | None = None):
+        self.id = guild_id if guild_id is not None else next_id()
+        self.name = name
+        self.shard_id = 0
+        self._rest = rest
+        self._members: dict[int, FakeMember] = {}
+        self._channels: dict[int, object] = {}
+        self._roles: dict[int, FakeRole] = {}
+
+    def get_member(self, user_id: int):
+        return self._members.get(user_id)
+
+    def get_channel(self, channel_id: int):
+        return self._channels.get(channel_id)
+
+    def get_role(self, role_id: int):
+        return self._roles.get(role_id)
+
+    @property
+    def voice_channels(self) -> list:
+        return [ch for ch in self._channels.values() if isinstance(ch, discord.VoiceChannel)]
+
+    def add_role(self, name: str, role_id: int | None = None) -> FakeRole:
+        role = FakeRole(self, name, role_id)
+        self._roles[role.id] = role
+        return role
+
+    def add_member(self, name: str, **kwargs) -> FakeMember:
+        member = FakeMember(self, name, **kwargs)
+        self._members[member.id] = member
+        return member
+
+    def add_text_channel(self, name: str, channel_id: int | None = None) -> FakeTextChannel:
+        ch = FakeTextChannel(self, name, channel_id)
+        self._channels[ch.id] = ch
+        return ch
+
+    def add_voice_channel(self, name: str, overwrites: dict | None = None, channel_id: int | None = None) -> FakeVoiceChannel:
+        ch = FakeVoiceChannel(self, name, overwrites, channel_id)
+        self._channels[ch.id] = ch
+        return ch
+
+
+class FakeInteraction:
+    def __init__(self, channel: FakeTextChannel, message: FakeMessage):
+        self._channel = channel
+        self._message = message
+
+    async def original_response(self) -> FakeMessage:
+        await self._channel._rest.call("GET /webhooks/{application_id}/{token}/messages/@original")
+        return self._message
+
+
+class FakeFollowup:
+    def __init__(self, channel: FakeTextChannel):
+        self._channel = channel
+
+    async def send(self, content=None, **kwargs):
+        await self._channel._rest.call("POST /webhooks/{application_id}/{token}")
+        return FakeMessage(self._channel, content)
+
+
+class FakeApplicationContext:
+    """スラッシュコマンドの ctx。respond() は最初の応答（interaction callback）として数える"""
+
+    def __init__(self, guild: FakeGuild, channel: FakeTextChannel, author: FakeMember):
+        self.guild = guild
+        self.channel = channel
+        self.author = author
+        self.user = author
+        self.followup = FakeFollowup(channel)
+        self.responses: list[FakeMessage] = []
+
+    async def respond(self, content=None, *, embed=None, view=None, ephemeral=False, **kwargs) -> FakeInteraction:
+        await self.channel._rest.call("POST /interactions/{interaction_id}/{token}/callback")
+        msg = FakeMessage(self.channel, content, embed)
+        self.channel._messages[msg.id] = msg
+        self.responses.append(msg)
+        return FakeInteraction(self.channel, msg)
+
+    async def defer(self, **kwargs):
+        await self.channel._rest.call("POST /interactions/{interaction_id}/{token}/callback")
+
+    async def send_followup(self, content=None, **kwargs):
+        return await self.followup.send(content, **kwargs)
+
+
+def standard_guild(bot_module, rest: MockREST, guild_id: int | None = None) -> FakeGuild:
+    """bot.py が固定IDで参照するロール・チャンネルを備えたギルドを作って登録する"""
+    guild = FakeGuild(rest, guild_id=guild_id)
+    install_guild(bot_module, guild)
+    guild.add_role("初めて", bot_module.ROLE_FIRST_TIMER)
+    guild.add_role("一般", bot_module.ROLE_GENERAL)
+    guild.add_text_channel("代表者会議", bot_module.REPRESENTATIVE_COUNCIL_CHANNEL_ID)
+    guild.add_text_channel("案内", bot_module.GUIDE_CHANNEL_ID)
+    return guild
+
+
+def install_guild(bot_module, guild: FakeGuild, bot_user_id: int = 999):
+    """bot.get_guild / bot.guilds / bot.user が guild を返すよう、接続状態に直接登録する"""
+    state = bot_module.bot._connection
+    state._guilds[guild.id] = guild
+    state.user = SimpleNamespace(id=bot_user_id, bot=True)
+
+
+def reaction_payload(guild: FakeGuild, channel_id: int, message_id: int, user_id: int, emoji: str) -> SimpleNamespace:
+    return SimpleNamespace(guild_id=guild.id, channel_id=channel_id, message_id=message_id, user_id=user_id, emoji=emoji)
+
+
+def percentile(values: list[float], q: float) -> float:
+    if not values:
+        return 0.0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(round(q * (len(ordered) - 1))))]
+
+
+def _outbound_settled(bot_module) -> bool:
+    for st in bot_module.OUTBOUND.stats_by_prio.values():
+        if st["submitted"] != st["done"] + st["failed"] + st["dropped"] + st["merged"]:
+            return False
+    return True
+
+
+async def drain(bot_module, baseline: set, timeout: float = 120.0):
+    """baseline 以降に生まれたタスク（埋め込み編集・予約送信など）と送信キューが捌けるまで待つ"""
+    deadline = time.perf_counter() + timeout
+    workers = set(bot_module.OUTBOUND._tasks)
+    me = asyncio.current_task()
+    while time.perf_counter() < deadline:
+        pending = [t for t in asyncio.all_tasks() if t not in baseline and t not in workers and t is not me and not t.done()]
+        if not pending and _outbound_settled(bot_module):
+            return
+        await asyncio.sleep(0.001)
+    raise TimeoutError("background tasks did not settle")
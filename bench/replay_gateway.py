@@ -0,0 +1,239 @@
+"""
+GATEWAY_RECORD_PATH で記録したゲートウェイイベントを、スタンドイン相手に bot.py のハンドラへ流し直す。
+
+  python bench/replay_gateway.py data/gateway.jsonl.gz [--speed 1|10|max] [--latency-ms 0] [--time-scale S]
+                                [--raid-containment-sec S] [--verbose]
+
+記録先頭のスナップショット（RECRUITS / guide_messages / TEMP_VCS など）を復元してから、
+記録時刻の間隔を --speed 倍に縮めてイベントを投入する（max は待たずに連続投入）。
+ハンドラは本番のゲートウェイと同じく1イベント1タスクで並行に走らせる。
+
+ギルド・メンバー・チャンネルはイベントに出てきた時点で同じIDのスタンドインを作る。
+案内メッセージは記録中の ROUTE_ADD と同じ順・同じIDで送られるようにしてあるので、
+記録されたリアクションがそのまま案内/募集メッセージに当たる。
+
+--time-scale は bot.py 内の asyncio.sleep の倍率（既定は 1/speed、max のときは 0）。
+
+レイド封じ込めの期間と参加数の集計窓は time.monotonic() で測っていて sleep の倍率が効かないため、
+再生では秒数そのものを 1/speed に縮める（max のときは集計窓はそのまま、封じ込めは --raid-containment-sec）。
+bench/fixtures/gateway_raid.jsonl.gz は短時間の大量参加（レイド判定が発動する）を含む記録。
+ハンドラで例外が出た場合は終了コード1で終わる。
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import os
+import sys
+import time
+from collections import Counter, defaultdict, deque
+from types import SimpleNamespace
+
+os.environ.setdefault("REPRESENTATIVE_COUNCIL_CHANNEL_ID", "0")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import bot  # noqa: E402
+from discord_fakes import MockREST, ScaledAsyncio, drain, percentile, standard_guild  # noqa: E402
+
+MAX_SPEED_RAID_CONTAINMENT_SEC = 0.5
+
+
+def load_recording(path: str) -> tuple[dict, list[dict]]:
+    snapshot, events = {}, []
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        for line in f:
+            if not line.strip():
+                continue
+            rec = json.loads(line)
+            if rec["t"] == "BOT_SNAPSHOT":
+                # 追記で複数回起動した記録は、最初のスナップショットを使う
+                if not snapshot and not events:
+                    snapshot = rec["d"]
+                continue
+            events.append(rec)
+    return snapshot, events
+
+
+def _emoji_str(emoji: dict) -> str:
+    if emoji.get("id"):
+        return f"<{'a' if emoji.get('animated') else ''}:{emoji['name']}:{emoji['id']}>"
+    return emoji.get("name") or ""
+
+
+class Replayer:
+    def __init__(self, rest: MockREST):
+        self.rest = rest
+        self.guilds = {}
+        self.latencies: dict[str, list[float]] = defaultdict(list)
+        self.errors: Counter[str] = Counter()
+        self.skipped: Counter[str] = Counter()
+        self.thread_archived: dict[int, bool] = {}
+        self.onboarding_ids: deque[int] = deque()
+
+    def restore(self, snapshot: dict, events: list[dict]):
+        for ns, (target, key_type, _, decode) in bot.STATE._tables.items():
+            target.clear()
+            for key, value in snapshot.get(ns, {}).items():
+                target[key_type(key)] = decode(value)
+        bot._rebuild_reaction_routes()
+        self.onboarding_ids.extend(
+            int(e["d"]["message_id"]) for e in events
+            if e["t"] == "ROUTE_ADD" and e["d"]["kind"] == bot.ROUTE_ONBOARDING
+        )
+
+    def guild(self, guild_id) -> "object":
+        guild_id = int(guild_id)
+        guild = self.guilds.get(guild_id)
+        if guild is None:
+            guild = self.guilds[guild_id] = standard_guild(bot, self.rest, guild_id)
+            # 案内メッセージのIDは全ギルドで記録順に払い出す
+            guild.get_channel(bot.GUIDE_CHANNEL_ID)._next_ids = self.onboarding_ids
+        return guild
+
+    def member(self, guild, user: dict):
+        member = guild.get_member(int(user["id"]))
+        if member is None:
+            name = user.get("username") or str(user["id"])
+            member = guild.add_member(name, bot=bool(user.get("bot")), member_id=int(user["id"]))
+        return member
+
+    def text_channel(self, guild, channel_id):
+        ch = guild.get_channel(int(channel_id))
+        if ch is None:
+            ch = guild.add_text_channel(f"ch-{channel_id}", int(channel_id))
+        return ch
+
+    def _reaction(self, d: dict):
+        guild = self.guild(d["guild_id"])
+        self.text_channel(guild, d["channel_id"])
+        if d.get("member"):
+            self.member(guild, d["member"]["user"])
+        return SimpleNamespace(
+            guild_id=guild.id, channel_id=int(d["channel_id"]), message_id=int(d["message_id"]),
+            user_id=int(d["user_id"]), emoji=_emoji_str(d.get("emoji") or {}),
+        )
+
+    def handler_for(self, t: str, d: dict):
+        """記録1件を、対応するハンドラのコルーチンに変換する（対象外なら None）"""
+        if t == "ROUTE_ADD":
+            message_id = int(d["message_id"])
+            if d["kind"] == bot.ROUTE_RECRUIT and d.get("recruit"):
+                bot.RECRUITS[message_id] = bot._decode_recruit(d["recruit"])
+            if d["kind"] != bot.ROUTE_ONBOARDING:   # 案内は再生側の on_member_join が同じIDで登録する
+                bot._route_add(message_id, d["kind"])
+            return None
+        if t == "GUILD_MEMBER_ADD":
+            guild = self.guild(d["guild_id"])
+            return bot.on_member_join(self.member(guild, d["user"]))
+        if t == "GUILD_MEMBER_REMOVE":
+            guild = self.guild(d["guild_id"])
+            member = self.member(guild, d["user"])
+            guild._members.pop(member.id, None)
+            return bot.on_member_remove(member)
+        if t == "MESSAGE_REACTION_ADD":
+            return bot.on_raw_reaction_add(self._reaction(d))
+        if t == "MESSAGE_REACTION_REMOVE":
+            return bot.on_raw_reaction_remove(self._reaction(d))
+        if t == "THREAD_UPDATE":
+            guild = self.guild(d["guild_id"])
+            thread_id = int(d["id"])
+            archived = bool((d.get("thread_metadata") or {}).get("archived"))
+            before = SimpleNamespace(id=thread_id, archived=self.thread_archived.get(thread_id, False), guild=guild)
+            after = SimpleNamespace(id=thread_id, archived=archived, guild=guild)
+            self.thread_archived[thread_id] = archived
+            vc_id = bot.THREAD_TO_VC.get(thread_id)
+            if vc_id and guild.get_channel(vc_id) is None:
+                guild.add_voice_channel(f"{bot.TEMP_VC_NAME_PREFIX}{vc_id}", channel_id=vc_id)
+            return bot.on_thread_update(before, after)
+        # VOICE_STATE_UPDATE など、現状 bot.py にハンドラが無いものは件数だけ数える
+        self.skipped[t] += 1
+        return None
+
+    async def _timed(self, t: str, coro):
+        started = time.perf_counter()
+        try:
+            await coro
+        except Exception as e:
+            self.errors[t] += 1
+            print(f"[REPLAY] {t} で例外: {type(e).__name__}: {e}", flush=True)
+        self.latencies[t].append(time.perf_counter() - started)
+
+    async def run(self, events: list[dict], speed: float | None, settle_timeout: float = 120.0) -> tuple[float, float]:
+        """記録を流し、(所要時間, 予定からの最大遅れ) を返す"""
+        baseline = asyncio.all_tasks()
+        tasks = []
+        max_behind = 0.0
+        base_ts = events[0]["ts"] if events else 0.0
+        started = time.perf_counter()
+        for rec in events:
+            if speed is not None:
+                due = (rec["ts"] - base_ts) / speed
+                delay = due - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+                else:
+                    max_behind = max(max_behind, -delay)
+            coro = self.handler_for(rec["t"], rec["d"])
+            if coro is not None:
+                tasks.append(asyncio.create_task(self._timed(rec["t"], coro)))
+            if speed is None:
+                await asyncio.sleep(0)
+        await asyncio.gather(*tasks)
+        await drain(bot, baseline, timeout=settle_timeout)
+        return time.perf_counter() - started, max_behind
+
+    def report(self, elapsed: float, max_behind: float, n_events: int) -> str:
+        lines = [f"events={n_events} elapsed={elapsed:.3f}s ({n_events / elapsed if elapsed else 0:,.0f} events/s) "
+                 f"max_behind_schedule={max_behind * 1000:.1f}ms rest={self.rest.total()}"]
+        for t, lat in sorted(self.latencies.items()):
+            lines.append(
+                f"  {t:<24} n={len(lat):<6} p50={percentile(lat, 0.5) * 1000:8.3f}ms "
+                f"p99={percentile(lat, 0.99) * 1000:8.3f}ms errors={self.errors[t]}"
+            )
+        for t, n in sorted(self.skipped.items()):
+            lines.append(f"  {t:<24} n={n:<6} (ハンドラなし)")
+        lines += [f"  {n:>6}  {route}" for route, n in self.rest.calls.most_common(5)]
+        return "\n".join(lines)
+
+
+async def main(args):
+    speed = None if args.speed == "max" else float(args.speed)
+    scale = args.time_scale if args.time_scale is not None else (1 / speed if speed else 0.0)
+    bot.asyncio = ScaledAsyncio(scale)
+    # 封じ込めの終了判定は実時間なので、再生速度に合わせて秒数を縮める
+    if args.raid_containment_sec is not None:
+        bot.RAID_CONTAINMENT_SEC = args.raid_containment_sec
+    elif speed:
+        bot.RAID_CONTAINMENT_SEC = bot.RAID_CONTAINMENT_SEC / speed
+    else:
+        bot.RAID_CONTAINMENT_SEC = MAX_SPEED_RAID_CONTAINMENT_SEC
+    if speed:
+        bot.JOIN_WINDOW_SEC = bot.JOIN_WINDOW_SEC / speed
+    bot.bot._connection.user = SimpleNamespace(id=args.bot_user_id, bot=True)
+    snapshot, events = load_recording(args.path)
+    replayer = Replayer(MockREST(latency=args.latency_ms / 1000))
+    replayer.restore(snapshot, events)
+    print(f"recording={args.path} events={len(events)} speed={args.speed} time_scale={scale} "
+          f"latency={args.latency_ms}ms raid_containment={bot.RAID_CONTAINMENT_SEC}s")
+    sink = contextlib.nullcontext() if args.verbose else contextlib.redirect_stdout(io.StringIO())
+    with sink:
+        elapsed, behind = await replayer.run(events, speed, settle_timeout=120.0 + bot.RAID_CONTAINMENT_SEC)
+    print(replayer.report(elapsed, behind, len(events)))
+    raids = sum(1 for s in bot.RAID_STATE.values() if s["contain_until"])
+    print(f"  raid incidents: {raids}")
+    return 1 if sum(replayer.errors.values()) else 0
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("path", help="GATEWAY_RECORD_PATH で記録したファイル（.jsonl.gz）")
+    parser.add_argument("--speed", default="max", help="再生速度の倍率（1, 10 など）または max")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="モックRESTの1回あたりの遅延（ミリ秒）")
+    parser.add_argument("--time-scale", type=float, default=None, help="bot.py 内の asyncio.sleep に掛ける倍率")
+    parser.add_argument("--bot-user-id", type=int, default=999, help="記録時のBot自身のユーザーID（自分のリアクションを除外するため）")
+    parser.add_argument("--raid-containment-sec", type=float, default=None,
+                        help="レイド封じ込めの秒数（既定は RAID_CONTAINMENT_SEC / speed、max のときは 0.5）")
+    parser.add_argument("--verbose", action="store_true", help="bot.py のログを表示する")
+    sys.exit(asyncio.run(main(parser.parse_args())))
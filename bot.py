@@ -2,21 +2,35 @@ import os
 import random
 import requests
 import threading
+import aiohttp
+from aiohttp import web
 import discord
-from bs4 import BeautifulSoup
-from flask import Flask, request
+from bs4 import BeautifulSoup, SoupStrainer
 from discord.ext import commands, tasks
-from datetime import time as dtime, timedelta, timezone
+from datetime import datetime, time as dtime, timedelta, timezone
 from discord import option
 import google.generativeai as genai
 import tweepy
 import asyncio
 import time
 import re
+import json
+import gzip
+import hashlib
+import functools
+import contextvars
+import heapq
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+import sqlite3
+import socket
+import signal
+import multiprocessing
 
 import sys, logging
 
-from collections import deque
+from collections import OrderedDict, deque
+from multidict import CIMultiDict
 
 # --- Stdout immediate flush & logging setup ---
 try:
@@ -40,11 +54,25 @@ intents = discord.Intents.default()
 intents.message_content = True
 intents.members = True
 intents.reactions = True
-bot = discord.Bot(intents=intents)
+
+# --- シャーディング（既定は無効） ---
+# SHARD_COUNT: 空なら通常の discord.Bot。"auto" で Discord 推奨のシャード数、数値で固定数の AutoShardedBot。
+# SHARD_IDS  : このプロセスが受け持つシャード番号（例 "0,1"）。プロセスを分ける場合に数値の SHARD_COUNT と併用。
+#              状態DBはプロセスごとに分かれる（STATE_DB_PATH 未指定時は state-shard-0-1.db のような名前）。
+SHARD_COUNT = os.getenv("SHARD_COUNT", "").strip()
+SHARD_IDS = [int(x) for x in os.getenv("SHARD_IDS", "").split(",") if x.strip()]
+if SHARD_COUNT:
+    bot = discord.AutoShardedBot(
+        intents=intents,
+        shard_count=None if SHARD_COUNT == "auto" else int(SHARD_COUNT),
+        shard_ids=SHARD_IDS or None,
+    )
+else:
+    bot = discord.Bot(intents=intents)
 TOKEN = os.getenv("TOKEN")
 
-# --- Flaskアプリ ---
-app = Flask(__name__)
+# --- HTTPエンドポイントの登録先（aiohttp。サーバーは Bot と同じイベントループで動かす） ---
+routes = web.RouteTableDef()
 
 # --- Gemini 設定 ---
 GEMINI_API_KEY = os.getenv("GEMINI_API_KEY")
@@ -60,6 +88,136 @@ client = tweepy.Client(
     access_token_secret=os.getenv("ACCESS_TOKEN_SECRET")
 )
 
+# --- X のレート制限トラッカー（実際のAPI応答ヘッダから受動的に記録） ---
+# tweepy のセッションにレスポンスフックを付け、x-rate-limit-* をエンドポイントごとに保持する。
+# /ratelimit はここから返すだけで外部通信はしない。create_tweet 前の残数チェックにも使う。
+X_RATE_LIMIT_RESERVE = int(os.getenv("X_RATE_LIMIT_RESERVE", "0"))   # 残りがこの数以下なら投稿を見送る
+X_RATE_LIMITS: dict[str, dict] = {}   # "POST /2/tweets" -> {"limit", "remaining", "reset", "status", "updated_at"}
+_x_rate_lock = threading.Lock()
+_X_ID_SEGMENT = re.compile(r"/\d{3,}(?=/|$)")   # ツイートID/ユーザーID（/2 のバージョン表記は残す）
+
+def _x_endpoint_key(method: str, url: str) -> str:
+    path = url.split("://", 1)[-1]
+    path = "/" + path.split("/", 1)[1] if "/" in path else "/"
+    path = path.split("?", 1)[0]
+    return f"{method.upper()} {_X_ID_SEGMENT.sub('/:id', path)}"
+
+def _record_x_rate_limit(response, *args, **kwargs):
+    limit = response.headers.get("x-rate-limit-limit")
+    remaining = response.headers.get("x-rate-limit-remaining")
+    reset = response.headers.get("x-rate-limit-reset")
+    if limit is None and remaining is None and reset is None:
+        return response
+    key = _x_endpoint_key(response.request.method, response.request.url)
+    try:
+        entry = {
+            "limit": int(limit) if limit is not None else None,
+            "remaining": int(remaining) if remaining is not None else None,
+            "reset": int(reset) if reset is not None else None,
+            "status": response.status_code,
+            "updated_at": time.time(),
+        }
+    except ValueError:
+        return response
+    with _x_rate_lock:
+        X_RATE_LIMITS[key] = entry
+        snapshot = dict(X_RATE_LIMITS)
+    if WEBHOOK_QUEUE is not None:
+        # HTTP 分離モードでは /ratelimit を受けるワーカーが別プロセスなので SQLite 経由で渡す
+        try:
+            WEBHOOK_QUEUE.put_value("x_rate_limits", snapshot)
+        except Exception as e:
+            print(f"[RATE] レート情報の共有に失敗: {e}", flush=True)
+    return response
+
+client.session.hooks["response"].append(_record_x_rate_limit)
+
+def _x_rate_gate(endpoint: str):
+    """直近の記録で残数が尽きていてリセット前なら例外（429 を受ける前に見送る）"""
+    with _x_rate_lock:
+        entry = X_RATE_LIMITS.get(endpoint)
+    if not entry or entry["remaining"] is None or entry["reset"] is None:
+        return
+    if entry["remaining"] <= X_RATE_LIMIT_RESERVE and time.time() < entry["reset"]:
+        raise RuntimeError(
+            f"X rate limit for {endpoint}: remaining={entry['remaining']} "
+            f"(resets at {entry['reset']} / あと{int(entry['reset'] - time.time())}s)"
+        )
+
+# --- 共通HTTPクライアント（スクレイピング等の外部取得用） ---
+# イベントループを止めないよう、外部サイトへのGETはすべてこの aiohttp セッション経由で行う。
+# セッションは1つを使い回し（keep-alive / 接続プール）、ホストごとの同時接続数を制限する。
+HTTP_TIMEOUT_SEC     = float(os.getenv("HTTP_TIMEOUT_SEC", "15"))    # 1リクエストの総タイムアウト
+HTTP_RETRIES         = int(os.getenv("HTTP_RETRIES", "3"))           # 失敗時の再試行回数
+HTTP_BACKOFF_SEC     = float(os.getenv("HTTP_BACKOFF_SEC", "1.0"))   # 再試行の初期待機（指数的に増加）
+HTTP_LIMIT_PER_HOST  = int(os.getenv("HTTP_LIMIT_PER_HOST", "4"))    # ホストごとの同時接続上限
+HTTP_USER_AGENT      = "nemunemuBot/1.0 (+render)"
+_HTTP_RETRY_STATUSES = {429, 500, 502, 503, 504}
+
+_http_session: aiohttp.ClientSession | None = None
+_http_session_loop: asyncio.AbstractEventLoop | None = None
+
+async def _get_http_session() -> aiohttp.ClientSession:
+    """共有セッションを返す（未作成・クローズ済み・別ループの場合は作り直す）"""
+    global _http_session, _http_session_loop
+    loop = asyncio.get_running_loop()
+    if _http_session is None or _http_session.closed or _http_session_loop is not loop:
+        connector = aiohttp.TCPConnector(
+            limit=HTTP_LIMIT_PER_HOST * 4,
+            limit_per_host=HTTP_LIMIT_PER_HOST,
+            ttl_dns_cache=300,
+            keepalive_timeout=30,
+        )
+        _http_session = aiohttp.ClientSession(
+            connector=connector,
+            timeout=aiohttp.ClientTimeout(total=HTTP_TIMEOUT_SEC),
+            headers={"User-Agent": HTTP_USER_AGENT},
+        )
+        _http_session_loop = loop
+    return _http_session
+
+async def close_http_session():
+    """シャットダウン時に共有セッションを閉じる（"Unclosed client session" 警告を出さないため）"""
+    global _http_session, _http_session_loop
+    if _http_session is not None and not _http_session.closed and _http_session_loop is asyncio.get_running_loop():
+        await _http_session.close()
+    _http_session = _http_session_loop = None
+
+async def http_get(url: str, headers: dict | None = None) -> tuple[int, CIMultiDict, bytes]:
+    """
+    共有セッションでGETし (status, headers, body) を返す。
+    接続エラー/タイムアウト/429・5xx は指数バックオフ（Retry-Afterがあれば優先）で再試行する。
+    再試行しきった場合は最後の例外を送出、またはそのステータスの結果を返す。
+    """
+    session = await _get_http_session()
+    backoff = HTTP_BACKOFF_SEC
+    for attempt in range(HTTP_RETRIES + 1):
+        last_try = attempt >= HTTP_RETRIES
+        started = time.perf_counter()
+        try:
+            async with session.get(url, headers=headers) as res:
+                body = await res.read()
+                _trace_span(f"GET {url}", started, str(res.status))
+                if res.status in _HTTP_RETRY_STATUSES and not last_try:
+                    retry_after = res.headers.get("Retry-After")
+                    try:
+                        wait = float(retry_after) if retry_after is not None else backoff
+                    except ValueError:
+                        wait = backoff
+                    print(f"[HTTP] {res.status} {url} → {wait:.1f}s 後に再試行 ({attempt + 1}/{HTTP_RETRIES})", flush=True)
+                    await asyncio.sleep(wait)
+                    backoff *= 2
+                    continue
+                return res.status, res.headers.copy(), body
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            _trace_span(f"GET {url}", started, type(e).__name__)
+            if last_try:
+                raise
+            print(f"[HTTP] {type(e).__name__} {url} → {backoff:.1f}s 後に再試行 ({attempt + 1}/{HTTP_RETRIES})", flush=True)
+            await asyncio.sleep(backoff + random.uniform(0, backoff / 2))
+            backoff *= 2
+    raise RuntimeError("unreachable")
+
 # --- 環境変数系 ---
 HASHTAGS = """
 #モンハンワイルズ
@@ -70,6 +228,9 @@ HASHTAGS = """
 #モンハンワイルズ募集
 """
 
+# --- ローカル保存先（スナップショット等） ---
+BOT_DATA_DIR = os.getenv("BOT_DATA_DIR", "data")
+
 # リアクション対象メッセージを記録する辞書
 guide_messages = {}  # {user_id: message_id}
 
@@ -133,9 +294,304 @@ EMOJI_JOIN  = "✋"   # 参加
 EMOJI_LEAVE = "↩️"   # 参加取り消し
 EMOJI_CLOSE = "⛔"   # 募集停止（作成者 or 管理者のみ）
 
-# 注意喚起の過剰送信防止用（(message_id, user_id, code) -> last_ts）
-WARN_COOLDOWNS: dict[tuple[int, int, str], float] = {}
+# /201_メンバー分け の申告武器と、直近の編成履歴（同じ顔ぶれを避けるため）
+DECLARED_WEAPONS: dict[int, str] = {}                 # {user_id: 武器名}
+PARTY_HISTORY: dict[int, list[list[list[int]]]] = {}  # {guild_id: [回ごとの [パーティごとの [user_id, ...]]]}（古い順）
+
+# --- 状態の永続化（SQLite / WAL + 書き込み遅延バッチ） ---
+# RECRUITS / guide_messages / TEMP_VCS / THREAD_TO_VC / VC_PASSCODES / DECLARED_WEAPONS / PARTY_HISTORY はメモリ上の辞書が正。
+# 変更箇所では _persist(ns, key) で「変更あり」の印を付けるだけにして、
+# STATE_FLUSH_SEC ごとに変更分をまとめて1トランザクションで書き出す（ハンドラはディスクを待たない）。
+# クラッシュ時に失うのは最大 STATE_FLUSH_SEC 秒分の更新のみ。
+# ただし DB ファイル自体が消える環境（Render で永続ディスクなしの再デプロイ）では全部失うので、
+# BOT_DATA_DIR（または STATE_DB_PATH）は永続ディスク上に置くこと（起動手順メモ参照）。
+_STATE_DB_NAME  = f"state-shard-{'-'.join(map(str, SHARD_IDS))}.db" if SHARD_IDS else "state.db"
+STATE_DB_PATH   = os.getenv("STATE_DB_PATH", os.path.join(BOT_DATA_DIR, _STATE_DB_NAME))
+STATE_FLUSH_SEC = float(os.getenv("STATE_FLUSH_SEC", "2"))
+RECRUIT_RETENTION_DAYS = float(os.getenv("RECRUIT_RETENTION_DAYS", "7"))   # 日次クリーンアップで募集情報を破棄するまでの日数
+
+def _encode_recruit(d: dict) -> dict:
+    return {**d, "participants": sorted(d["participants"])}
+
+def _decode_recruit(d: dict) -> dict:
+    d["participants"] = set(d.get("participants", []))
+    return d
+
+def _encode_temp_vc(d: dict) -> dict:
+    return {**d, "created_at": d["created_at"].isoformat() if d.get("created_at") else None}
+
+def _decode_temp_vc(d: dict) -> dict:
+    if d.get("created_at"):
+        d["created_at"] = datetime.fromisoformat(d["created_at"])
+    return d
+
+class StateStore:
+    """名前空間ごとの辞書を SQLite の state テーブルに (ns, key, JSON) で保存する"""
+
+    def __init__(self, path: str):
+        self.path = path
+        self._conn: sqlite3.Connection | None = None
+        self._lock = threading.Lock()
+        # ns -> (辞書, キー型, エンコーダ, デコーダ)
+        self._tables: dict[str, tuple[dict, type, callable, callable]] = {}
+        self._dirty: dict[str, set] = {}
+        self._cleared: set[str] = set()
+
+    def register(self, ns: str, target: dict, key_type: type = int, encode=None, decode=None):
+        self._tables[ns] = (target, key_type, encode or (lambda v: v), decode or (lambda v: v))
+        self._dirty[ns] = set()
+
+    def _connect(self) -> sqlite3.Connection:
+        if self._conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            if not os.path.exists(self.path):
+                # 初回起動以外でこれが出たら、再デプロイでデータが消えている（BOT_DATA_DIR が永続ディスクでない）
+                print(f"[STATE] {self.path} が無いため新規作成します（永続ディスク上にあるか確認してください）", flush=True)
+            conn = sqlite3.connect(self.path, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS state ("
+                " ns TEXT NOT NULL, key TEXT NOT NULL, value TEXT NOT NULL,"
+                " PRIMARY KEY (ns, key))"
+            )
+            self._conn = conn
+        return self._conn
+
+    def load(self):
+        """起動時に登録済みの辞書へ復元する（同期・on_ready より前に呼ぶ）"""
+        with self._lock:
+            rows = self._connect().execute("SELECT ns, key, value FROM state").fetchall()
+        counts = {ns: 0 for ns in self._tables}
+        for ns, key, value in rows:
+            if ns not in self._tables:
+                continue
+            target, key_type, _, decode = self._tables[ns]
+            try:
+                target[key_type(key)] = decode(json.loads(value))
+                counts[ns] += 1
+            except Exception as e:
+                print(f"[STATE] 復元をスキップ ns={ns} key={key}: {e}", flush=True)
+        print(f"[STATE] 復元完了: {counts}", flush=True)
+
+    def mark(self, ns: str, key):
+        self._dirty[ns].add(key)
+
+    def mark_cleared(self, ns: str):
+        self._cleared.add(ns)
+        self._dirty[ns].clear()
+
+    def pending(self) -> int:
+        return len(self._cleared) + sum(len(k) for k in self._dirty.values())
+
+    def _collect(self) -> tuple[list[str], list[tuple], list[tuple]]:
+        """イベントループ上で変更分を確定させる（以後の変更は次回に回る）"""
+        cleared, self._cleared = list(self._cleared), set()
+        upserts, deletes = [], []
+        for ns, keys in self._dirty.items():
+            if not keys:
+                continue
+            target, _, encode, _ = self._tables[ns]
+            for key in keys:
+                if key in target:
+                    upserts.append((ns, str(key), json.dumps(encode(target[key]), ensure_ascii=False)))
+                else:
+                    deletes.append((ns, str(key)))
+            keys.clear()
+        return cleared, upserts, deletes
+
+    def _write(self, cleared: list[str], upserts: list[tuple], deletes: list[tuple]):
+        with self._lock:
+            conn = self._connect()
+            with conn:
+                for ns in cleared:
+                    conn.execute("DELETE FROM state WHERE ns = ?", (ns,))
+                if deletes:
+                    conn.executemany("DELETE FROM state WHERE ns = ? AND key = ?", deletes)
+                if upserts:
+                    conn.executemany(
+                        "INSERT INTO state (ns, key, value) VALUES (?, ?, ?) "
+                        "ON CONFLICT(ns, key) DO UPDATE SET value = excluded.value",
+                        upserts,
+                    )
+
+    async def flush(self):
+        if not self.pending():
+            return
+        batch = self._collect()
+        await asyncio.to_thread(self._write, *batch)
+
+    def flush_sync(self):
+        if self.pending():
+            self._write(*self._collect())
+
+STATE = StateStore(STATE_DB_PATH)
+
+def _persist(ns: str, key):
+    """辞書の変更を永続化キューに載せる（値は書き出し時点の最新を使う）"""
+    STATE.mark(ns, key)
+
+STATE.register("recruits", RECRUITS, int, _encode_recruit, _decode_recruit)
+STATE.register("guide_messages", guide_messages, int)
+STATE.register("temp_vcs", TEMP_VCS, int, _encode_temp_vc, _decode_temp_vc)
+STATE.register("thread_to_vc", THREAD_TO_VC, int)
+STATE.register("vc_passcodes", VC_PASSCODES, str)
+STATE.register("declared_weapons", DECLARED_WEAPONS, int)
+STATE.register("party_history", PARTY_HISTORY, int)
+
+# --- ゲートウェイイベントの記録（任意・ローカル再現用） ---
+# GATEWAY_RECORD_PATH を設定したときだけ、ハンドラが扱う生のゲートウェイイベントを gzip 圧縮の JSONL に追記する。
+# 1行目に状態のスナップショット、以後 {"ts", "t", "d"} を1行ずつ（IDはそのまま）。再生は bench/replay_gateway.py。
+# 募集・案内メッセージの登録（_route_add）も ROUTE_ADD として残し、再生時に同じメッセージIDへ紐付けられるようにする。
+GATEWAY_RECORD_PATH = os.getenv("GATEWAY_RECORD_PATH", "")
+GATEWAY_RECORD_FLUSH_SEC = 5.0
+GATEWAY_RECORD_EVENTS = (
+    "GUILD_MEMBER_ADD", "GUILD_MEMBER_REMOVE",
+    "MESSAGE_REACTION_ADD", "MESSAGE_REACTION_REMOVE",
+    "THREAD_UPDATE", "VOICE_STATE_UPDATE",
+)
+
+class GatewayRecorder:
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        # 追記のたびに gzip のメンバーが増えるが、gzip.open でそのまま続けて読める
+        self._file = gzip.open(path, "at", encoding="utf-8")
+        self._last_flush = time.monotonic()
+        self.written = 0
+
+    def write(self, t: str, d):
+        self._file.write(json.dumps({"ts": time.time(), "t": t, "d": d}, ensure_ascii=False, default=str) + "\n")
+        self.written += 1
+        now = time.monotonic()
+        if now - self._last_flush >= GATEWAY_RECORD_FLUSH_SEC:
+            self._file.flush()
+            self._last_flush = now
+
+    def snapshot(self):
+        """記録開始時点の永続化対象の辞書を丸ごと残す（再生側はこれを復元してから流す）"""
+        self.write("BOT_SNAPSHOT", {
+            ns: {str(k): encode(v) for k, v in target.items()}
+            for ns, (target, _, encode, _) in STATE._tables.items()
+        })
+
+    def install(self, state):
+        """ConnectionState のパーサを包み、対象イベントを解析前の生データのまま記録する"""
+        for event in GATEWAY_RECORD_EVENTS:
+            parse = state.parsers.get(event)
+            if parse is None:
+                continue
+
+            def recorded(data, _event=event, _parse=parse):
+                try:
+                    self.write(_event, data)
+                except Exception as e:
+                    print(f"[RECORD] 書き込みに失敗: {e}", flush=True)
+                return _parse(data)
+            state.parsers[event] = recorded
+
+    def route_added(self, message_id: int, kind: str):
+        recruit = RECRUITS.get(message_id)
+        self.write("ROUTE_ADD", {
+            "message_id": message_id,
+            "kind": kind,
+            "recruit": _encode_recruit(recruit) if recruit is not None else None,
+        })
+
+    def close(self):
+        self._file.close()
+
+GATEWAY_RECORDER: GatewayRecorder | None = None
+
+def _start_gateway_recorder():
+    global GATEWAY_RECORDER
+    if not GATEWAY_RECORD_PATH:
+        return
+    GATEWAY_RECORDER = GatewayRecorder(GATEWAY_RECORD_PATH)
+    GATEWAY_RECORDER.snapshot()
+    GATEWAY_RECORDER.install(bot._connection)
+    print(f"[RECORD] ゲートウェイイベントを記録します → {GATEWAY_RECORD_PATH}", flush=True)
+
+# --- リアクションの振り分け索引（message_id -> 処理種別） ---
+# サーバー内のほぼ全てのリアクションは対象外なので、索引に無いものはギルド解決前に即 return する。
+# 案内/募集/パーティ用メッセージの作成・削除箇所で必ず _route_add / _route_remove を呼ぶこと。
+ROUTE_ONBOARDING = "onboarding"
+ROUTE_RECRUIT    = "recruit"
+ROUTE_PARTY      = "party"
+REACTION_ROUTES: dict[int, str] = {}
+
+def _route_add(message_id: int, kind: str):
+    REACTION_ROUTES[message_id] = kind
+    if GATEWAY_RECORDER is not None:
+        GATEWAY_RECORDER.route_added(message_id, kind)
+
+def _route_remove(message_id: int):
+    REACTION_ROUTES.pop(message_id, None)
+
+def _rebuild_reaction_routes():
+    """永続化から復元した guide_messages / RECRUITS から索引を作り直す"""
+    REACTION_ROUTES.clear()
+    for message_id in guide_messages.values():
+        REACTION_ROUTES[message_id] = ROUTE_ONBOARDING
+    for message_id in RECRUITS:
+        REACTION_ROUTES[message_id] = ROUTE_RECRUIT
+
+@tasks.loop(seconds=STATE_FLUSH_SEC)
+async def flush_state():
+    try:
+        await STATE.flush()
+    except Exception as e:
+        print(f"[STATE] 書き出しに失敗（次回再試行）: {e}", flush=True)
+
+class CooldownStore:
+    """
+    「ttl 秒以内に同じキーが来たら抑止」を判定する期限付きストア。
+    辞書を2世代（現在/1つ前）で持ち、ttl ごとに古い世代を丸ごと捨てる。
+    挿入・判定は O(1)、保持数は直近 2*ttl 秒の件数で頭打ちになる。
+    """
+
+    def __init__(self, ttl: float):
+        self.ttl = ttl
+        self._current: dict = {}
+        self._previous: dict = {}
+        self._rotated_at = time.monotonic()
+        self.evictions = 0
+
+    def _rotate(self, now: float):
+        elapsed = now - self._rotated_at
+        if elapsed < self.ttl:
+            return
+        if elapsed >= self.ttl * 2:
+            # 両世代とも期限切れ
+            self.evictions += len(self._previous) + len(self._current)
+            self._previous = {}
+        else:
+            self.evictions += len(self._previous)
+            self._previous = self._current
+        self._current = {}
+        self._rotated_at = now
+
+    def hit(self, key) -> bool:
+        """クールダウン中なら True。そうでなければ今回を記録して False"""
+        now = time.monotonic()
+        self._rotate(now)
+        ts = self._current.get(key)
+        if ts is None:
+            ts = self._previous.get(key)
+        if ts is not None and now - ts < self.ttl:
+            return True
+        self._current[key] = now
+        return False
+
+    def __len__(self) -> int:
+        return len(self._current) + len(self._previous)
+
+    def stats(self) -> dict:
+        return {"entries": len(self), "evictions": self.evictions}
+
+# 注意喚起の過剰送信防止用（(message_id, user_id, code) -> 最終送信時刻、WARN_COOLDOWN_SEC で自動失効）
 WARN_COOLDOWN_SEC = 60.0
+WARN_COOLDOWNS = CooldownStore(WARN_COOLDOWN_SEC)
 
 # ロールID（設定済みかもだけど確認）
 ROLE_FIRST_TIMER = 1390261208782868590  # 初めてロール
@@ -152,9 +608,10 @@ ROLE_GENERAL = 1390261772853837907      # 一般ロール ←適切なIDに変
 TEMP_VC_SENTINEL_ROLE_ID = int(os.getenv("TEMP_VC_SENTINEL_ROLE_ID", "0"))
 
 def _get_sentinel_role(guild: discord.Guild) -> discord.Role | None:
-    if not TEMP_VC_SENTINEL_ROLE_ID:
+    role_id = guild_config(guild.id)["temp_vc_sentinel_role_id"]
+    if not role_id:
         return None
-    return guild.get_role(TEMP_VC_SENTINEL_ROLE_ID)
+    return guild.get_role(role_id)
 
 WELCOME_MESSAGE_EXTRA = os.getenv("WELCOME_MESSAGE_EXTRA", "")
 VC_CATEGORY_ID = int(os.getenv("VC_CATEGORY_ID", "0"))
@@ -165,113 +622,1159 @@ GUIDE_CHANNEL_ID = 1389290096498315364
 # --- 管理者ログチャンネルID ---
 ADMIN_LOG_CHANNEL_ID = int(os.getenv("ADMIN_LOG_CHANNEL_ID", "0"))
 
+# --- サーバー別設定 ---
+# 上のロール/チャンネルIDは既定値。サーバーごとに違うIDは環境変数 GUILD_CONFIG（JSON文字列）
+# または GUILD_CONFIG_PATH のJSONファイルで {"<guild_id>": {"guide_channel_id": ..., ...}} の形で上書きする。
+# 起動時に1回だけ読み、既定値と合成済みの辞書にしておく（イベントごとの解決は guild_config() の辞書引き1回）。
+GUILD_CONFIG_PATH = os.getenv("GUILD_CONFIG_PATH", os.path.join(BOT_DATA_DIR, "guild_config.json"))
+DEFAULT_GUILD_CONFIG = {
+    "role_first_timer": ROLE_FIRST_TIMER,
+    "role_general": ROLE_GENERAL,
+    "guide_channel_id": GUIDE_CHANNEL_ID,
+    "intro_channel_id": INTRO_CHANNEL_ID,
+    "representative_council_channel_id": REPRESENTATIVE_COUNCIL_CHANNEL_ID,
+    "admin_log_channel_id": ADMIN_LOG_CHANNEL_ID,
+    "temp_vc_sentinel_role_id": TEMP_VC_SENTINEL_ROLE_ID,
+}
+
+def _load_guild_config() -> dict[int, dict]:
+    raw = os.getenv("GUILD_CONFIG", "")
+    if not raw and os.path.exists(GUILD_CONFIG_PATH):
+        with open(GUILD_CONFIG_PATH, encoding="utf-8") as f:
+            raw = f.read()
+    if not raw.strip():
+        return {}
+    configs = {}
+    for guild_id, overrides in json.loads(raw).items():
+        cfg = dict(DEFAULT_GUILD_CONFIG)
+        for key, value in overrides.items():
+            if key not in DEFAULT_GUILD_CONFIG:
+                print(f"[CONFIG] 不明な設定キーを無視します guild={guild_id} key={key}", flush=True)
+                continue
+            cfg[key] = int(value)
+        configs[int(guild_id)] = cfg
+    print(f"[CONFIG] サーバー別設定を読み込みました: {len(configs)} 件", flush=True)
+    return configs
+
+GUILD_CONFIG: dict[int, dict] = _load_guild_config()
+
+def guild_config(guild_id: int) -> dict:
+    return GUILD_CONFIG.get(guild_id, DEFAULT_GUILD_CONFIG)
+
 # --- RaidGuard 設定（環境変数で調整可） ---
 JOIN_WINDOW_SEC  = int(os.getenv("JOIN_WINDOW_SEC", "60"))   # 何秒以内を集計（例：60s）
 JOIN_THRESHOLD   = int(os.getenv("JOIN_THRESHOLD", "3"))     # 閾値（例：1分に3人）
 MAX_TIMEOUT      = timedelta(days=28)                        # Discordの上限（実質最大）
 
-# --- 直近参加状況を保持（メモリ） ---
-JOIN_TIMES: deque[discord.utils.datetime] = deque()
-RECENT_JOIN_IDS: deque[int] = deque()
+RAID_CONTAINMENT_SEC     = int(os.getenv("RAID_CONTAINMENT_SEC", "600"))   # 発動後、新規参加者を自動タイムアウトし続ける秒数
+RAID_TIMEOUT_CONCURRENCY = int(os.getenv("RAID_TIMEOUT_CONCURRENCY", "5")) # タイムアウトの同時実行数
+RAID_REPORT_INTERVAL_SEC = float(os.getenv("RAID_REPORT_INTERVAL_SEC", "10")) # 管理ログ報告の更新間隔
+
+# --- 直近参加状況を保持（メモリ・ギルドごと） ---
+# { guild_id: {"joins": deque[(monotonic_ts, member_id)], "contain_until": float, "incident": dict | None} }
+RAID_STATE: dict[int, dict] = {}
+
+# --- 計測（/metrics 用の軽量なカウンタ・ヒストグラム） ---
+# 常時有効にしても負担にならないよう、記録は辞書の加算のみ。Prometheus テキスト形式への整形は /metrics 取得時だけ行う。
+METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+EVENT_LOOP_LAG_INTERVAL_SEC = float(os.getenv("EVENT_LOOP_LAG_INTERVAL_SEC", "0.5"))
+
+class _Histogram:
+    __slots__ = ("counts", "total", "count", "errors")
+
+    def __init__(self):
+        self.counts = [0] * (len(METRICS_BUCKETS) + 1)   # 最後は +Inf
+        self.total = 0.0
+        self.count = 0
+        self.errors = 0
+
+    def observe(self, value: float):
+        i = 0
+        for bound in METRICS_BUCKETS:
+            if value <= bound:
+                break
+            i += 1
+        self.counts[i] += 1
+        self.total += value
+        self.count += 1
+
+HANDLER_METRICS: dict[str, _Histogram] = {}    # イベントハンドラ名 -> 所要時間
+COMMAND_METRICS: dict[str, _Histogram] = {}    # スラッシュコマンド（関数名） -> 所要時間
+REST_CALLS: dict[tuple[str, str, str], int] = {}   # (method, route, status) -> 回数
+EVENT_LOOP_LAG = _Histogram()
+EVENT_LOOP_LAG_LAST = {"seconds": 0.0}
+_event_loop_lag_task: asyncio.Task | None = None
+
+# --- トレース（ハンドラ単位のスパン記録と遅い呼び出しのログ） ---
+# サンプリングされた呼び出しだけスパン（REST/外部HTTPの待ち）を集める。所要時間と例外は全件で見る。
+TRACE_SAMPLE_RATE = float(os.getenv("TRACE_SAMPLE_RATE", "0.1"))
+TRACE_SLOW_MS = float(os.getenv("TRACE_SLOW_MS", "1000"))
+TRACE_MAX_SPANS = 64
+
+class _Trace:
+    __slots__ = ("trace_id", "name", "started", "spans", "dropped", "open")
+
+    def __init__(self, name: str, started: float):
+        self.trace_id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.started = started
+        self.spans: list[tuple[str, float, float, str]] = []   # (名前, 開始オフセット, 所要, 結果)
+        self.dropped = 0
+        self.open = True
+
+_current_trace: contextvars.ContextVar[_Trace | None] = contextvars.ContextVar("_current_trace", default=None)
+
+def _trace_span(name: str, started: float, result: str):
+    """実行中のトレースがあればスパンを1件追加する（ハンドラ終了後に残ったタスクからの追加は捨てる）"""
+    trace = _current_trace.get()
+    if trace is None or not trace.open:
+        return
+    if len(trace.spans) >= TRACE_MAX_SPANS:
+        trace.dropped += 1
+        return
+    now = time.perf_counter()
+    trace.spans.append((name, started - trace.started, now - started, result))
+
+def _format_spans(trace: _Trace) -> str:
+    if not trace.spans:
+        return "  (スパンなし)"
+    lines = [
+        f"  +{offset * 1000:7.1f}ms {dur * 1000:7.1f}ms {name} [{result}]"
+        for name, offset, dur, result in trace.spans
+    ]
+    if trace.dropped:
+        lines.append(f"  … 他 {trace.dropped} 件省略")
+    return "\n".join(lines)
+
+def _instrumented(kind: str):
+    """
+    @bot.event / @bot.slash_command の内側に付けて、呼び出し回数・所要時間・例外数を記録する。
+    TRACE_SAMPLE_RATE の割合でトレースを開始し、TRACE_SLOW_MS を超えた呼び出しや例外はトレースID付きでログに出す。
+    """
+    registry = HANDLER_METRICS if kind == "event" else COMMAND_METRICS
+
+    def decorator(func):
+        name = func.__name__
+        hist = registry.setdefault(name, _Histogram())
+
+        @functools.wraps(func)
+        async def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            trace = None
+            token = None
+            failed = False
+            if TRACE_SAMPLE_RATE > 0 and random.random() < TRACE_SAMPLE_RATE:
+                trace = _Trace(name, started)
+                token = _current_trace.set(trace)
+            try:
+                return await func(*args, **kwargs)
+            except Exception as e:
+                hist.errors += 1
+                failed = True
+                trace_id = trace.trace_id if trace else uuid.uuid4().hex[:16]
+                print(f"[TRACE] {kind}:{name} 例外 trace={trace_id} {(time.perf_counter() - started) * 1000:.0f}ms {type(e).__name__}: {e}", flush=True)
+                if trace:
+                    print(_format_spans(trace), flush=True)
+                raise
+            finally:
+                elapsed = time.perf_counter() - started
+                hist.observe(elapsed)
+                if token is not None:
+                    trace.open = False
+                    _current_trace.reset(token)
+                if not failed and elapsed * 1000 >= TRACE_SLOW_MS:
+                    if trace:
+                        print(f"[TRACE] {kind}:{name} 遅延 {elapsed * 1000:.0f}ms trace={trace.trace_id}\n{_format_spans(trace)}", flush=True)
+                    else:
+                        print(f"[TRACE] {kind}:{name} 遅延 {elapsed * 1000:.0f}ms (未サンプリング)", flush=True)
+        return wrapper
+    return decorator
+
+def _install_rest_metrics():
+    """py-cord の HTTPClient.request を包み、Discord REST 呼び出しをルート・ステータス別に数える"""
+    original = bot.http.request
+
+    @functools.wraps(original)
+    async def request(route, **kwargs):
+        started = time.perf_counter()
+        status = "2xx"
+        try:
+            return await original(route, **kwargs)
+        except discord.HTTPException as e:
+            status = str(e.status)
+            raise
+        except Exception:
+            status = "error"
+            raise
+        finally:
+            key = (route.method, route.path, status)
+            REST_CALLS[key] = REST_CALLS.get(key, 0) + 1
+            _trace_span(f"discord {route.method} {route.path}", started, status)
+
+    bot.http.request = request
 
-# --- Flaskエンドポイント ---
-@app.route("/")
-def home():
-    return "👋 統合Bot is alive!", 200
+_install_rest_metrics()
 
-@app.route("/webhook", methods=["POST"])
-def webhook_handler():
-    if not PROMPT:
-        return "❌ PROMPT_TEXT の環境変数が設定されていません。", 500
+async def _measure_event_loop_lag():
+    """一定間隔で眠り、予定より遅れて起きた分をイベントループの遅延として記録する"""
+    while True:
+        expected = time.perf_counter() + EVENT_LOOP_LAG_INTERVAL_SEC
+        await asyncio.sleep(EVENT_LOOP_LAG_INTERVAL_SEC)
+        lag = max(0.0, time.perf_counter() - expected)
+        EVENT_LOOP_LAG_LAST["seconds"] = lag
+        EVENT_LOOP_LAG.observe(lag)
+
+def _prom_escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+def _prom_histogram(lines: list[str], name: str, label: str, hists: dict[str, _Histogram]):
+    lines.append(f"# TYPE {name} histogram")
+    for key, h in list(hists.items()):
+        lbl = f'{label}="{_prom_escape(key)}"' if label else ""
+        sep = "," if lbl else ""
+        cumulative = 0
+        for bound, c in zip(METRICS_BUCKETS + (float("inf"),), h.counts):
+            cumulative += c
+            le = "+Inf" if bound == float("inf") else repr(bound)
+            lines.append(f'{name}_bucket{{{lbl}{sep}le="{le}"}} {cumulative}')
+        suffix = f"{{{lbl}}}" if lbl else ""
+        lines.append(f"{name}_sum{suffix} {h.total}")
+        lines.append(f"{name}_count{suffix} {h.count}")
+
+def render_metrics() -> str:
+    lines: list[str] = []
+    _prom_histogram(lines, "nemunemu_handler_duration_seconds", "handler", HANDLER_METRICS)
+    lines.append("# TYPE nemunemu_handler_errors_total counter")
+    for name, h in list(HANDLER_METRICS.items()):
+        lines.append(f'nemunemu_handler_errors_total{{handler="{name}"}} {h.errors}')
+    _prom_histogram(lines, "nemunemu_command_duration_seconds", "command", COMMAND_METRICS)
+    lines.append("# TYPE nemunemu_command_errors_total counter")
+    for name, h in list(COMMAND_METRICS.items()):
+        lines.append(f'nemunemu_command_errors_total{{command="{name}"}} {h.errors}')
+
+    lines.append("# TYPE nemunemu_discord_rest_requests_total counter")
+    for (method, route, status), n in sorted(list(REST_CALLS.items())):
+        lines.append(
+            f'nemunemu_discord_rest_requests_total{{method="{method}",route="{_prom_escape(route)}",status="{status}"}} {n}'
+        )
+
+    caches = {
+        "message_handle": (MESSAGE_CACHE_STATS["hits"], MESSAGE_CACHE_STATS["misses"]),
+        "event_page": (EVENT_CACHE_STATS["hits"], EVENT_CACHE_STATS["misses"]),
+    }
+    lines.append("# TYPE nemunemu_cache_requests_total counter")
+    for cache, (hits, misses) in caches.items():
+        lines.append(f'nemunemu_cache_requests_total{{cache="{cache}",result="hit"}} {hits}')
+        lines.append(f'nemunemu_cache_requests_total{{cache="{cache}",result="miss"}} {misses}')
+    lines.append("# TYPE nemunemu_cache_hit_ratio gauge")
+    for cache, (hits, misses) in caches.items():
+        lines.append(f'nemunemu_cache_hit_ratio{{cache="{cache}"}} {hits / (hits + misses) if hits + misses else 0.0}')
+    lines.append("# TYPE nemunemu_event_page_revalidations_total counter")
+    lines.append(f"nemunemu_event_page_revalidations_total {EVENT_CACHE_STATS['not_modified']}")
+
+    lines.append("# TYPE nemunemu_recruit_embed_edits_total counter")
+    for result, n in RECRUIT_EDIT_STATS.items():
+        lines.append(f'nemunemu_recruit_embed_edits_total{{result="{result}"}} {n}')
+
+    lines.append("# TYPE nemunemu_state_entries gauge")
+    sizes = {
+        "recruits": len(RECRUITS),
+        "guide_messages": len(guide_messages),
+        "temp_vcs": len(TEMP_VCS),
+        "warn_cooldowns": len(WARN_COOLDOWNS),
+        "message_cache": len(_MESSAGE_CACHE),
+        "reaction_routes": len(REACTION_ROUTES),
+    }
+    for store, n in sizes.items():
+        lines.append(f'nemunemu_state_entries{{store="{store}"}} {n}')
+    lines.append("# TYPE nemunemu_warn_cooldown_evictions_total counter")
+    lines.append(f"nemunemu_warn_cooldown_evictions_total {WARN_COOLDOWNS.evictions}")
+    lines.append("# TYPE nemunemu_state_pending_writes gauge")
+    lines.append(f"nemunemu_state_pending_writes {STATE.pending()}")
+
+    outbound = OUTBOUND.stats()
+    lines.append("# TYPE nemunemu_outbound_queue_depth gauge")
+    for prio, n in outbound["queue_depth"].items():
+        lines.append(f'nemunemu_outbound_queue_depth{{priority="{prio}"}} {n}')
+    lines.append("# TYPE nemunemu_outbound_actions_total counter")
+    for prio, st in outbound["by_priority"].items():
+        for result in ("done", "failed", "dropped", "merged"):
+            lines.append(f'nemunemu_outbound_actions_total{{priority="{prio}",result="{result}"}} {st[result]}')
+    lines.append("# TYPE nemunemu_outbound_wait_seconds_max gauge")
+    for prio, st in outbound["by_priority"].items():
+        lines.append(f'nemunemu_outbound_wait_seconds_max{{priority="{prio}"}} {st["wait_max"]}')
+
+    latency = bot.latency
+    lines.append("# TYPE nemunemu_gateway_latency_seconds gauge")
+    lines.append(f"nemunemu_gateway_latency_seconds {latency if latency == latency and latency != float('inf') else -1}")
+    lines.append("# TYPE nemunemu_event_loop_lag_seconds gauge")
+    lines.append(f"nemunemu_event_loop_lag_seconds {EVENT_LOOP_LAG_LAST['seconds']}")
+    _prom_histogram(lines, "nemunemu_event_loop_lag_observed_seconds", "", {"": EVENT_LOOP_LAG})
+    return "\n".join(lines) + "\n"
+
+# --- HTTPエンドポイント ---
+@routes.get("/")
+async def home(request: web.Request):
+    return web.Response(text="👋 統合Bot is alive!")
+
+# --- /webhook のジョブ化（受付だけして即 202、生成と投稿はワーカーで実行） ---
+# Idempotency-Key ヘッダ（または JSON の idempotency_key）が同じ再送は、新しいジョブを作らず既存ジョブを返す。
+WEBHOOK_WORKERS       = int(os.getenv("WEBHOOK_WORKERS", "2"))          # 生成+投稿を同時に行う数
+WEBHOOK_JOB_RETENTION = int(os.getenv("WEBHOOK_JOB_RETENTION", "500"))  # 保持するジョブ履歴の件数
+WEBHOOK_JOBS: OrderedDict[str, dict] = OrderedDict()   # job_id -> ジョブ情報
+WEBHOOK_IDEMPOTENCY: dict[str, str] = {}               # idempotency_key -> job_id
+_webhook_lock = threading.Lock()
+_webhook_pool = ThreadPoolExecutor(max_workers=WEBHOOK_WORKERS, thread_name_prefix="webhook")
+
+# --- 実行モード（HTTP 側とゲートウェイ側を別プロセスに分ける場合） ---
+# RUN_MODE=single  : 既定。1プロセス・1イベントループで HTTP と Discord ゲートウェイを動かす
+# RUN_MODE=gateway : Discord ゲートウェイだけ。HTTP 側からの問い合わせ（/metrics）に Unix ソケットで答える
+# RUN_MODE=http    : HTTP だけ（Discord には接続しない）。HTTP_WORKERS 個のワーカープロセスで同じポートを受け、
+#                    /webhook のジョブは SQLite のキュー（IPC_DB_PATH）で共有する。生成と投稿は親プロセスが1か所で行う
+RUN_MODE         = os.getenv("RUN_MODE", "single").strip()
+RUN_MODES        = ("single", "gateway", "http")
+if RUN_MODE not in RUN_MODES:
+    # 打ち間違いのまま起動すると HTTP サーバーが立たず、ヘルスチェックだけが理由不明で落ちるため起動時に止める
+    raise SystemExit(f"unknown RUN_MODE={RUN_MODE!r}（{' / '.join(RUN_MODES)} のいずれかを指定してください）")
+HTTP_WORKERS     = int(os.getenv("HTTP_WORKERS", "2"))
+GATEWAY_IPC_PATH = os.getenv("GATEWAY_IPC_PATH", os.path.join(BOT_DATA_DIR, "gateway.sock"))
+IPC_DB_PATH      = os.getenv("IPC_DB_PATH", os.path.join(BOT_DATA_DIR, "ipc.db"))
+WEBHOOK_QUEUE_POLL_SEC = 0.5
+
+class WebhookJobQueue:
+    """
+    /webhook のジョブを SQLite に置き、複数の HTTP ワーカープロセスから受付・参照できるようにする。
+    ジョブの取り出し（claim）は BEGIN IMMEDIATE で直列化するので、同じジョブが二重に実行されることはない。
+    X のレート情報など、実行側プロセスだけが持つ値の共有にも使う（kv テーブル）。
+    """
+    _COLUMNS = ("id", "status", "created_at", "started_at", "finished_at", "tweet", "error", "idempotency_key")
+
+    def __init__(self, path: str):
+        self.path = path
+        self._ready = False
+
+    def _connect(self) -> sqlite3.Connection:
+        if not self._ready:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+        if not self._ready:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS webhook_jobs (id TEXT PRIMARY KEY, status TEXT, created_at REAL, "
+                "started_at REAL, finished_at REAL, tweet TEXT, error TEXT, idempotency_key TEXT)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS webhook_jobs_status ON webhook_jobs (status, created_at)")
+            conn.execute("CREATE INDEX IF NOT EXISTS webhook_jobs_key ON webhook_jobs (idempotency_key)")
+            conn.execute("CREATE TABLE IF NOT EXISTS kv (key TEXT PRIMARY KEY, value TEXT)")
+            self._ready = True
+        return conn
+
+    def _row(self, row) -> dict:
+        job = dict(zip(self._COLUMNS, row))
+        return {k: v for k, v in job.items() if v is not None}
+
+    def submit(self, idempotency_key: str | None) -> tuple[dict, bool]:
+        """ジョブを登録して (ジョブ, 新規作成したか) を返す（同じキーの再送は既存ジョブ）"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if idempotency_key:
+                row = conn.execute(
+                    f"SELECT {', '.join(self._COLUMNS)} FROM webhook_jobs WHERE idempotency_key = ? "
+                    "ORDER BY created_at DESC LIMIT 1", (idempotency_key,)
+                ).fetchone()
+                if row and row[1] != "failed":
+                    conn.execute("COMMIT")
+                    return self._row(row), False
+            job = {"id": uuid.uuid4().hex, "status": "queued", "created_at": time.time(), "idempotency_key": idempotency_key}
+            conn.execute(
+                "INSERT INTO webhook_jobs (id, status, created_at, idempotency_key) VALUES (?, ?, ?, ?)",
+                (job["id"], job["status"], job["created_at"], idempotency_key),
+            )
+            # 古いジョブ履歴を捨てる（実行中のものは残す）
+            conn.execute(
+                "DELETE FROM webhook_jobs WHERE status IN ('succeeded', 'failed', 'unknown') AND id NOT IN "
+                "(SELECT id FROM webhook_jobs ORDER BY created_at DESC LIMIT ?)", (WEBHOOK_JOB_RETENTION,)
+            )
+            conn.execute("COMMIT")
+            return {k: v for k, v in job.items() if v is not None}, True
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+
+    def get(self, job_id: str) -> dict | None:
+        conn = self._connect()
+        try:
+            row = conn.execute(f"SELECT {', '.join(self._COLUMNS)} FROM webhook_jobs WHERE id = ?", (job_id,)).fetchone()
+        finally:
+            conn.close()
+        return self._row(row) if row else None
+
+    def claim(self) -> str | None:
+        """最も古い queued のジョブを running にして、その id を返す"""
+        conn = self._connect()
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute("SELECT id FROM webhook_jobs WHERE status = 'queued' ORDER BY created_at LIMIT 1").fetchone()
+            if row:
+                conn.execute("UPDATE webhook_jobs SET status = 'running', started_at = ? WHERE id = ?", (time.time(), row[0]))
+            conn.execute("COMMIT")
+        except Exception:
+            conn.execute("ROLLBACK")
+            raise
+        finally:
+            conn.close()
+        return row[0] if row else None
+
+    def finish(self, job_id: str, update: dict):
+        conn = self._connect()
+        try:
+            conn.execute(
+                "UPDATE webhook_jobs SET status = ?, tweet = ?, error = ?, finished_at = ? WHERE id = ?",
+                (update["status"], update.get("tweet"), update.get("error"), time.time(), job_id),
+            )
+        finally:
+            conn.close()
+
+    def abandon_running(self) -> int:
+        """
+        実行側プロセスの再起動時、途中で止まった running のジョブを unknown にする。
+        投稿済みかどうか分からない（create_tweet の後で落ちた可能性がある）ため、やり直すと二重投稿になりうる。
+        unknown は failed と違い、同じ Idempotency-Key の再送でも新しいジョブを作らない。
+        """
+        conn = self._connect()
+        try:
+            return conn.execute(
+                "UPDATE webhook_jobs SET status = 'unknown', error = ?, finished_at = ? WHERE status = 'running'",
+                ("interrupted: 実行中にプロセスが停止したため、投稿されたかどうか不明です", time.time()),
+            ).rowcount
+        finally:
+            conn.close()
+
+    def put_value(self, key: str, value):
+        conn = self._connect()
+        try:
+            conn.execute("INSERT OR REPLACE INTO kv (key, value) VALUES (?, ?)", (key, json.dumps(value)))
+        finally:
+            conn.close()
+
+    def get_value(self, key: str, default=None):
+        conn = self._connect()
+        try:
+            row = conn.execute("SELECT value FROM kv WHERE key = ?", (key,)).fetchone()
+        finally:
+            conn.close()
+        return json.loads(row[0]) if row else default
+
+WEBHOOK_QUEUE: WebhookJobQueue | None = WebhookJobQueue(IPC_DB_PATH) if RUN_MODE == "http" else None
+
+# --- ツイート下書きプール（Gemini 生成を先回りして貯めておく） ---
+# 裏のスレッドが PROMPT から下書きを生成して TWEET_POOL_SIZE 件まで貯め、/webhook では取り出して投稿するだけにする。
+# 既存の下書き・直近の投稿と SimHash のハミング距離が TWEET_DUP_MAX_DISTANCE 以下の下書きは捨てる。
+# プールはファイルに保存し、再起動しても生成済み（課金済み）の下書きを使い回す。
+TWEET_POOL_SIZE        = int(os.getenv("TWEET_POOL_SIZE", "3"))
+TWEET_POOL_REFILL_SEC  = float(os.getenv("TWEET_POOL_REFILL_SEC", "60"))      # 生成と生成の最小間隔
+TWEET_POOL_MAX_AGE_SEC = float(os.getenv("TWEET_POOL_MAX_AGE_SEC", "21600"))  # これより古い下書きは使わない
+TWEET_DUP_MAX_DISTANCE = int(os.getenv("TWEET_DUP_MAX_DISTANCE", "12"))       # 64bit SimHash の距離（無関係な文同士は平均32前後）
+TWEET_POOL_PATH        = os.path.join(BOT_DATA_DIR, "tweet_pool.json")
+
+_tweet_pool: list[dict] = []                     # [{"text": str, "hash": int, "created_at": float}]
+_recent_tweet_hashes: deque[int] = deque(maxlen=50)
+_tweet_pool_lock = threading.Lock()
+_tweet_pool_wakeup = threading.Event()
+_tweet_pool_thread: threading.Thread | None = None
+
+def _simhash(text: str) -> int:
+    """文字3-gramの64bit SimHash（言い回しが少し違うだけの文は距離が小さくなる）"""
+    s = re.sub(r"\s+", "", text)
+    votes = [0] * 64
+    for i in range(max(1, len(s) - 2)):
+        h = int.from_bytes(hashlib.blake2b(s[i:i + 3].encode(), digest_size=8).digest(), "big")
+        for bit in range(64):
+            votes[bit] += 1 if (h >> bit) & 1 else -1
+    return sum(1 << bit for bit in range(64) if votes[bit] > 0)
+
+def _is_near_duplicate(h: int) -> bool:
+    known = [d["hash"] for d in _tweet_pool] + list(_recent_tweet_hashes)
+    return any((h ^ other).bit_count() <= TWEET_DUP_MAX_DISTANCE for other in known)
+
+def _save_tweet_pool():
+    """呼び出し側で _tweet_pool_lock を保持していること"""
+    try:
+        os.makedirs(os.path.dirname(TWEET_POOL_PATH) or ".", exist_ok=True)
+        tmp = TWEET_POOL_PATH + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump({"drafts": _tweet_pool, "recent_hashes": list(_recent_tweet_hashes)}, f, ensure_ascii=False)
+        os.replace(tmp, TWEET_POOL_PATH)
+    except Exception as e:
+        print(f"[TWEET_POOL] 保存に失敗: {e}", flush=True)
+
+def _load_tweet_pool():
+    try:
+        with open(TWEET_POOL_PATH, encoding="utf-8") as f:
+            data = json.load(f)
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        print(f"[TWEET_POOL] 読込に失敗: {e}", flush=True)
+        return
+    with _tweet_pool_lock:
+        _tweet_pool[:] = data.get("drafts", [])
+        _recent_tweet_hashes.extend(data.get("recent_hashes", []))
+    print(f"[TWEET_POOL] 下書き {len(_tweet_pool)} 件を復元", flush=True)
+
+def _prune_tweet_pool():
+    """期限切れの下書きを捨てる（呼び出し側でロック保持）"""
+    cutoff = time.time() - TWEET_POOL_MAX_AGE_SEC
+    fresh = [d for d in _tweet_pool if d["created_at"] >= cutoff]
+    if len(fresh) != len(_tweet_pool):
+        _tweet_pool[:] = fresh
+        _save_tweet_pool()
+
+def _generate_draft_text() -> str:
+    response = model.generate_content(PROMPT)
+    return response.text.strip()
+
+def _take_draft() -> dict | None:
+    with _tweet_pool_lock:
+        _prune_tweet_pool()
+        if not _tweet_pool:
+            return None
+        draft = _tweet_pool.pop(0)
+        _save_tweet_pool()
+    _tweet_pool_wakeup.set()
+    return draft
+
+def _return_draft(draft: dict):
+    """投稿に失敗した下書き（その場で生成したものも含む）をプールの先頭に戻し、次の投稿で使う"""
+    with _tweet_pool_lock:
+        _tweet_pool.insert(0, draft)
+        _save_tweet_pool()
+
+def _tweet_pool_filler():
+    backoff = TWEET_POOL_REFILL_SEC
+    while True:
+        with _tweet_pool_lock:
+            _prune_tweet_pool()
+            need = len(_tweet_pool) < TWEET_POOL_SIZE
+        if not need:
+            # 取り出されるか、期限切れチェックの時刻まで待つ
+            _tweet_pool_wakeup.wait(timeout=min(TWEET_POOL_MAX_AGE_SEC, 600))
+            _tweet_pool_wakeup.clear()
+            continue
+        try:
+            text = _generate_draft_text()
+            h = _simhash(text)
+            with _tweet_pool_lock:
+                if _is_near_duplicate(h):
+                    print("[TWEET_POOL] 既存と似た下書きのため破棄", flush=True)
+                else:
+                    _tweet_pool.append({"text": text, "hash": h, "created_at": time.time()})
+                    _save_tweet_pool()
+            backoff = TWEET_POOL_REFILL_SEC
+        except Exception as e:
+            backoff = min(backoff * 2, 3600)
+            print(f"[TWEET_POOL] 生成に失敗（{backoff:.0f}s 後に再試行）: {e}", flush=True)
+        time.sleep(backoff)
+
+def _start_tweet_pool():
+    global _tweet_pool_thread
+    if not PROMPT or TWEET_POOL_SIZE <= 0 or _tweet_pool_thread is not None:
+        return
+    _load_tweet_pool()
+    _tweet_pool_thread = threading.Thread(target=_tweet_pool_filler, name="tweet-pool", daemon=True)
+    _tweet_pool_thread.start()
+
+def _generate_and_post_tweet() -> str:
+    # レート上限に達していれば、下書きを消費する前に見送る
+    _x_rate_gate("POST /2/tweets")
+    # プールに下書きがあればそれを使い、なければその場で生成する
+    draft = _take_draft()
+    if draft is None:
+        text = _generate_draft_text()
+        draft = {"text": text, "hash": _simhash(text), "created_at": time.time()}
+    tweet = f"{draft['text']}\n{HASHTAGS.strip()}"
     try:
-        response = model.generate_content(PROMPT)
-        result = response.text.strip()
-        tweet = f"{result}\n{HASHTAGS.strip()}"
         client.create_tweet(text=tweet)
-        print(f"✅ 投稿成功:\n{tweet}")
-        return f"✅ ツイート完了:\n{tweet}"
+    except Exception:
+        _return_draft(draft)
+        raise
+    with _tweet_pool_lock:
+        _recent_tweet_hashes.append(draft["hash"])
+        _save_tweet_pool()
+    return tweet
+
+def _run_webhook_job(job_id: str):
+    with _webhook_lock:
+        job = WEBHOOK_JOBS[job_id]
+        job["status"] = "running"
+        job["started_at"] = time.time()
+    try:
+        tweet = _generate_and_post_tweet()
+        print(f"✅ 投稿成功 (job={job_id}):\n{tweet}")
+        update = {"status": "succeeded", "tweet": tweet}
     except Exception as e:
-        print(f"❌ 投稿失敗: {e}")
-        return str(e), 500
+        print(f"❌ 投稿失敗 (job={job_id}): {e}")
+        update = {"status": "failed", "error": str(e)}
+    with _webhook_lock:
+        job.update(update, finished_at=time.time())
+
+def _webhook_job_view(job: dict) -> dict:
+    return {k: v for k, v in job.items() if k != "idempotency_key"}
+
+def _submit_webhook_job(idempotency_key: str | None) -> tuple[dict, bool]:
+    """ジョブを登録して (ジョブ, 新規作成したか) を返す"""
+    with _webhook_lock:
+        if idempotency_key:
+            # 失敗したジョブと同じキーでの再送は、やり直しとして新しいジョブを作る
+            existing = WEBHOOK_JOBS.get(WEBHOOK_IDEMPOTENCY.get(idempotency_key, ""))
+            if existing and existing["status"] != "failed":
+                return existing, False
+        job_id = uuid.uuid4().hex
+        job = {"id": job_id, "status": "queued", "created_at": time.time(), "idempotency_key": idempotency_key}
+        WEBHOOK_JOBS[job_id] = job
+        if idempotency_key:
+            WEBHOOK_IDEMPOTENCY[idempotency_key] = job_id
+        # 古いジョブ履歴を捨てる（実行中のものは残す）
+        while len(WEBHOOK_JOBS) > WEBHOOK_JOB_RETENTION:
+            old_id, old = next(iter(WEBHOOK_JOBS.items()))
+            if old["status"] in ("queued", "running"):
+                break
+            WEBHOOK_JOBS.popitem(last=False)
+            if old.get("idempotency_key"):
+                WEBHOOK_IDEMPOTENCY.pop(old["idempotency_key"], None)
+    _webhook_pool.submit(_run_webhook_job, job_id)
+    return job, True
+
+@routes.post("/webhook")
+async def webhook_handler(request: web.Request):
+    if not PROMPT:
+        return web.Response(text="❌ PROMPT_TEXT の環境変数が設定されていません。", status=500)
+    try:
+        body = await request.json()
+    except Exception:
+        body = None
+    if not isinstance(body, dict):
+        body = {}
+    key = request.headers.get("Idempotency-Key") or body.get("idempotency_key")
+    if WEBHOOK_QUEUE is not None:
+        job, created = await asyncio.to_thread(WEBHOOK_QUEUE.submit, key)
+        view = _webhook_job_view(job)
+    else:
+        job, created = _submit_webhook_job(key)
+        with _webhook_lock:
+            view = _webhook_job_view(job)
+    view["status_url"] = f"/webhook/jobs/{job['id']}"
+    return web.json_response(view, status=202 if created else 200)
+
+@routes.get("/webhook/jobs/{job_id}")
+async def webhook_job_status(request: web.Request):
+    job_id = request.match_info["job_id"]
+    if WEBHOOK_QUEUE is not None:
+        job = await asyncio.to_thread(WEBHOOK_QUEUE.get, job_id)
+    else:
+        with _webhook_lock:
+            job = WEBHOOK_JOBS.get(job_id)
+            job = dict(job) if job else None
+    if not job:
+        return web.json_response({"error": "job not found"}, status=404)
+    return web.json_response(_webhook_job_view(job))
+
+@routes.get("/ratelimit")
+async def check_rate_limit(request: web.Request):
+    # 実際の API 応答で記録した値を返す（ここでは外部通信しない）
+    if WEBHOOK_QUEUE is not None:
+        entries = sorted((await asyncio.to_thread(WEBHOOK_QUEUE.get_value, "x_rate_limits", {})).items())
+    else:
+        with _x_rate_lock:
+            entries = sorted(X_RATE_LIMITS.items())
+    if not entries:
+        return web.Response(text="ℹ️ まだ X API の応答がないため、レート情報は未記録です。")
+    lines = ["✅ Rate Limit Info:"]
+    for endpoint, e in entries:
+        lines.append(
+            f"[{endpoint}]\n"
+            f"- limit: {e['limit'] if e['limit'] is not None else 'N/A'}\n"
+            f"- remaining: {e['remaining'] if e['remaining'] is not None else 'N/A'}\n"
+            f"- reset: {e['reset'] if e['reset'] is not None else 'N/A'} (Unix time)\n"
+            f"- observed: {int(time.time() - e['updated_at'])}s ago (HTTP {e['status']})"
+        )
+    return web.Response(text="\n".join(lines) + "\n")
 
-@app.route("/ratelimit", methods=["GET"])
-def check_rate_limit():
+@routes.get("/metrics")
+async def metrics(request: web.Request):
+    if RUN_MODE == "http":
+        # 計測値はゲートウェイ側のプロセスにある
+        try:
+            body = await _gateway_ipc_request("metrics")
+        except Exception as e:
+            return web.Response(text=f"gateway unavailable: {e}\n", status=503)
+    else:
+        body = render_metrics()
+    return web.Response(body=body.encode(), headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"})
+
+# --- プロセス間通信（RUN_MODE=gateway / http） ---
+# ゲートウェイ側は Unix ソケットで1行JSONの問い合わせに答える。HTTP 側は1リクエストごとに接続して聞く。
+GATEWAY_IPC_TIMEOUT_SEC = 2.0
+_gateway_ipc_server = None
+
+def _gateway_ipc_answer(op: str) -> dict:
+    if op == "metrics":
+        return {"ok": True, "body": render_metrics()}
+    if op == "health":
+        return {"ok": True, "body": {"ready": bot.is_ready(), "latency": bot.latency, "guilds": len(bot.guilds)}}
+    return {"ok": False, "error": f"unknown op: {op}"}
+
+async def _serve_gateway_ipc(reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
     try:
-        url = "https://api.twitter.com/2/tweets?ids=20"
-        auth = client.session.auth
-        res = requests.get(url, auth=auth)
-        limit = res.headers.get("x-rate-limit-limit", "N/A")
-        remaining = res.headers.get("x-rate-limit-remaining", "N/A")
-        reset = res.headers.get("x-rate-limit-reset", "N/A")
-        return f"""✅ Rate Limit Info:
-- limit: {limit}
-- remaining: {remaining}
-- reset: {reset} (Unix time)
-""", 200
+        line = await asyncio.wait_for(reader.readline(), timeout=GATEWAY_IPC_TIMEOUT_SEC)
+        try:
+            reply = _gateway_ipc_answer(json.loads(line).get("op", ""))
+        except Exception as e:
+            reply = {"ok": False, "error": str(e)}
+        writer.write(json.dumps(reply, ensure_ascii=False, default=str).encode() + b"\n")
+        await writer.drain()
     except Exception as e:
-        return f"❌ レート情報の取得に失敗しました: {e}", 500
+        print(f"[IPC] 問い合わせの処理に失敗: {e}", flush=True)
+    finally:
+        writer.close()
+
+async def _start_gateway_ipc():
+    global _gateway_ipc_server
+    if _gateway_ipc_server is not None:
+        return
+    os.makedirs(os.path.dirname(GATEWAY_IPC_PATH) or ".", exist_ok=True)
+    if os.path.exists(GATEWAY_IPC_PATH):
+        os.unlink(GATEWAY_IPC_PATH)   # 前回のプロセスが残したソケットファイル
+    _gateway_ipc_server = await asyncio.start_unix_server(_serve_gateway_ipc, path=GATEWAY_IPC_PATH)
+    print(f"[IPC] ゲートウェイの問い合わせ口を開きました → {GATEWAY_IPC_PATH}", flush=True)
+
+async def _gateway_ipc_request(op: str):
+    """HTTP 側（別プロセス）からゲートウェイに問い合わせる"""
+    async def ask() -> bytes:
+        reader, writer = await asyncio.open_unix_connection(GATEWAY_IPC_PATH, limit=2**24)
+        try:
+            writer.write(json.dumps({"op": op}).encode() + b"\n")
+            await writer.drain()
+            return await reader.readline()
+        finally:
+            writer.close()
+    reply = json.loads(await asyncio.wait_for(ask(), timeout=GATEWAY_IPC_TIMEOUT_SEC))
+    if not reply.get("ok"):
+        raise RuntimeError(reply.get("error", "ipc error"))
+    return reply["body"]
+
+# --- HTTP 分離モード（RUN_MODE=http）の親プロセス ---
+# 親がポートを bind して HTTP_WORKERS 個のワーカーを fork し、同じソケットで accept させる（プリフォーク）。
+# 各ワーカーは自前のイベントループで aiohttp を動かす。
+# 親自身は /webhook のジョブを SQLite キューから取り出して生成・投稿する（下書きプールの持ち主も親だけ）。
+def _http_worker(listener: socket.socket):
+    web.run_app(_build_web_app(), sock=listener, print=None, access_log=None)
+
+def _webhook_queue_consumer():
+    while True:
+        try:
+            job_id = WEBHOOK_QUEUE.claim()
+        except Exception as e:
+            print(f"[WEBHOOK] キューの取り出しに失敗: {e}", flush=True)
+            job_id = None
+        if job_id is None:
+            time.sleep(WEBHOOK_QUEUE_POLL_SEC)
+            continue
+        try:
+            tweet = _generate_and_post_tweet()
+            print(f"✅ 投稿成功 (job={job_id}):\n{tweet}")
+            update = {"status": "succeeded", "tweet": tweet}
+        except Exception as e:
+            print(f"❌ 投稿失敗 (job={job_id}): {e}")
+            update = {"status": "failed", "error": str(e)}
+        WEBHOOK_QUEUE.finish(job_id, update)
 
-# --- Flaskをバックグラウンドで実行 ---
-def run_flask():
+def run_http_mode():
+    port = int(os.environ.get("PORT", 10000))
+    listener = socket.create_server(("0.0.0.0", port), backlog=128)
+    ctx = multiprocessing.get_context("fork")   # スレッドを起こす前に fork する
+
+    def spawn():
+        p = ctx.Process(target=_http_worker, args=(listener,), daemon=True)
+        p.start()
+        return p
+
+    workers = [spawn() for _ in range(max(1, HTTP_WORKERS))]
+    print(f"[HTTP] ポート {port} で {len(workers)} ワーカーを起動しました", flush=True)
+    abandoned = WEBHOOK_QUEUE.abandon_running()
+    if abandoned:
+        print(f"[WEBHOOK] 実行中に中断されたジョブ {abandoned} 件を unknown にしました（二重投稿を避けるため再実行しません）", flush=True)
+    _start_tweet_pool()
+    for i in range(WEBHOOK_WORKERS):
+        threading.Thread(target=_webhook_queue_consumer, name=f"webhook-consumer-{i}", daemon=True).start()
+    # 落ちたワーカーは作り直す
+    while True:
+        time.sleep(1.0)
+        for i, p in enumerate(workers):
+            if not p.is_alive():
+                print(f"[HTTP] ワーカー pid={p.pid} が終了（code={p.exitcode}）→ 再起動", flush=True)
+                workers[i] = spawn()
+
+# --- HTTPサーバー（Bot と同じイベントループで動かす：スレッドもリクエストごとのスレッドも使わない） ---
+_web_runner: web.AppRunner | None = None
+
+def _build_web_app() -> web.Application:
+    web_app = web.Application()
+    web_app.add_routes(routes)
+    return web_app
+
+async def start_http_server():
+    """PORT で HTTP を受け付け始める（ログイン前に呼んで、Render のヘルスチェック `/` にすぐ応答できるようにする）"""
+    global _web_runner
+    if _web_runner is not None:
+        return
     port = int(os.environ.get("PORT", 10000))
-    app.run(host="0.0.0.0", port=port)
+    _web_runner = web.AppRunner(_build_web_app(), access_log=None)
+    await _web_runner.setup()
+    await web.TCPSite(_web_runner, "0.0.0.0", port, backlog=128).start()
+    print(f"[HTTP] ポート {port} で受付を開始しました", flush=True)
+
+# --- Discord への送信アクションの優先度付きキュー ---
+# タイムアウト/ロール付与/埋め込み編集/一時通知などの REST 呼び出しを1か所に集め、
+# 優先度（モデレーション > オンボーディングのロール > 募集編集 > 装飾的な通知）の順に処理する。
+# ルート（"channel:<id>" など）ごとにトークンバケットで送信間隔を見積もり、空いているルートから先に流す。
+# 同じ key の未処理アクションは最新のものに差し替え、max_age を過ぎた低優先度アクションは捨てる。
+# 1件の処理中は worker が埋まる（複数回の REST や 429 の待機を含む）ので、モデレーションには専用の worker
+# （OUTBOUND_MODERATION_WORKERS 本）を別に置き、装飾的な通知が詰まってもタイムアウト等が待たされないようにする。
+PRIO_MODERATION = 0
+PRIO_ONBOARDING = 1
+PRIO_RECRUIT    = 2
+PRIO_COSMETIC   = 3
+_PRIO_NAMES = {PRIO_MODERATION: "moderation", PRIO_ONBOARDING: "onboarding", PRIO_RECRUIT: "recruit", PRIO_COSMETIC: "cosmetic"}
+
+OUTBOUND_WORKERS            = int(os.getenv("OUTBOUND_WORKERS", "4"))              # 全優先度を処理する worker
+OUTBOUND_MODERATION_WORKERS = int(os.getenv("OUTBOUND_MODERATION_WORKERS", "2"))   # モデレーション専用の worker
+# ルート種別ごとの (回数, 秒)。Discord の公開されている目安に合わせた控えめな既定値。
+# None のルートは先回りして絞らず、Discord が返すバケット（X-RateLimit-* ヘッダー）に従う discord.py 側の制御に任せる。
+# メンバー編集・ロール付与の上限は公開されておらず（メンバー/ロールの組ごとのバケットになる）、
+# ギルド単位に自前の上限を掛けると、実際には通る参加ラッシュのロール付与まで待たせてしまうため。
+# チャンネルも同様で、最も厳しい目安（5回/5秒）で先に絞ると、参加ラッシュ時に案内メッセージが
+# 1分以上待たされる。実際の上限は Discord が返すバケットに従い、ルートは優先度・key のまとめ・統計にだけ使う。
+OUTBOUND_ROUTE_LIMITS = {
+    "channel":  None,       # メッセージ送信/編集/削除・スレッド作成（チャンネル単位）
+    "dm":       (5, 5.0),   # DM 送信（ユーザー単位）
+    "reaction": (1, 0.25),  # リアクション追加（チャンネル単位。メッセージ送信とは別のバケット）
+    "guild":    None,       # メンバー編集・ロール付与・タイムアウト（ギルド単位）
+}
+OUTBOUND_GLOBAL_LIMIT = (50, 1.0)   # Bot 全体のグローバル上限（全ルート合計で 50回/秒）
+
+class _RouteBucket:
+    """ルートごとの簡易トークンバケット"""
+
+    def __init__(self, capacity: int, per: float):
+        self.capacity = capacity
+        self.rate = capacity / per
+        self.tokens = float(capacity)
+        self.updated = time.monotonic()
+
+    def wait_time(self, now: float) -> float:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+    def take(self):
+        self.tokens -= 1
+
+class OutboundScheduler:
+    def __init__(self, workers: int, moderation_workers: int = 0):
+        self.workers = workers
+        self.moderation_workers = moderation_workers
+        self._heap: list = []                 # (priority, seq, action)
+        self._pending_keys: dict = {}         # key -> action（マージ用）
+        self._buckets: dict[str, _RouteBucket | None] = {}
+        self._global = _RouteBucket(*OUTBOUND_GLOBAL_LIMIT)
+        self._wakeup: asyncio.Event | None = None
+        self._tasks: list[asyncio.Task] = []
+        self._seq = 0
+        self.stats_by_prio = {
+            p: {"submitted": 0, "done": 0, "failed": 0, "dropped": 0, "merged": 0, "wait_sum": 0.0, "wait_max": 0.0}
+            for p in _PRIO_NAMES
+        }
+
+    def _bucket(self, route: str) -> _RouteBucket | None:
+        if route not in self._buckets:
+            limit = OUTBOUND_ROUTE_LIMITS.get(route.split(":", 1)[0], (5, 5.0))
+            self._buckets[route] = _RouteBucket(*limit) if limit else None
+        return self._buckets[route]
+
+    def _ensure_workers(self):
+        if self._wakeup is None or not self._tasks or all(t.done() for t in self._tasks):
+            self._wakeup = asyncio.Event()
+            self._tasks = [asyncio.create_task(self._worker(PRIO_COSMETIC)) for _ in range(self.workers)]
+            self._tasks += [asyncio.create_task(self._worker(PRIO_MODERATION)) for _ in range(self.moderation_workers)]
+
+    def submit(self, priority: int, route: str, factory, *, key=None, max_age: float | None = None) -> asyncio.Future:
+        """
+        factory（引数なしでコルーチンを返す callable）を予約し、結果の Future を返す。
+        key が同じ未処理アクションがあれば factory を差し替えて同じ Future を返す。
+        max_age 秒以上待たされたアクションは実行せずに None で完了する。
+        """
+        self._ensure_workers()
+        stats = self.stats_by_prio[priority]
+        stats["submitted"] += 1
+        if key is not None:
+            pending = self._pending_keys.get(key)
+            if pending is not None:
+                pending["factory"] = factory
+                stats["merged"] += 1
+                return pending["future"]
+        action = {
+            "priority": priority, "route": route, "factory": factory, "key": key,
+            "max_age": max_age, "enqueued": time.monotonic(),
+            "trace": _current_trace.get(),   # 待っているハンドラのトレースにREST呼び出しを載せるため
+            "future": asyncio.get_running_loop().create_future(),
+        }
+        if key is not None:
+            self._pending_keys[key] = action
+        self._seq += 1
+        heapq.heappush(self._heap, (priority, self._seq, action))
+        self._wakeup.set()
+        return action["future"]
+
+    def _pop_ready(self, max_priority: int) -> tuple[dict | None, float]:
+        """
+        優先度が max_priority 以内で、ルートが空いている最優先のアクションを取り出す。
+        無ければ (None, 次に空くまでの秒数)
+        """
+        now = time.monotonic()
+        if self._heap and self._heap[0][0] <= max_priority:
+            global_wait = self._global.wait_time(now)
+            if global_wait > 0:
+                return None, global_wait
+        skipped, min_wait, picked = [], None, None
+        while self._heap and self._heap[0][0] <= max_priority:
+            item = heapq.heappop(self._heap)
+            action = item[2]
+            bucket = self._bucket(action["route"])
+            wait = bucket.wait_time(now) if bucket else 0.0
+            if wait <= 0:
+                picked = action
+                break
+            skipped.append(item)
+            min_wait = wait if min_wait is None else min(min_wait, wait)
+        for item in skipped:
+            heapq.heappush(self._heap, item)
+        return picked, (min_wait if min_wait is not None else 0.0)
+
+    async def _worker(self, max_priority: int):
+        while True:
+            action, wait = self._pop_ready(max_priority)
+            if action is None:
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=wait or None)
+                except asyncio.TimeoutError:
+                    pass
+                continue
+            try:
+                await self._run(action)
+            except asyncio.CancelledError:
+                # worker 自身の停止（シャットダウン）なら抜ける。ジョブ内のキャンセルなら次へ
+                if asyncio.current_task().cancelling():
+                    raise
+            except Exception as e:
+                print(f"[OUTBOUND] worker で想定外の例外: {type(e).__name__}: {e}", flush=True)
+
+    async def _run(self, action: dict):
+        if action["key"] is not None:
+            self._pending_keys.pop(action["key"], None)
+        stats = self.stats_by_prio[action["priority"]]
+        waited = time.monotonic() - action["enqueued"]
+        stats["wait_sum"] += waited
+        stats["wait_max"] = max(stats["wait_max"], waited)
+        future = action["future"]
+        if action["max_age"] is not None and waited > action["max_age"]:
+            stats["dropped"] += 1
+            if not future.done():
+                future.set_result(None)
+            return
+        bucket = self._bucket(action["route"])
+        if bucket:
+            bucket.take()
+        self._global.take()
+        token = _current_trace.set(action["trace"])
+        try:
+            result = await action["factory"]()
+        except BaseException as e:
+            stats["failed"] += 1
+            # CancelledError などで抜けた場合も Future を必ず完了させる（待っている側が固まらないように）
+            if not future.done():
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    # 誰も await しない（投げっぱなし）場合の未回収警告を抑止
+                    future.exception()
+            if not isinstance(e, Exception):
+                raise
+            return
+        finally:
+            _current_trace.reset(token)
+        stats["done"] += 1
+        if not future.done():
+            future.set_result(result)
+
+    def queue_depth(self) -> dict[str, int]:
+        depth = {name: 0 for name in _PRIO_NAMES.values()}
+        for prio, _, _ in self._heap:
+            depth[_PRIO_NAMES[prio]] += 1
+        return depth
+
+    def stats(self) -> dict:
+        out = {}
+        for prio, st in self.stats_by_prio.items():
+            started = st["done"] + st["failed"] + st["dropped"]
+            out[_PRIO_NAMES[prio]] = {
+                **{k: v for k, v in st.items() if k != "wait_sum"},
+                "wait_avg": st["wait_sum"] / started if started else 0.0,
+            }
+        return {"queue_depth": self.queue_depth(), "by_priority": out}
+
+OUTBOUND = OutboundScheduler(OUTBOUND_WORKERS, OUTBOUND_MODERATION_WORKERS)
+
+def _outbound(priority: int, route: str, factory, *, key=None, max_age: float | None = None) -> asyncio.Future:
+    return OUTBOUND.submit(priority, route, factory, key=key, max_age=max_age)
+
+def _outbound_send(priority: int, channel: discord.abc.Messageable, content=None, **kwargs) -> asyncio.Future:
+    """channel.send を送信キュー経由で行う（管理ログ・代表者会議などへの投稿用）"""
+    return _outbound(priority, f"channel:{channel.id}", lambda: channel.send(content, **kwargs))
+
+_NOTICE_BUFFERS: dict[int, list[str]] = {}   # channel_id -> 送信待ちの通知（1通にまとめて送る）
+NOTICE_MESSAGE_LIMIT = 1900
 
-threading.Thread(target=run_flask, daemon=True).start()
+def _outbound_notice(priority: int, channel: discord.abc.Messageable, content: str):
+    """
+    結果を待たない通知（管理ログ・代表者会議向け）を送信キューに積む。
+    同じチャンネルへのメッセージには Discord のレート上限があるため、送信待ちの間に届いた通知は
+    同じ key のアクションにまとめて1通（長ければ数通）で送り、呼び出し元（ロール付与や案内の送信）も待たせない。
+    失敗はログだけ残す。
+    """
+    lines = _NOTICE_BUFFERS.setdefault(channel.id, [])
+    lines.append(content)
+    if len(lines) > 1:
+        return  # 送信待ちのアクションに相乗りする
+
+    async def _flush():
+        pending = _NOTICE_BUFFERS.pop(channel.id, [])
+        chunks, current = [], ""
+        for line in pending:
+            if current and len(current) + 1 + len(line) > NOTICE_MESSAGE_LIMIT:
+                chunks.append(current)
+                current = ""
+            current = f"{current}\n{line}" if current else line
+        if current:
+            chunks.append(current)
+        for chunk in chunks:
+            await channel.send(chunk)
+
+    def _done(future: asyncio.Future):
+        if not future.cancelled() and future.exception() is not None:
+            print(f"[OUTBOUND] 通知の送信に失敗 channel={channel.id}: {future.exception()}", flush=True)
+
+    _outbound(priority, f"channel:{channel.id}", _flush, key=f"notice:{channel.id}").add_done_callback(_done)
 
 # --- Gateway 状態ログ ---
 @bot.event
+@_instrumented("event")
 async def on_connect():
     print("[GATEWAY] on_connect (ソケット接続は確立)", flush=True)
 
 @bot.event
+@_instrumented("event")
 async def on_resumed():
     print("[GATEWAY] on_resumed (セッション再開)", flush=True)
 
 @bot.event
+@_instrumented("event")
 async def on_disconnect():
     print("[GATEWAY] on_disconnect (切断)", flush=True)
 
-def _is_gibberish_english(name: str) -> bool:
+@bot.event
+@_instrumented("event")
+async def on_shard_ready(shard_id: int):
+    # SHARD_COUNT 指定時のみ発火。通常モードでは on_ready だけ
+    guilds = sum(1 for g in bot.guilds if g.shard_id == shard_id)
+    print(f"[GATEWAY] on_shard_ready shard={shard_id} guilds={guilds}", flush=True)
+
+# --- 無意味英字列の判定（文字3-gram言語モデル・2-gram/1-gram で補間） ---
+# assets/gibberish_ngrams.json（tools/build_gibberish_model.py で生成）の対数確率表を使い、
+# 1文字あたりの平均対数尤度が GIBBERISH_THRESHOLD を下回る英字のみの名前を無意味列とみなす。
+GIBBERISH_MODEL_PATH = os.getenv(
+    "GIBBERISH_MODEL_PATH",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "gibberish_ngrams.json"),
+)
+# 既定値は bench/bench_gibberish.py が調整用の行だけで選んだ値（評価用の行で precision=1.000 / recall=0.969）
+GIBBERISH_THRESHOLD = float(os.getenv("GIBBERISH_THRESHOLD", "-3.5"))
+GIBBERISH_MIN_LEN   = int(os.getenv("GIBBERISH_MIN_LEN", "6"))   # これより短い名前は判定しない
+_ALPHA_ONLY = re.compile(r"[a-z]+")
+
+def _load_gibberish_model() -> dict | None:
+    try:
+        with open(GIBBERISH_MODEL_PATH, encoding="utf-8") as f:
+            return json.load(f)
+    except Exception as e:
+        print(f"[GIBBERISH] モデル読込に失敗（判定を無効化）: {e}", flush=True)
+        return None
+
+_GIBBERISH_MODEL = _load_gibberish_model()
+
+def gibberish_score(name: str) -> float | None:
     """
-    英字のみの無意味列をざっくり検知（誤検知を避けるため控えめ）
-    条件:
-      - 英字のみ
-      - 長すぎ（>=16）/ 母音率が極端 / 子音4連 など
+    1文字あたりの平均対数尤度を返す（低いほど無意味列らしい）。
+    英字のみでない・短すぎる・モデル未読込の場合は None（判定対象外）。
     """
     s = (name or "").strip().lower()
-    if not re.fullmatch(r"[a-z]+", s):
-        return False
-    if len(s) >= 16:
-        return True
-    vowels = sum(c in "aeiou" for c in s)
-    ratio = vowels / len(s) if s else 0
-    if ratio < 0.15 or ratio > 0.85:
-        return True
-    if re.search(r"[bcdfghjklmnpqrstvwxyz]{4,}", s):
-        return True
-    # よくある語片は除外（簡易ホワイト）
-    if any(k in s for k in ("hunter","dragon","monster","wild","nemu","maria","leo")):
-        return False
-    return len(s) >= 10
+    model = _GIBBERISH_MODEL
+    if model is None or len(s) < GIBBERISH_MIN_LEN or not _ALPHA_ONLY.fullmatch(s):
+        return None
+    table, back, uni = model["table"], model["back"], model["uni"]
+    padded = model["pad"] * 2 + s + model["end"]
+    total = 0.0
+    for i in range(2, len(padded)):
+        gram = padded[i - 2:i + 1]
+        lp = table.get(gram)
+        if lp is None:
+            lp = back.get(gram[1:])
+            if lp is None:
+                lp = uni[gram[2]]
+        total += lp
+    return total / (len(padded) - 2)
+
+def gibberish_scores(names: list[str]) -> list[float | None]:
+    """名前の一覧をまとめて採点する（監査コマンド等のバッチ用）"""
+    return [gibberish_score(n) for n in names]
+
+def _is_gibberish_english(name: str) -> bool:
+    score = gibberish_score(name)
+    return score is not None and score < GIBBERISH_THRESHOLD
 
 async def _timeout_and_admin_log(member: discord.Member, reason: str):
     """最大28日タイムアウトを1回だけ付与し、ADMIN_LOG_CHANNEL_IDへ通知"""
     until = discord.utils.utcnow() + MAX_TIMEOUT
     # まずタイムアウト適用
     try:
-        await member.edit(communication_disabled_until=until, reason=reason)
+        await _outbound(PRIO_MODERATION, f"guild:{member.guild.id}",
+                        lambda: member.edit(communication_disabled_until=until, reason=reason))
     except Exception as e:
         # 失敗しても管理チャンネルに報告して戻る
-        ch = member.guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+        ch = member.guild.get_channel(guild_config(member.guild.id)["admin_log_channel_id"])
         if ch:
             try:
-                await ch.send(f"⚠️ タイムアウト失敗: {member.mention} / 理由: {reason} / err: {e}")
+                await _outbound_send(PRIO_MODERATION, ch, f"⚠️ タイムアウト失敗: {member.mention} / 理由: {reason} / err: {e}")
             except Exception:
                 pass
         return
 
     # 通知Embed
-    ch = member.guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+    ch = member.guild.get_channel(guild_config(member.guild.id)["admin_log_channel_id"])
     if ch:
         try:
             emb = discord.Embed(
@@ -283,69 +1786,194 @@ async def _timeout_and_admin_log(member: discord.Member, reason: str):
             emb.add_field(name="Reason", value=reason, inline=False)
             emb.add_field(name="Username", value=f"`{member}`", inline=True)
             emb.add_field(name="Account", value=f"<t:{int(member.created_at.replace(tzinfo=timezone.utc).timestamp())}:R>", inline=True)
-            await ch.send(embed=emb)
+            await _outbound_send(PRIO_MODERATION, ch, embed=emb)
         except Exception:
             pass
 
+# --- レイド検知（ギルドごとのスライディングウィンドウ + 封じ込めモード） ---
+# JOIN_WINDOW_SEC 秒以内に JOIN_THRESHOLD 人の参加で発動し、窓内の参加者をまとめてタイムアウトする。
+# 発動後 RAID_CONTAINMENT_SEC 秒間は、新規参加者も即タイムアウト（オンボーディングなし）。
+# タイムアウトはシャードごとに RAID_TIMEOUT_CONCURRENCY 並列で実行（429 の待機は py-cord のバケット管理に任せる。
+# あるシャードのレイドが他のシャードのギルドのタイムアウトを待たせない）し、
+# 管理ログには1件の報告メッセージをインシデント終了まで更新し続ける。
+_raid_timeout_sems: dict[int, asyncio.Semaphore] = {}   # shard_id -> 同時実行数の枠（シャードごと）
+_raid_tasks: set[asyncio.Task] = set()   # 実行中のタイムアウト/報告タスク（GC で消えないよう参照を持つ）
+
+def _spawn_raid_task(coro) -> asyncio.Task:
+    task = asyncio.create_task(coro)
+    _raid_tasks.add(task)
+    task.add_done_callback(_raid_tasks.discard)
+    return task
+
+def _spawn_raid_timeout(incident: dict, member: discord.Member):
+    """タイムアウトを裏で実行し、最終報告の前に待てるよう incident["pending"] にも登録する"""
+    task = _spawn_raid_task(_raid_timeout(incident, member))
+    incident["pending"].add(task)
+    task.add_done_callback(incident["pending"].discard)
+
+def _raid_state(guild_id: int) -> dict:
+    state = RAID_STATE.get(guild_id)
+    if state is None:
+        state = RAID_STATE[guild_id] = {"joins": deque(), "contain_until": 0.0, "incident": None}
+    return state
+
+async def _raid_timeout(incident: dict, member: discord.Member):
+    """インシデントの一員としてタイムアウトする（結果は incident に集計）"""
+    shard_id = member.guild.shard_id or 0
+    sem = _raid_timeout_sems.get(shard_id)
+    if sem is None:
+        sem = _raid_timeout_sems[shard_id] = asyncio.Semaphore(RAID_TIMEOUT_CONCURRENCY)
+    async with sem:
+        try:
+            await _outbound(PRIO_MODERATION, f"guild:{member.guild.id}",
+                            lambda: member.edit(communication_disabled_until=incident["until"], reason=incident["reason"]))
+            incident["timed_out"].append(member.id)
+        except Exception as e:
+            incident["failed"].append((member.id, str(e)))
+    incident["dirty"] = True
+
+def _render_raid_report(incident: dict, finished: bool) -> discord.Embed:
+    emb = discord.Embed(
+        title="✅ Raid containment finished" if finished else "🚨 Raid containment active",
+        description=(
+            f"{JOIN_WINDOW_SEC}秒以内に{JOIN_THRESHOLD}人以上の参加を検知しました。\n"
+            f"封じ込め期間中の参加者には **最大28日** のタイムアウトを付与します。"
+        ),
+        color=0x2ECC71 if finished else 0xE74C3C,
+        timestamp=incident["started_at"],
+    )
+    timed_out = incident["timed_out"]
+    emb.add_field(name="Timed out", value=str(len(timed_out)), inline=True)
+    emb.add_field(name="Failed", value=str(len(incident["failed"])), inline=True)
+    emb.add_field(name="Until", value=f"<t:{int(incident['contain_until_wall'])}:T>", inline=True)
+    if timed_out:
+        mentions = " ".join(f"<@{uid}>" for uid in timed_out)
+        emb.add_field(name="Members", value=mentions[:1000] + (" …" if len(mentions) > 1000 else ""), inline=False)
+    if incident["failed"]:
+        lines = "\n".join(f"<@{uid}>: {err[:80]}" for uid, err in incident["failed"][:10])
+        emb.add_field(name="Errors", value=lines, inline=False)
+    return emb
+
+async def _raid_report_loop(guild: discord.Guild, incident: dict):
+    """封じ込め終了まで、管理ログの報告メッセージ（1件）を更新し続ける"""
+    ch = guild.get_channel(guild_config(guild.id)["admin_log_channel_id"])
+    report = None
+    state = _raid_state(guild.id)
+    while True:
+        await asyncio.sleep(RAID_REPORT_INTERVAL_SEC if report else 1.0)
+        finished = time.monotonic() >= state["contain_until"]
+        if finished and incident["pending"]:
+            # 封じ込め終了後は新しいタイムアウトは積まれない。処理中のものを待ってから最終報告する
+            await asyncio.gather(*incident["pending"], return_exceptions=True)
+        if ch and (incident["dirty"] or finished):
+            incident["dirty"] = False
+            emb = _render_raid_report(incident, finished)
+            try:
+                if report is None:
+                    report = await _outbound_send(PRIO_MODERATION, ch, embed=emb)
+                else:
+                    await _outbound(PRIO_MODERATION, f"channel:{ch.id}", lambda: report.edit(embed=emb))
+            except Exception as e:
+                print(f"[RAID] 管理ログ報告に失敗: {e}", flush=True)
+        if finished:
+            break
+    if state["incident"] is incident:
+        state["incident"] = None
+    print(f"[RAID] guild={guild.id} 封じ込め終了 timed_out={len(incident['timed_out'])} failed={len(incident['failed'])}", flush=True)
+
+def _start_raid_incident(guild: discord.Guild, state: dict, member_ids: list[int]) -> dict:
+    now = time.monotonic()
+    state["contain_until"] = now + RAID_CONTAINMENT_SEC
+    incident = {
+        "started_at": discord.utils.utcnow(),
+        "contain_until_wall": time.time() + RAID_CONTAINMENT_SEC,
+        "until": discord.utils.utcnow() + MAX_TIMEOUT,
+        "reason": f"Raid suspected: {JOIN_THRESHOLD} joins in {JOIN_WINDOW_SEC}s",
+        "timed_out": [], "failed": [], "dirty": True,
+        "pending": set(),   # 未完了の _raid_timeout タスク
+    }
+    state["incident"] = incident
+    print(f"[RAID] guild={guild.id} 発動: {len(member_ids)}人 → 封じ込め {RAID_CONTAINMENT_SEC}s", flush=True)
+    for uid in member_ids:
+        m = guild.get_member(uid)
+        if m:
+            _spawn_raid_timeout(incident, m)
+    _spawn_raid_task(_raid_report_loop(guild, incident))
+    return incident
+
+def _raid_check(member: discord.Member) -> bool:
+    """
+    参加を記録し、レイド扱いなら True（タイムアウトは裏で実行済み）。
+    封じ込め中の参加者は既存インシデントに追加される。
+    """
+    guild = member.guild
+    state = _raid_state(guild.id)
+    now = time.monotonic()
+
+    incident = state["incident"]
+    if incident is not None and now < state["contain_until"]:
+        _spawn_raid_timeout(incident, member)
+        return True
+
+    joins = state["joins"]
+    joins.append((now, member.id))
+    # 古い履歴を捨てる
+    while joins and now - joins[0][0] > JOIN_WINDOW_SEC:
+        joins.popleft()
+
+    if len(joins) >= JOIN_THRESHOLD:
+        member_ids = [uid for _, uid in joins]
+        # 連続発火を避けるためリセット
+        joins.clear()
+        _start_raid_incident(guild, state, member_ids)
+        return True
+    return False
+
 # --- 新規メンバー時の処理 ---
 @bot.event
+@_instrumented("event")
 async def on_member_join(member):
-    # --- 参加直後のセーフティチェック（無意味英字列 / 短時間大量参加） ---
-    now = discord.utils.utcnow()
-    JOIN_TIMES.append(now)
-    RECENT_JOIN_IDS.append(member.id)
-
-    # 古い履歴を捨てる
-    while JOIN_TIMES and (now - JOIN_TIMES[0]).total_seconds() > JOIN_WINDOW_SEC:
-        JOIN_TIMES.popleft()
-        if RECENT_JOIN_IDS:
-            RECENT_JOIN_IDS.popleft()
+    # --- 参加直後のセーフティチェック（短時間大量参加 / 無意味英字列） ---
+    # 1) RAID疑い: JOIN_WINDOW_SEC秒以内にJOIN_THRESHOLD人（封じ込め中も含む）
+    if _raid_check(member):
+        return  # この参加者のオンボーディングは中止
 
-    # 1) 無意味英単語列ユーザー名（英字のみ）の簡易検知 → 最大タイムアウト & 管理通知
+    # 2) 無意味英単語列ユーザー名（英字のみ）の簡易検知 → 最大タイムアウト & 管理通知
     if _is_gibberish_english(member.name):
         await _timeout_and_admin_log(member, "Suspicious name pattern (gibberish)")
         return  # 以降のオンボーディング処理は行わない
 
-    # 2) RAID疑い: JOIN_WINDOW_SEC秒以内にJOIN_THRESHOLD人
-    if len(JOIN_TIMES) >= JOIN_THRESHOLD:
-        suspect_ids = list(RECENT_JOIN_IDS)[-JOIN_THRESHOLD:]
-        for uid in suspect_ids:
-            m = member.guild.get_member(uid)
-            if m:
-                await _timeout_and_admin_log(m, f"Raid suspected: {JOIN_THRESHOLD} joins in {JOIN_WINDOW_SEC}s")
-        # 連続発火を避けるためリセット
-        JOIN_TIMES.clear()
-        RECENT_JOIN_IDS.clear()
-        return  # この参加者のオンボーディングは中止
     guild = member.guild
-    role = guild.get_role(ROLE_FIRST_TIMER)
-    log_channel = guild.get_channel(REPRESENTATIVE_COUNCIL_CHANNEL_ID)
-    guide_channel = guild.get_channel(GUIDE_CHANNEL_ID)
+    cfg = guild_config(guild.id)
+    role = guild.get_role(cfg["role_first_timer"])
+    log_channel = guild.get_channel(cfg["representative_council_channel_id"])
+    guide_channel = guild.get_channel(cfg["guide_channel_id"])
 
     if log_channel:
         mention_link = f"<@{member.id}>"  # メンションリンク（通知なし）
-        await log_channel.send(
+        _outbound_notice(
+            PRIO_ONBOARDING, log_channel,
             f"管理メンバーの皆さま、新たに{member.mention} さんがサーバーに参加されました。\n"
             "よろしくお願いいたします。"
         )
 
     if role:
         try:
-            await member.add_roles(role)
+            await _outbound(PRIO_ONBOARDING, f"guild:{guild.id}", lambda: member.add_roles(role))
             log_msg = f"✅ {member.display_name} さんにロール「{role.name}」を付与しました。"
             print(log_msg)
             if log_channel:
-                await log_channel.send(log_msg)
+                _outbound_notice(PRIO_ONBOARDING, log_channel, log_msg)
         except discord.Forbidden:
             msg = "⚠️ 権限不足でロールを付与できませんでした。"
             if log_channel:
-                await log_channel.send(msg)
+                _outbound_notice(PRIO_ONBOARDING, log_channel, msg)
         except Exception as e:
             if log_channel:
-                await log_channel.send(f"❌ ロール付与エラー: {e}")
+                _outbound_notice(PRIO_ONBOARDING, log_channel, f"❌ ロール付与エラー: {e}")
     else:
         if log_channel:
-            await log_channel.send(f"⚠️ ID {ROLE_FIRST_TIMER} のロールが見つかりません。")
+            _outbound_notice(PRIO_ONBOARDING, log_channel, f"⚠️ ID {cfg['role_first_timer']} のロールが見つかりません。")
 
     if guide_channel:
         try:
@@ -360,87 +1988,113 @@ async def on_member_join(member):
                 "⚠️万が一リアクションを行なってもメンバー権限が付与されない場合はこのチャンネルにメッセージを送信してください。⚠️\n"
                 "不明点があればお気軽にお尋ねください！"
             )
-            sent_msg = await guide_channel.send(guide_msg)
+            sent_msg = await _outbound_send(PRIO_ONBOARDING, guide_channel, guide_msg)
+            _remember_message(sent_msg)
             guide_messages[member.id] = sent_msg.id
-            await sent_msg.add_reaction("✅")  # リアクション要求（任意の絵文字でOK）
+            _route_add(sent_msg.id, ROUTE_ONBOARDING)
+            _persist("guide_messages", member.id)
+            # リアクション要求（任意の絵文字でOK）。見本の ✅ は飾りなので完了は待たず、失敗だけ管理ログに残す
+            def _reaction_done(future: asyncio.Future):
+                if log_channel and not future.cancelled() and future.exception() is not None:
+                    _outbound_notice(PRIO_ONBOARDING, log_channel, f"⚠️ 案内メッセージへのリアクションに失敗しました: {future.exception()}")
+            _outbound(PRIO_ONBOARDING, f"reaction:{guide_channel.id}", lambda: sent_msg.add_reaction("✅")).add_done_callback(_reaction_done)
 
         except Exception as e:
             if log_channel:
-                await log_channel.send(f"⚠️ 案内メッセージ送信に失敗しました: {e}")
+                _outbound_notice(PRIO_ONBOARDING, log_channel, f"⚠️ 案内メッセージ送信に失敗しました: {e}")
 
 # --- リアクション処理（オンボーディング + 募集参加） ---
 @bot.event
+@_instrumented("event")
 async def on_raw_reaction_add(payload):
+    kind = REACTION_ROUTES.get(payload.message_id)
+    if kind is None:
+        return
     if payload.user_id == bot.user.id:
         return
+    if kind == ROUTE_PARTY:
+        _party_reaction(payload, joined=True)
+        return
 
     user_id = payload.user_id
     message_id = payload.message_id
     guild = bot.get_guild(payload.guild_id)
     if not guild:
         return
+    cfg = guild_config(guild.id)
 
     # ===== ① オンボーディング（案内メッセージ） =====
     try:
-        if (user_id in guide_messages) and (guide_messages[user_id] == message_id):
+        if kind == ROUTE_ONBOARDING and guide_messages.get(user_id) == message_id:
             member = guild.get_member(user_id)
             if not member:
                 return
-            role_first = guild.get_role(ROLE_FIRST_TIMER)
-            role_general = guild.get_role(ROLE_GENERAL)
-            channel = bot.get_channel(payload.channel_id)
+            role_first = guild.get_role(cfg["role_first_timer"])
+            role_general = guild.get_role(cfg["role_general"])
+            # スレッドなど guild.get_channel で引けないチャンネルは bot 全体のキャッシュ → REST の順に探す
+            channel = guild.get_channel(payload.channel_id) or bot.get_channel(payload.channel_id)
 
             # ロール更新
             if role_first in member.roles:
-                await member.remove_roles(role_first)
+                await _outbound(PRIO_ONBOARDING, f"guild:{guild.id}", lambda: member.remove_roles(role_first))
             if role_general:
-                await member.add_roles(role_general)
+                await _outbound(PRIO_ONBOARDING, f"guild:{guild.id}", lambda: member.add_roles(role_general))
 
             # 案内メッセージ削除
             try:
-                msg = await channel.fetch_message(message_id)
-                await msg.delete()
-            except Exception:
-                pass
+                if channel is None and message_id not in _MESSAGE_CACHE:
+                    channel = await bot.fetch_channel(payload.channel_id)
+                await _message_handle(channel, message_id).delete()
+            except discord.NotFound:
+                pass  # 既に削除済み
+            except Exception as e:
+                print(f"[ONBOARDING] 案内メッセージを削除できませんでした channel={payload.channel_id} "
+                      f"message={message_id}: {type(e).__name__}: {e}", flush=True)
+            _forget_message(message_id)
+            _route_remove(message_id)
             guide_messages.pop(user_id, None)
+            _persist("guide_messages", user_id)
 
-            # 歓迎メッセージ＋スレッド
-            try:
-                intro_ch = guild.get_channel(INTRO_CHANNEL_ID) if INTRO_CHANNEL_ID else None
-                if intro_ch and isinstance(intro_ch, (discord.TextChannel, discord.ForumChannel)):
-                    welcome_text = (
-                        f"🎉 新メンバーが来てくれました！\n"
-                        f"{member.mention} さん、これからよろしくね！\n\n"
-                        "よければこの投稿からつながるスレッドで、軽く『こんにちは〜』『好きな武器』など一言どうぞ 🙌\n"
-                        "※挨拶は任意です。読む専でもOK！"
-                    )
-                    post = await intro_ch.send(welcome_text)
-                    thread_name = f"👋 歓迎：{member.display_name}"
-                    created_thread = await intro_ch.create_thread(
-                        name=thread_name,
-                        message=post,
-                        auto_archive_duration=60,
-                        type=discord.ChannelType.public_thread
-                    )
+            # 歓迎メッセージ＋スレッド（装飾的な処理なので低優先度で予約。混雑時は2分で諦める）
+            intro_ch = guild.get_channel(cfg["intro_channel_id"]) if cfg["intro_channel_id"] else None
+            if intro_ch and isinstance(intro_ch, (discord.TextChannel, discord.ForumChannel)):
+                async def _post_welcome():
                     try:
-                        await created_thread.send("🎉 みんなも新メンバーに挨拶してね！")
-                    except Exception:
-                        pass
-            except Exception as e:
-                log_channel = guild.get_channel(REPRESENTATIVE_COUNCIL_CHANNEL_ID)
-                if log_channel:
-                    await log_channel.send(f"⚠️ 歓迎メッセージ/スレッド作成に失敗しました: {e}")
+                        welcome_text = (
+                            f"🎉 新メンバーが来てくれました！\n"
+                            f"{member.mention} さん、これからよろしくね！\n\n"
+                            "よければこの投稿からつながるスレッドで、軽く『こんにちは〜』『好きな武器』など一言どうぞ 🙌\n"
+                            "※挨拶は任意です。読む専でもOK！"
+                        )
+                        post = await intro_ch.send(welcome_text)
+                        thread_name = f"👋 歓迎：{member.display_name}"
+                        created_thread = await intro_ch.create_thread(
+                            name=thread_name,
+                            message=post,
+                            auto_archive_duration=60,
+                            type=discord.ChannelType.public_thread
+                        )
+                        try:
+                            await created_thread.send("🎉 みんなも新メンバーに挨拶してね！")
+                        except Exception:
+                            pass
+                    except Exception as e:
+                        log_channel = guild.get_channel(cfg["representative_council_channel_id"])
+                        if log_channel:
+                            _outbound_notice(PRIO_COSMETIC, log_channel, f"⚠️ 歓迎メッセージ/スレッド作成に失敗しました: {e}")
+                _outbound(PRIO_COSMETIC, f"channel:{intro_ch.id}", _post_welcome, max_age=120.0)
             return
     except Exception as e:
-        log_channel = guild.get_channel(REPRESENTATIVE_COUNCIL_CHANNEL_ID)
+        log_channel = guild.get_channel(cfg["representative_council_channel_id"])
         if log_channel:
-            await log_channel.send(f"⚠️ リアクション処理(オンボ)で例外: {e}")
+            _outbound_notice(PRIO_ONBOARDING, log_channel, f"⚠️ リアクション処理(オンボ)で例外: {e}")
 
     # ===== ② 募集メッセージのリアクション参加 =====
-    if message_id not in RECRUITS:
+    if kind != ROUTE_RECRUIT:
+        return
+    data = RECRUITS.get(message_id)
+    if not data:
         return
-
-    data = RECRUITS[message_id]
     emoji = str(payload.emoji)
     member = guild.get_member(user_id)
     if not member or member.bot:
@@ -450,8 +2104,7 @@ async def on_raw_reaction_add(payload):
     async def _undo(emoji_to_remove: str):
         try:
             ch = guild.get_channel(data["channel_id"])
-            msg = await ch.fetch_message(message_id)
-            await msg.remove_reaction(emoji_to_remove, member)
+            await _message_handle(ch, message_id).remove_reaction(emoji_to_remove, member)
         except Exception:
             pass
 
@@ -476,6 +2129,7 @@ async def on_raw_reaction_add(payload):
             return
         # 参加登録
         data["participants"].add(member.id)
+        _persist("recruits", message_id)
         updated = True
 
     elif emoji == EMOJI_LEAVE:
@@ -484,50 +2138,69 @@ async def on_raw_reaction_add(payload):
             await _warn_once(member, message_id, "not_joined", "ℹ️ まだ参加登録されていません。")
             return
         data["participants"].remove(member.id)
+        _persist("recruits", message_id)
         updated = True
 
     elif emoji == EMOJI_CLOSE:
         if (member.id == data["owner_id"]) or (member.guild_permissions.administrator):
             data["closed"] = not data.get("closed", False)
+            _persist("recruits", message_id)
             updated = True
         else:
             await _undo(EMOJI_CLOSE)
             try:
                 ch = guild.get_channel(data["channel_id"])
-                if ch:
+                if ch and not WARN_COOLDOWNS.hit((message_id, member.id, "close_denied")):
                     await _temp_notice(ch, member, "⚠️ 作成者以外は停止できません。", seconds=6.0)
             except Exception:
                 pass
             return
 
     if updated:
-        await _update_recruit_embed(guild, message_id)
+        _update_recruit_embed(guild, message_id)
 
 # --- リアクションが外れたときも同期 ---
 @bot.event
+@_instrumented("event")
 async def on_raw_reaction_remove(payload):
     message_id = payload.message_id
-    if message_id not in RECRUITS:
+    kind = REACTION_ROUTES.get(message_id)
+    if kind == ROUTE_PARTY:
+        _party_reaction(payload, joined=False)
+        return
+    if kind != ROUTE_RECRUIT:
         return
     guild = bot.get_guild(payload.guild_id)
     if guild:
-        await _update_recruit_embed(guild, message_id)
+        _update_recruit_embed(guild, message_id)
+_temp_notice_tasks: set[asyncio.Task] = set()   # 削除待ちの一時通知（GC で消えないよう参照を持つ）
+
+def _temp_notice_done(task: asyncio.Task):
+    _temp_notice_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        print(f"[NOTICE] 一時通知の削除予約に失敗: {task.exception()}", flush=True)
+
 async def _temp_notice(channel: discord.abc.Messageable, user: discord.Member, text: str, seconds: float = 6.0):
     """
     チャンネルに一時的な注意メッセージを表示して、数秒後に自動削除する。
     リアクションイベントではエフェメラル返信が使えないための代替。
+    送信は装飾的な通知として低優先度で予約し、混雑で表示期限を過ぎたものは送らない。
     """
-    try:
+    route = f"channel:{channel.id}"
+
+    async def _send_and_schedule_delete():
         msg = await channel.send(f"{user.mention} {text}")
         async def _delete_later(m: discord.Message, s: float):
+            await asyncio.sleep(s)
             try:
-                await asyncio.sleep(s)
-                await m.delete()
-            except Exception:
-                pass
-        asyncio.create_task(_delete_later(msg, seconds))
-    except Exception:
-        pass
+                await _outbound(PRIO_COSMETIC, route, m.delete)
+            except discord.NotFound:
+                pass  # 既に削除済み
+        task = asyncio.create_task(_delete_later(msg, seconds))
+        _temp_notice_tasks.add(task)
+        task.add_done_callback(_temp_notice_done)
+
+    _outbound(PRIO_COSMETIC, route, _send_and_schedule_delete, max_age=seconds)
 # --- 募集メッセージ埋め込み・警告ヘルパ ---
 #
 # --- 募集停止/再開コントロール（作成者/管理者のみ） ---
@@ -555,7 +2228,8 @@ class StopToggleView(discord.ui.View):
 
         # トグルして更新
         data["closed"] = not data.get("closed", False)
-        await _update_recruit_embed(guild, self.message_id)
+        _persist("recruits", self.message_id)
+        _update_recruit_embed(guild, self.message_id)
         status = "停止" if data["closed"] else "再開"
         await interaction.response.send_message(f"✅ 募集を**{status}**しました。", ephemeral=True)
 
@@ -564,31 +2238,51 @@ async def _warn_once(member: discord.Member, message_id: int, code: str, text: s
     """
     同じ内容の警告DMを短時間に何度も送らないための補助。
     """
-    now = time.time()
-    key = (message_id, member.id, code)
-    last = WARN_COOLDOWNS.get(key, 0.0)
-    if now - last < WARN_COOLDOWN_SEC:
-        return
-    WARN_COOLDOWNS[key] = now
-    try:
-        await member.send(text)
-    except Exception:
-        # DMが閉じられている場合は無視
-        pass
-
-async def _update_recruit_embed(guild: discord.Guild, message_id: int):
-    """募集メッセージの埋め込みを最新化する"""
-    data = RECRUITS.get(message_id)
-    if not data:
-        return
-    ch = guild.get_channel(data["channel_id"])
-    if not ch:
-        return
-    try:
-        msg = await ch.fetch_message(message_id)
-    except Exception:
+    if WARN_COOLDOWNS.hit((message_id, member.id, code)):
         return
-
+    # 装飾的な通知扱い：混雑時に30秒以上待たされたら送らない
+    _outbound(PRIO_COSMETIC, f"dm:{member.id}", lambda: member.send(text), max_age=30.0)
+
+# --- メッセージハンドルのキャッシュ（fetch_message の往復を省く） ---
+# Botが送信したメッセージのハンドルを message_id で保持する（LRU・上限 MESSAGE_CACHE_SIZE）。
+# 見つからない場合も PartialMessage を返すので、編集/削除/リアクション操作に GET は不要。
+MESSAGE_CACHE_SIZE = int(os.getenv("MESSAGE_CACHE_SIZE", "1024"))
+MESSAGE_CACHE_STATS = {"hits": 0, "misses": 0}
+_MESSAGE_CACHE: OrderedDict[int, discord.Message | discord.PartialMessage] = OrderedDict()
+
+def _remember_message(msg: discord.Message | discord.PartialMessage):
+    _MESSAGE_CACHE[msg.id] = msg
+    _MESSAGE_CACHE.move_to_end(msg.id)
+    while len(_MESSAGE_CACHE) > MESSAGE_CACHE_SIZE:
+        _MESSAGE_CACHE.popitem(last=False)
+
+def _forget_message(message_id: int):
+    _MESSAGE_CACHE.pop(message_id, None)
+
+def _message_handle(channel: discord.abc.Messageable, message_id: int) -> discord.Message | discord.PartialMessage:
+    """キャッシュ済みのハンドル、なければ channel の PartialMessage を返す"""
+    msg = _MESSAGE_CACHE.get(message_id)
+    if msg is not None:
+        MESSAGE_CACHE_STATS["hits"] += 1
+        _MESSAGE_CACHE.move_to_end(message_id)
+        return msg
+    MESSAGE_CACHE_STATS["misses"] += 1
+    return channel.get_partial_message(message_id)
+
+def message_cache_hit_ratio() -> float:
+    total = MESSAGE_CACHE_STATS["hits"] + MESSAGE_CACHE_STATS["misses"]
+    return MESSAGE_CACHE_STATS["hits"] / total if total else 0.0
+
+# --- 募集埋め込みの更新（メッセージ単位でまとめて1回だけ編集） ---
+# リアクションが集中しても、RECRUIT_EDIT_DEBOUNCE_SEC 内の変更は最後の状態で1回の編集にまとめる。
+# 編集は fetch を伴わないハンドル（_message_handle）で行い、描画結果が前回と同じなら送らない。
+RECRUIT_EDIT_DEBOUNCE_SEC = float(os.getenv("RECRUIT_EDIT_DEBOUNCE_SEC", "1.5"))
+RECRUIT_EDIT_STATS = {"requested": 0, "sent": 0, "skipped_unchanged": 0, "failed": 0}
+_recruit_edit_tasks: dict[int, asyncio.Task] = {}    # message_id -> 実行中の更新タスク
+_recruit_edit_dirty: set[int] = set()                # 更新タスク実行中に追加の変更があった message_id
+_recruit_last_embed: dict[int, dict] = {}            # message_id -> 最後に送った embed.to_dict()
+
+def _render_recruit_embed(guild: discord.Guild, data: dict) -> discord.Embed:
     limit = data["limit"]
     members = [guild.get_member(uid) for uid in data["participants"]]
     members = [m for m in members if m is not None]
@@ -608,24 +2302,65 @@ async def _update_recruit_embed(guild: discord.Guild, message_id: int):
     embed.add_field(name="🧑‍🤝‍🧑 参加者一覧", value=members_text, inline=False)
     if data.get("closed"):
         embed.set_footer(text="⛔ この募集は停止中です")
+    return embed
+
+def _update_recruit_embed(guild: discord.Guild, message_id: int):
+    """募集メッセージの埋め込み更新を予約する（すでに予約済みならまとめる）"""
+    RECRUIT_EDIT_STATS["requested"] += 1
+    task = _recruit_edit_tasks.get(message_id)
+    if task is not None and not task.done():
+        _recruit_edit_dirty.add(message_id)
+        return
+    _recruit_edit_tasks[message_id] = asyncio.create_task(_run_recruit_embed_update(guild, message_id))
 
+async def _run_recruit_embed_update(guild: discord.Guild, message_id: int):
     try:
-        await msg.edit(embed=embed)
-    except Exception:
-        pass
+        while True:
+            await asyncio.sleep(RECRUIT_EDIT_DEBOUNCE_SEC)
+            _recruit_edit_dirty.discard(message_id)
+            await _send_recruit_embed(guild, message_id)
+            # 編集中に新しい変更が来ていればもう1周
+            if message_id not in _recruit_edit_dirty:
+                break
+    finally:
+        _recruit_edit_tasks.pop(message_id, None)
+
+async def _send_recruit_embed(guild: discord.Guild, message_id: int):
+    """募集メッセージの埋め込みを最新化する（変化がなければ何もしない）"""
+    data = RECRUITS.get(message_id)
+    if not data:
+        return
+    ch = guild.get_channel(data["channel_id"])
+    if not ch:
+        return
+    embed = _render_recruit_embed(guild, data)
+    rendered = embed.to_dict()
+    if _recruit_last_embed.get(message_id) == rendered:
+        RECRUIT_EDIT_STATS["skipped_unchanged"] += 1
+        return
+    try:
+        await _outbound(PRIO_RECRUIT, f"channel:{ch.id}", lambda: _message_handle(ch, message_id).edit(embed=embed),
+                        key=("recruit_edit", message_id))
+        _recruit_last_embed[message_id] = rendered
+        RECRUIT_EDIT_STATS["sent"] += 1
+    except Exception as e:
+        RECRUIT_EDIT_STATS["failed"] += 1
+        print(f"[RECRUIT] 埋め込み更新に失敗 message_id={message_id}: {e}", flush=True)
 
 # --- 退出時：未処理の案内メッセージをクリーンアップ ---
 @bot.event
+@_instrumented("event")
 async def on_member_remove(member: discord.Member):
     """
     新規参加者がリアクションせずに退出した場合、
     その人宛てに残っている案内メッセージ（guide_messagesの対象）を削除する。
     """
+    cfg = guild_config(member.guild.id)
     # まずは退出自体を管理メンバーログに通知
     try:
-        kanrilog_channel = member.guild.get_channel(REPRESENTATIVE_COUNCIL_CHANNEL_ID)
+        kanrilog_channel = member.guild.get_channel(cfg["representative_council_channel_id"])
         if kanrilog_channel:
-            await kanrilog_channel.send(f"🗑️{member.mention} さんがサーバーを退出しました。（ID: {member.id}）")
+            _outbound_notice(PRIO_COSMETIC, kanrilog_channel, f"🗑️{member.mention} さんがサーバーを退出しました。（ID: {member.id}）")
     except Exception:
         pass
     try:
@@ -633,45 +2368,121 @@ async def on_member_remove(member: discord.Member):
         msg_id = guide_messages.pop(user_id, None)
         if not msg_id:
             return  # 記録なし → 何もしない
+        _persist("guide_messages", user_id)
+        _route_remove(msg_id)
 
         guild = member.guild
-        guide_channel = guild.get_channel(GUIDE_CHANNEL_ID)
+        guide_channel = guild.get_channel(cfg["guide_channel_id"])
         if not guide_channel:
             return
 
         try:
-            msg = await guide_channel.fetch_message(msg_id)
-            await msg.delete()
+            msg = _message_handle(guide_channel, msg_id)
+            _forget_message(msg_id)
+            await _outbound(PRIO_COSMETIC, f"channel:{guide_channel.id}", msg.delete)
             # ログに通知
-            log_channel = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+            log_channel = guild.get_channel(cfg["admin_log_channel_id"])
             if log_channel:
-                await log_channel.send(f"🗑️{member.mention} さんが退出したため、案内メッセージ（ID: {msg_id}）を削除しました。")
+                _outbound_notice(PRIO_COSMETIC, log_channel, f"🗑️{member.mention} さんが退出したため、案内メッセージ（ID: {msg_id}）を削除しました。")
         except discord.NotFound:
             # 既に削除済み
             pass
         except Exception as e:
-            log_channel = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+            log_channel = guild.get_channel(cfg["admin_log_channel_id"])
             if log_channel:
-                await log_channel.send(f"⚠️ 退出者の案内メッセージ削除に失敗しました: {e}")
+                _outbound_notice(PRIO_COSMETIC, log_channel, f"⚠️ 退出者の案内メッセージ削除に失敗しました: {e}")
     except Exception as e:
         # ここで例外を握りつぶしてBot停止を避ける
         try:
-            log_channel = member.guild.get_channel(ADMIN_LOG_CHANNEL_ID)
+            log_channel = member.guild.get_channel(cfg["admin_log_channel_id"])
             if log_channel:
-                await log_channel.send(f"⚠️ on_member_remove 内部エラー: {e}")
+                _outbound_notice(PRIO_COSMETIC, log_channel, f"⚠️ on_member_remove 内部エラー: {e}")
         except Exception:
             pass
 
+# --- GameWith ページの解析 ---
+# 必要な要素（イベントの _item、モンスターの ol.monster_weak_list）の部分木だけを SoupStrainer で組み立てる。
+# lxml が入っていればそちらで解析する（任意。無ければ標準の html.parser）。
+# 解析は数百KBのページで数十〜数百ms かかるため、呼び出し側は asyncio.to_thread でイベントループの外で行う。
+try:
+    import lxml  # noqa: F401
+    HTML_PARSER = "lxml"
+except ImportError:
+    HTML_PARSER = "html.parser"
+
+_MONSTER_STRAINER = SoupStrainer("ol", class_="monster_weak_list")
+_EVENT_STRAINER   = SoupStrainer("div", class_="_item")
+
 # --- モンスター関連コマンド ---
-def fetch_monsters():
-    url = "https://gamewith.jp/mhwilds/452222"
-    res = requests.get(url)
-    soup = BeautifulSoup(res.content, "html.parser")
+MONSTER_URL = "https://gamewith.jp/mhwilds/452222"
+
+def _parse_monsters(html: bytes, parser: str | None = None) -> list[str]:
+    soup = BeautifulSoup(html, parser or HTML_PARSER, parse_only=_MONSTER_STRAINER)
     return [li.get("data-name", "").strip() for li in soup.select("ol.monster_weak_list li[data-name]") if li.get("data-name")]
 
-MONSTERS = fetch_monsters()
+async def fetch_monsters() -> list[str]:
+    status, _, body = await http_get(MONSTER_URL)
+    if status != 200:
+        raise RuntimeError(f"monster list fetch failed: HTTP {status}")
+    return await asyncio.to_thread(_parse_monsters, body)
+
+# --- モンスター一覧のローカルスナップショット ---
+# 起動時は外部サイトに依存せずローカルのスナップショットから読み込み、
+# ゲートウェイ接続後に裏で最新化する（成功したらスナップショットも更新）。
+# BOT_DATA_DIR にまだスナップショットが無い（初回デプロイ・永続ディスクなしの再デプロイ）ときは、
+# リポジトリ同梱の assets/monsters_seed.json から始める。
+MONSTER_SNAPSHOT_PATH = os.path.join(BOT_DATA_DIR, "monsters.json")
+MONSTER_SEED_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "assets", "monsters_seed.json")
+_monster_refresh_task: asyncio.Task | None = None
+
+def _load_monster_snapshot() -> list[str]:
+    for path in (MONSTER_SNAPSHOT_PATH, MONSTER_SEED_PATH):
+        try:
+            with open(path, encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            continue
+        except Exception as e:
+            print(f"[MONSTERS] スナップショット読込に失敗 ({path}): {e}", flush=True)
+            continue
+        names = [str(n) for n in data.get("monsters", []) if n]
+        if names:
+            return names
+    return []
+
+def _save_monster_snapshot(names: list[str]):
+    """一時ファイルに書いてから置き換える（書き込み途中で落ちても壊れない）"""
+    os.makedirs(os.path.dirname(MONSTER_SNAPSHOT_PATH) or ".", exist_ok=True)
+    tmp = MONSTER_SNAPSHOT_PATH + ".tmp"
+    with open(tmp, "w", encoding="utf-8") as f:
+        json.dump({"saved_at": time.time(), "monsters": names}, f, ensure_ascii=False)
+    os.replace(tmp, MONSTER_SNAPSHOT_PATH)
+
+async def refresh_monsters() -> list[str]:
+    """GameWithから再取得し、メモリ上の MONSTERS とスナップショットを更新する"""
+    global MONSTERS
+    names = await fetch_monsters()
+    if not names:
+        # ページ構造の変更などで空になった場合は既存の一覧を残す
+        raise RuntimeError("monster list was empty")
+    MONSTERS = names
+    try:
+        await asyncio.to_thread(_save_monster_snapshot, names)
+    except Exception as e:
+        print(f"[MONSTERS] スナップショット保存に失敗: {e}", flush=True)
+    return names
+
+async def _background_monster_refresh():
+    try:
+        names = await refresh_monsters()
+        print(f"[MONSTERS] 最新化しました: {len(names)}体", flush=True)
+    except Exception as e:
+        print(f"[MONSTERS] 最新化に失敗（スナップショット {len(MONSTERS)}体 を継続使用）: {e}", flush=True)
+
+MONSTERS: list[str] = _load_monster_snapshot()
 
 @bot.slash_command(name="203_モンスター抽選", description="モンスターをランダムに教えてくれるよ！")
+@_instrumented("command")
 async def monster(ctx):
     if MONSTERS:
         name = random.choice(MONSTERS)
@@ -680,43 +2491,279 @@ async def monster(ctx):
         await ctx.respond("モンスターが見つからなかったよ😢")
 
 @bot.slash_command(name="202_モンスターリスト更新", description="モンスターリストを更新するよ")
+@_instrumented("command")
 async def update_monsters(ctx):
     await ctx.respond("🔄 モンスターリストを更新中…")
-    global MONSTERS
-    MONSTERS = fetch_monsters()
+    try:
+        await refresh_monsters()
+    except Exception as e:
+        await ctx.send_followup(f"⚠️ モンスターリストの取得に失敗しました: {e}")
+        return
     await ctx.send_followup(f"🆙 モンスターリストを更新したよ！現在の数：{len(MONSTERS)}体")
 
 
+# --- パーティ編成エンジン（武器の偏りをならし、直近の組み合わせを避ける） ---
+# 参加者を武器ごとにまとめ、多い武器から順に巡回中のパーティへ1人ずつ配る（同じ武器が1か所に固まらない）。
+# 配るときは、直近 PARTY_HISTORY_EVENTS 回で同じパーティだった相手がいないパーティを優先する。
+# 候補は巡回位置から最大 PARTY_PLACEMENT_PROBES 個だけ見るので、全体で O(参加者数 × パーティ人数)。
+# 履歴はペアではなく「回ごとのパーティ構成」で持つ（1回あたり参加者数ぶんの整数で済む）。
+PARTY_HISTORY_EVENTS   = int(os.getenv("PARTY_HISTORY_EVENTS", "4"))
+PARTY_PLACEMENT_PROBES = 8
+PARTY_MESSAGE_LIMIT    = 1900   # 1通の文字数上限（Discord の2000字に余裕を持たせる）
+
+def plan_parties(user_ids: list[int], size: int, weapons: dict[int, str], recent: dict[int, set[int]],
+                 *, probes: int = PARTY_PLACEMENT_PROBES, rng=random) -> tuple[list[list[int]], int]:
+    """
+    user_ids を size 人前後のパーティに分け、(パーティの配列, 避けきれなかった再会ペア数) を返す。
+    パーティ間の人数差は最大1。weapons は user_id -> 武器名、recent は user_id -> 直近で同じパーティだった相手。
+    """
+    n = len(user_ids)
+    if n == 0:
+        return [], 0
+    group_count = (n + size - 1) // size
+    base_size, remainder = divmod(n, group_count)
+    caps = [base_size + (1 if i < remainder else 0) for i in range(group_count)]
+
+    # 武器ごとにまとめ、人数の多い武器から配る（未申告は最後に隙間を埋める・同数の武器の順は毎回変える）
+    by_weapon: dict[str | None, list[int]] = {}
+    for uid in user_ids:
+        by_weapon.setdefault(weapons.get(uid), []).append(uid)
+    classes = list(by_weapon.items())
+    rng.shuffle(classes)
+    classes.sort(key=lambda kv: (kv[0] is None, -len(kv[1])))
+
+    groups: list[list[int]] = [[] for _ in range(group_count)]
+    order = list(range(group_count))   # 巡回順（1周ごとに満員のパーティを外す）
+    rng.shuffle(order)
+    open_count, pos, repeats = group_count, 0, 0
+    for _, members in classes:
+        rng.shuffle(members)
+        for uid in members:
+            partners = recent.get(uid)
+            best = best_hits = best_pos = None
+            seen, j = 0, pos
+            while seen < min(probes, open_count):
+                if j >= len(order):
+                    order = [g for g in order if len(groups[g]) < caps[g]]
+                    j = 0
+                g = order[j]
+                j += 1
+                if len(groups[g]) >= caps[g]:
+                    continue
+                seen += 1
+                hits = sum(1 for m in groups[g] if m in partners) if partners else 0
+                if best is None or hits < best_hits:
+                    best, best_hits, best_pos = g, hits, j
+                    if hits == 0:
+                        break
+            groups[best].append(uid)
+            repeats += best_hits
+            if len(groups[best]) >= caps[best]:
+                open_count -= 1
+            pos = best_pos
+    return groups, repeats
+
+def _recent_partners(guild_id: int, user_ids) -> dict[int, set[int]]:
+    """直近の編成履歴から、今回の参加者それぞれが同じパーティだった相手を集める"""
+    wanted = set(user_ids)
+    recent: dict[int, set[int]] = {}
+    for event in PARTY_HISTORY.get(guild_id, ()):
+        for group in event:
+            members = [uid for uid in group if uid in wanted]
+            if len(members) < 2:
+                continue
+            for uid in members:
+                recent.setdefault(uid, set()).update(members)
+    return recent
+
+def _remember_party_history(guild_id: int, groups: list[list[int]]):
+    history = PARTY_HISTORY.setdefault(guild_id, [])
+    history.append([list(g) for g in groups])
+    del history[:max(0, len(history) - PARTY_HISTORY_EVENTS)]
+    _persist("party_history", guild_id)
+
+def _chunk_blocks(blocks: list[str], limit: int = PARTY_MESSAGE_LIMIT) -> list[str]:
+    """ブロック（空行区切り）を、1通 limit 文字以内のメッセージにまとめる"""
+    chunks, current = [], ""
+    for block in blocks:
+        if current and len(current) + 2 + len(block) > limit:
+            chunks.append(current)
+            current = ""
+        current = f"{current}\n\n{block}" if current else block
+    if current:
+        chunks.append(current)
+    return chunks
+
+# --- /201_メンバー分け：参加者の集計（締切時にリアクションを取り直さず、イベントから直接数える） ---
+# 参加者は 🙋 の raw リアクション追加/削除で PARTY_SESSIONS の集合に反映し、締切時はその集合だけで編成する。
+# 参加人数の表示は募集埋め込みと同じく、PARTY_EDIT_DEBOUNCE_SEC 内の変化を最後の状態で1回の編集にまとめる。
+EMOJI_PARTY             = "🙋"
+PARTY_MIN_DEADLINE_SEC  = 10
+PARTY_MAX_DEADLINE_SEC  = 840    # 結果の送信（followup）はインタラクションの有効期限15分以内に済ませる
+# 締切を省略したときの既定値。範囲外だと省略時に毎回エラーになるので、読み込み時に範囲内へ丸める
+PARTY_DEADLINE_SEC      = min(max(int(os.getenv("PARTY_DEADLINE_SEC", "60")), PARTY_MIN_DEADLINE_SEC), PARTY_MAX_DEADLINE_SEC)
+PARTY_EDIT_DEBOUNCE_SEC = float(os.getenv("PARTY_EDIT_DEBOUNCE_SEC", "2.0"))
+PARTY_SESSIONS: dict[int, dict] = {}   # message_id -> 集計中のパーティ編成
+
+def _party_text(session: dict) -> str:
+    count = len(session["participants"])
+    if session["closed"].is_set():
+        return f"🙋‍♂️ パーティ編成（{session['size']}人ずつ）は締め切りました！（参加 {count}人）"
+    return (
+        f"🙋‍♂️ パーティ編成！参加したい人は{EMOJI_PARTY}でリアクションしてね！"
+        f"（{session['size']}人ずつ/<t:{int(session['deadline_at'])}:R>に締め切ります）\n"
+        f"👥 現在の参加: {count}人"
+    )
+
+def _party_reaction(payload, joined: bool):
+    session = PARTY_SESSIONS.get(payload.message_id)
+    if session is None or session["closed"].is_set() or str(payload.emoji) != EMOJI_PARTY:
+        return
+    if joined:
+        member = getattr(payload, "member", None)
+        if member is None:
+            guild = bot.get_guild(payload.guild_id)
+            member = guild.get_member(payload.user_id) if guild else None
+        if member is not None and member.bot:
+            return
+        session["participants"].add(payload.user_id)
+    else:
+        session["participants"].discard(payload.user_id)
+    _update_party_counter(session)
+
+def _update_party_counter(session: dict):
+    """参加人数表示の更新を予約する（すでに予約済みならまとめる）"""
+    task = session["edit_task"]
+    if task is not None and not task.done():
+        session["dirty"] = True
+        return
+    session["edit_task"] = asyncio.create_task(_run_party_counter_update(session))
+
+async def _run_party_counter_update(session: dict):
+    while True:
+        await asyncio.sleep(PARTY_EDIT_DEBOUNCE_SEC)
+        session["dirty"] = False
+        await _send_party_counter(session)
+        if not session["dirty"] or session["closed"].is_set():
+            break
+
+async def _send_party_counter(session: dict, *, final: bool = False):
+    text = _party_text(session)
+    if text == session["last_text"] and not final:
+        return
+    ch, message_id = session["channel"], session["message_id"]
+    kwargs = {"content": text, "view": None} if final else {"content": text}
+    try:
+        await _outbound(PRIO_RECRUIT, f"channel:{ch.id}", lambda: _message_handle(ch, message_id).edit(**kwargs),
+                        key=("party_edit", message_id))
+        session["last_text"] = text
+    except Exception as e:
+        print(f"[PARTY] 参加人数の表示更新に失敗 message_id={message_id}: {e}", flush=True)
+
+class PartyView(discord.ui.View):
+    """
+    締切前に編成を始めた人（または管理者）が集計を打ち切るボタンと、使う武器の申告メニュー。
+    武器を選ぶと参加扱いにして、申告は次回以降も覚えておく。
+    """
+    def __init__(self, session: dict, timeout: float | None):
+        super().__init__(timeout=timeout)
+        self.session = session
+        self.weapon_select = None
+        if WEAPONS:
+            # セレクトメニューの選択肢は25件まで
+            self.weapon_select = discord.ui.Select(
+                placeholder="使う武器を選んで参加（任意）",
+                options=[discord.SelectOption(label=w) for w in WEAPONS[:25]],
+            )
+            self.weapon_select.callback = self.declare_weapon
+            self.add_item(self.weapon_select)
+
+    async def declare_weapon(self, interaction: discord.Interaction):
+        if self.session["closed"].is_set():
+            await interaction.response.send_message("⚠️ このパーティ編成はもう締め切られています。", ephemeral=True)
+            return
+        weapon = self.weapon_select.values[0]
+        DECLARED_WEAPONS[interaction.user.id] = weapon
+        _persist("declared_weapons", interaction.user.id)
+        self.session["participants"].add(interaction.user.id)
+        _update_party_counter(self.session)
+        await interaction.response.send_message(f"✅ 「{weapon}」で参加登録したよ！", ephemeral=True)
+
+    @discord.ui.button(label="⏹ 今すぐ締め切る", style=discord.ButtonStyle.primary)
+    async def close_now(self, button: discord.ui.Button, interaction: discord.Interaction):
+        if self.session["closed"].is_set():
+            await interaction.response.send_message("⚠️ このパーティ編成はもう締め切られています。", ephemeral=True)
+            return
+        if (interaction.user.id != self.session["organizer_id"]) and (not interaction.user.guild_permissions.administrator):
+            await interaction.response.send_message("⚠️ 締め切りは編成を始めた人または管理者のみ可能です。", ephemeral=True)
+            return
+        self.session["closed"].set()
+        await interaction.response.send_message("✅ 締め切りました。編成するね！", ephemeral=True)
+
 @bot.slash_command(name="201_メンバー分け", description="参加リアクションからランダムにパーティを編成するよ！")
-async def party(ctx, size: int = 4):
+@_instrumented("command")
+async def party(ctx, size: int = 4, deadline: int = PARTY_DEADLINE_SEC):
     if size < 1:
         await ctx.respond("パーティ人数は1人以上にしてね❌", ephemeral=True)
         return
-    msg = await ctx.respond(f"🙋‍♂️ パーティ編成！参加したい人はリアクションしてね！（{size}人ずつ/※60秒後に締め切ります）")
+    if not PARTY_MIN_DEADLINE_SEC <= deadline <= PARTY_MAX_DEADLINE_SEC:
+        await ctx.respond(f"締切は{PARTY_MIN_DEADLINE_SEC}〜{PARTY_MAX_DEADLINE_SEC}秒で指定してね❌", ephemeral=True)
+        return
+    session = {
+        "organizer_id": ctx.author.id, "size": size, "participants": set(), "closed": asyncio.Event(),
+        "deadline_at": time.time() + deadline, "channel": ctx.channel, "message_id": None,
+        "last_text": None, "edit_task": None, "dirty": False,
+    }
+    view = PartyView(session, timeout=deadline + 30)
+    session["last_text"] = _party_text(session)
+    msg = await ctx.respond(session["last_text"], view=view)
     original = await msg.original_response()
-    await original.add_reaction("🙋")
-    await asyncio.sleep(60)
-    updated = await ctx.channel.fetch_message(original.id)
-    users = await updated.reactions[0].users().flatten()
-    users = [u for u in users if not u.bot]
-    if len(users) < size:
+    session["message_id"] = original.id
+    _remember_message(original)
+    PARTY_SESSIONS[original.id] = session
+    _route_add(original.id, ROUTE_PARTY)
+    try:
+        await _outbound(PRIO_RECRUIT, f"reaction:{original.channel.id}", lambda: original.add_reaction(EMOJI_PARTY))
+        # 締切時刻か「今すぐ締め切る」の早い方まで待つ
+        timer = asyncio.create_task(asyncio.sleep(deadline))
+        closer = asyncio.create_task(session["closed"].wait())
+        try:
+            await asyncio.wait({timer, closer}, return_when=asyncio.FIRST_COMPLETED)
+        finally:
+            timer.cancel()
+            closer.cancel()
+    finally:
+        session["closed"].set()
+        _route_remove(original.id)
+        PARTY_SESSIONS.pop(original.id, None)
+        view.stop()
+        if session["edit_task"] is not None:
+            session["edit_task"].cancel()
+    # 最終の人数を表示してボタンを外す（結果の送信は待たない）
+    asyncio.create_task(_send_party_counter(session, final=True))
+
+    user_ids = list(session["participants"])
+    if len(user_ids) < size:
         await ctx.followup.send("😢 参加者が足りなかったよ…")
         return
-    random.shuffle(users)
-    group_count = (len(users) + size - 1) // size
-    base_size = len(users) // group_count
-    remainder = len(users) % group_count
-    groups, start = [], 0
-    for i in range(group_count):
-        extra = 1 if i < remainder else 0
-        end = start + base_size + extra
-        groups.append(users[start:end])
-        start = end
-    result = "\n\n".join([f"🧩 パーティ {i+1}:\n" + "\n".join([f"- {u.mention}" for u in g]) for i, g in enumerate(groups)])
-    await ctx.followup.send(f"✅ パーティ編成完了！\n{result}")
+    guild_id = ctx.guild.id if ctx.guild else 0
+    groups, repeats = plan_parties(user_ids, size, DECLARED_WEAPONS, _recent_partners(guild_id, user_ids))
+    _remember_party_history(guild_id, groups)
+
+    def _line(uid: int) -> str:
+        weapon = DECLARED_WEAPONS.get(uid)
+        return f"- <@{uid}>（{weapon}）" if weapon else f"- <@{uid}>"
+
+    header = "✅ パーティ編成完了！"
+    if repeats:
+        header += f"\n（直近{PARTY_HISTORY_EVENTS}回と同じ組み合わせが {repeats} 組だけ残ったよ）"
+    blocks = [f"🧩 パーティ {i+1}:\n" + "\n".join(_line(uid) for uid in g) for i, g in enumerate(groups)]
+    for chunk in _chunk_blocks([header, *blocks]):
+        await ctx.followup.send(chunk)
 
 # --- エリア抽選（便利ツール系） ---
 @bot.slash_command(name="205_エリア抽選", description="環境変数 AREA_LIST からエリアをランダム抽選します")
+@_instrumented("command")
 async def area_draw(
     ctx,
     数: discord.Option(int, description="抽選する個数（1以上）", required=False, default=1),
@@ -756,6 +2803,7 @@ async def area_draw(
     default_member_permissions=discord.Permissions(administrator=True),
     dm_permission=False
 )
+@_instrumented("command")
 async def area_reload(ctx):
     if not ctx.author.guild_permissions.administrator:
         await ctx.respond("❌ このコマンドは管理者のみ実行できます。", ephemeral=True)
@@ -774,6 +2822,7 @@ async def area_reload(ctx):
 
 # --- 武器抽選（便利ツール系） ---
 @bot.slash_command(name="204_武器抽選", description="武器一覧からランダムに選びます")
+@_instrumented("command")
 async def weapon_draw(
     ctx,
     数: discord.Option(int, description="抽選する個数（1以上）", required=False, default=1),
@@ -813,6 +2862,7 @@ async def weapon_draw(
     default_member_permissions=discord.Permissions(administrator=True),
     dm_permission=False
 )
+@_instrumented("command")
 async def weapon_reload(ctx):
     if not ctx.author.guild_permissions.administrator:
         await ctx.respond("❌ このコマンドは管理者のみ実行できます。", ephemeral=True)
@@ -831,9 +2881,8 @@ async def weapon_reload(ctx):
 
 # --- イベント取得系 ---
 EVENT_URL = "https://gamewith.jp/mhwilds/484117"
-def fetch_events():
-    res = requests.get(EVENT_URL)
-    soup = BeautifulSoup(res.content, "html.parser")
+def _parse_events(html: bytes, parser: str | None = None) -> tuple[list[dict], list[dict]]:
+    soup = BeautifulSoup(html, parser or HTML_PARSER, parse_only=_EVENT_STRAINER)
     items = soup.find_all("div", class_="_item")
     current_events, upcoming_events = [], []
     for item in items:
@@ -848,20 +2897,17 @@ def fetch_events():
         if not body: continue
         info = body.find("div", class_="_info")
         if not info: continue
-        labels = info.find_all("div", class_="_label-9")
-        all_divs = info.find_all("div")
-        values = []
-        skip_next = False
-        for i, div in enumerate(all_divs):
-            if skip_next:
-                skip_next = False
-                continue
-            if div in labels:
-                if i + 1 < len(all_divs):
-                    values.append(all_divs[i + 1])
-                    skip_next = True
+        # ラベル（_label-9）の直後の div がその値（値になった div はラベルとして扱わない）
+        pairs = []
+        label = None
+        for div in info.find_all("div"):
+            if label is not None:
+                pairs.append((label, div))
+                label = None
+            elif "_label-9" in (div.get("class") or ()):
+                label = div
         event_info = {"タイトル": name, "URL": link}
-        for label, value in zip(labels, values):
+        for label, value in pairs:
             key = label.text.strip()
             val = value.get_text(separator="\n", strip=True)
             event_info[key] = val
@@ -871,9 +2917,82 @@ def fetch_events():
             upcoming_events.append(event_info)
     return current_events, upcoming_events
 
+# --- イベント情報キャッシュ（TTL + 条件付きGET + stale-while-revalidate） ---
+# ページの更新は1日数回なので、解析済みの結果を EVENT_CACHE_TTL_SEC の間使い回す。
+# TTL切れ後は古い結果をすぐ返しつつ裏で再取得し、ETag/Last-Modified で差分がなければ解析も省く。
+# 取得に失敗した場合は最後に成功した結果を返し続け、EVENT_CACHE_ERROR_RETRY_SEC 後に再挑戦する。
+EVENT_CACHE_TTL_SEC         = float(os.getenv("EVENT_CACHE_TTL_SEC", "900"))
+EVENT_CACHE_ERROR_RETRY_SEC = float(os.getenv("EVENT_CACHE_ERROR_RETRY_SEC", "60"))
+
+_EVENT_CACHE: dict = {
+    "data": None,             # (current_events, upcoming_events) | None
+    "etag": None,             # 直近レスポンスの ETag
+    "last_modified": None,    # 直近レスポンスの Last-Modified
+    "next_refresh_at": 0.0,   # time.monotonic() 基準の次回再検証時刻
+}
+_event_refresh_task: asyncio.Task | None = None
+EVENT_CACHE_STATS = {"hits": 0, "misses": 0, "not_modified": 0}
+
+async def _refresh_event_cache() -> tuple[list[dict], list[dict]]:
+    """EVENT_URL を条件付きGETで再検証し、キャッシュを更新して結果を返す"""
+    headers = {}
+    if _EVENT_CACHE["etag"]:
+        headers["If-None-Match"] = _EVENT_CACHE["etag"]
+    if _EVENT_CACHE["last_modified"]:
+        headers["If-Modified-Since"] = _EVENT_CACHE["last_modified"]
+    try:
+        status, res_headers, body = await http_get(EVENT_URL, headers=headers or None)
+        if status == 304 and _EVENT_CACHE["data"] is not None:
+            EVENT_CACHE_STATS["not_modified"] += 1
+            data = _EVENT_CACHE["data"]
+        elif status == 200:
+            data = await asyncio.to_thread(_parse_events, body)
+            _EVENT_CACHE["data"] = data
+            _EVENT_CACHE["etag"] = res_headers.get("ETag")
+            _EVENT_CACHE["last_modified"] = res_headers.get("Last-Modified")
+        else:
+            raise RuntimeError(f"event page fetch failed: HTTP {status}")
+    except Exception as e:
+        _EVENT_CACHE["next_refresh_at"] = time.monotonic() + EVENT_CACHE_ERROR_RETRY_SEC
+        if _EVENT_CACHE["data"] is None:
+            raise
+        print(f"[EVENTS] 再取得に失敗したため前回の結果を使用します: {e}", flush=True)
+        return _EVENT_CACHE["data"]
+    _EVENT_CACHE["next_refresh_at"] = time.monotonic() + EVENT_CACHE_TTL_SEC
+    return data
+
+def _start_event_refresh() -> asyncio.Task:
+    """再取得タスクを1本だけ走らせる（同時に呼ばれても通信は1回）"""
+    global _event_refresh_task
+    if _event_refresh_task is None or _event_refresh_task.done():
+        _event_refresh_task = asyncio.create_task(_refresh_event_cache())
+        # 裏で走らせた場合も例外を回収しておく（未回収警告の抑止）
+        _event_refresh_task.add_done_callback(lambda t: t.cancelled() or t.exception())
+    return _event_refresh_task
+
+async def fetch_events() -> tuple[list[dict], list[dict]]:
+    """
+    (current_events, upcoming_events) を返す。
+    キャッシュが空なら取得完了を待ち、TTL切れなら古い結果を即返して裏で再検証する。
+    """
+    data = _EVENT_CACHE["data"]
+    if data is None:
+        EVENT_CACHE_STATS["misses"] += 1
+        return await asyncio.shield(_start_event_refresh())
+    EVENT_CACHE_STATS["hits"] += 1
+    if time.monotonic() >= _EVENT_CACHE["next_refresh_at"]:
+        _start_event_refresh()
+    return data
+
 @bot.slash_command(name="301_イベント開催中", description="現在開催中のイベント一覧を表示します")
+@_instrumented("command")
 async def current(ctx):
-    events, _ = fetch_events()
+    await ctx.defer()
+    try:
+        events, _ = await fetch_events()
+    except Exception as e:
+        await ctx.respond(f"⚠️ イベント情報の取得に失敗しました: {e}")
+        return
     if not events:
         await ctx.respond("現在開催中のイベントは見つかりませんでした。")
         return
@@ -889,8 +3008,14 @@ async def current(ctx):
         await ctx.respond(msg)
 
 @bot.slash_command(name="302_イベント開催予定", description="今後開催予定のイベント一覧を表示します")
+@_instrumented("command")
 async def upcoming(ctx):
-    _, events = fetch_events()
+    await ctx.defer()
+    try:
+        _, events = await fetch_events()
+    except Exception as e:
+        await ctx.respond(f"⚠️ イベント情報の取得に失敗しました: {e}")
+        return
     if not events:
         await ctx.respond("開催予定のイベントは見つかりませんでした。")
         return
@@ -907,6 +3032,7 @@ async def upcoming(ctx):
 
 # --- クエスト募集スラッシュコマンド ---
 @bot.slash_command(name="101_狩り募集", description="クエスト募集メッセージを投稿します（必要ならVCも同時作成）")
+@_instrumented("command")
 async def quest_post(
     ctx,
     # === 必須（required=True）===
@@ -984,20 +3110,21 @@ async def quest_post(
             overwrites[sentinel_role] = discord.PermissionOverwrite()
 
         # VC名
-        name = ボイスルーム_名称.strip() if ボイスルーム_名称.strip() else f"募集VC：{ctx.author.name}"
+        name = ボイスルーム_名称.strip() if ボイスルーム_名称.strip() else f"{TEMP_VC_NAME_PREFIX}{ctx.author.name}"
 
-        created_vc = await ctx.guild.create_voice_channel(
+        created_vc = await _outbound(PRIO_RECRUIT, f"guild:{ctx.guild.id}", lambda: ctx.guild.create_voice_channel(
             name=name,
             category=parent_category,
             overwrites=overwrites,
             user_limit=vc_limit,
             reason=f"{ctx.author} の募集に合わせてBotが作成"
-        )
+        ))
         used_vc = created_vc
 
         # パスコード接続を有効化（保持）
         if ボイスルーム_パスワード.strip():
             VC_PASSCODES[ボイスルーム_パスワード.strip()] = created_vc.id
+            _persist("vc_passcodes", ボイスルーム_パスワード.strip())
 
     # ---- 埋め込みにVC情報反映 ----
     if used_vc:
@@ -1021,6 +3148,10 @@ async def quest_post(
     except Exception:
         pass
 
+    # followup の戻り値は Webhook 経由の編集になり、トークン失効（15分）後に使えないため
+    # チャンネル側の PartialMessage をハンドルとして保持する
+    _remember_message(ctx.channel.get_partial_message(original_msg.id))
+
     RECRUITS[original_msg.id] = {
         "owner_id": ctx.author.id,
         "channel_id": ctx.channel.id,
@@ -1030,7 +3161,10 @@ async def quest_post(
         "limit": vc_limit,
         "participants": set(),
         "closed": False,
+        "created_at": time.time(),
     }
+    _persist("recruits", original_msg.id)
+    _route_add(original_msg.id, ROUTE_RECRUIT)
 
     # 募集スレッドを作る（常に作成／公開スレッド）。
     # スラコマ実行場所がすでにスレッドなら、そのスレッドを流用。
@@ -1040,12 +3174,12 @@ async def quest_post(
             thread = ctx.channel
         else:
             # TextChannel 側から message=original_msg を指定して作成（ライブラリ互換性が高い）
-            thread = await ctx.channel.create_thread(
+            thread = await _outbound(PRIO_RECRUIT, f"channel:{ctx.channel.id}", lambda: ctx.channel.create_thread(
                 name=f"{ctx.author.name}の募集スレッド",
                 message=original_msg,
                 auto_archive_duration=60,  # 1時間
                 type=discord.ChannelType.public_thread
-            )
+            ))
         # スレッドに初期メッセージを投稿（要点まとめ）
         try:
             summary_lines = [
@@ -1057,7 +3191,7 @@ async def quest_post(
                 summary_lines.append(f"📍 場所: **{used_vc.name}**")
             if 募集カスタム内容:
                 summary_lines.append(f"💬 補足: {募集カスタム内容}")
-            await thread.send("\n".join(summary_lines))
+            await _outbound_send(PRIO_RECRUIT, thread, "\n".join(summary_lines))
         except Exception:
             pass
     except discord.Forbidden:
@@ -1074,16 +3208,21 @@ async def quest_post(
             "created_at": discord.utils.utcnow()
         }
         THREAD_TO_VC[thread.id] = created_vc.id
+        _index_temp_vc(created_vc)
+        _persist("temp_vcs", created_vc.id)
+        _persist("thread_to_vc", thread.id)
 
         # パスコード案内
         if ボイスルーム_パスワード.strip():
-            await thread.send(
+            await _outbound_send(
+                PRIO_RECRUIT, thread,
                 f"🔐 このVCはパスコード制です。\n"
                 f"入室したい方は `/102_パス付きボイスルーム入室 code:{ボイスルーム_パスワード.strip()}` を実行してください。\n"
                 f"（実行した人だけ、このVCへの接続許可が自動で付きます）"
             )
 
 @bot.slash_command(name="102_パス付きボイスルーム入室", description="パスコードを入力して、対象VCへの接続権限を付与します")
+@_instrumented("command")
 async def vc_join(ctx, code: discord.Option(str, description="配布されたパスコード")):
     vc_id = VC_PASSCODES.get(code.strip())
     if not vc_id:
@@ -1096,12 +3235,12 @@ async def vc_join(ctx, code: discord.Option(str, description="配布されたパ
         return
 
     try:
-        await channel.set_permissions(
+        await _outbound(PRIO_RECRUIT, f"guild:{ctx.guild.id}", lambda: channel.set_permissions(
             ctx.author,
             view_channel=True,
             connect=True,
             speak=True
-        )
+        ))
         await ctx.respond(f"✅ `{channel.name}` への入室権限を付与しました。", ephemeral=True)
     except discord.Forbidden:
         await ctx.respond("⚠️ 権限不足で許可を付与できませんでした。", ephemeral=True)
@@ -1110,6 +3249,7 @@ async def vc_join(ctx, code: discord.Option(str, description="配布されたパ
 
 
 @bot.event
+@_instrumented("event")
 async def on_thread_update(before: discord.Thread, after: discord.Thread):
     if before.archived is False and after.archived is True:
         vc_id = THREAD_TO_VC.get(after.id)
@@ -1118,85 +3258,230 @@ async def on_thread_update(before: discord.Thread, after: discord.Thread):
         channel = after.guild.get_channel(vc_id)
         if channel and isinstance(channel, discord.VoiceChannel):
             try:
-                await channel.delete(reason="募集スレッドのアーカイブに伴い自動削除")
+                await _outbound(PRIO_COSMETIC, f"channel:{channel.id}",
+                                lambda: channel.delete(reason="募集スレッドのアーカイブに伴い自動削除"))
             finally:
                 TEMP_VCS.pop(vc_id, None)
                 THREAD_TO_VC.pop(after.id, None)
+                _persist("temp_vcs", vc_id)
+                _persist("thread_to_vc", after.id)
                 # パスコード紐付けも掃除
                 for code, _vc in list(VC_PASSCODES.items()):
                     if _vc == vc_id:
                         VC_PASSCODES.pop(code, None)
+                        _persist("vc_passcodes", code)
+
+# --- Bot作成VCの索引（ギルドごと） ---
+# クリーンアップ時に全チャンネルを走査しなくて済むよう、対象になりうるVCを常時索引しておく。
+# 起動時に1回だけ voice_channels から作り、以後はチャンネル作成/削除/更新イベントで追従する。
+TEMP_VC_NAME_PREFIX = "募集VC："
+CLEANUP_CONCURRENCY = int(os.getenv("CLEANUP_CONCURRENCY", "4"))   # VC削除の同時実行数
+# { guild_id: {vc_id: センチネル付きか(bool)} }（センチネル無しは TEMP_VCS 登録 or 既定名のVC）
+TEMP_VC_INDEX: dict[int, dict[int, bool]] = {}
+
+def _classify_temp_vc(ch) -> bool | None:
+    """センチネル付きなら True、TEMP_VCS登録/既定名のみなら False、対象外なら None"""
+    if not isinstance(ch, discord.VoiceChannel):
+        return None
+    sentinel = _get_sentinel_role(ch.guild)
+    if sentinel is not None and sentinel in ch.overwrites:
+        return True
+    if ch.id in TEMP_VCS or ch.name.startswith(TEMP_VC_NAME_PREFIX):
+        return False
+    return None
 
-# --- 日次クリーンアップタスク ---
-@tasks.loop(time=dtime(hour=8, minute=0, tzinfo=JST))
-async def daily_cleanup_vcs():
-    start_ts = discord.utils.utcnow()
-    print(f"[CLEANUP] ⏱️ 開始 {start_ts.isoformat()} (JST 8:00 トリガ)", flush=True)
+def _index_temp_vc(ch):
+    marked = _classify_temp_vc(ch)
+    vcs = TEMP_VC_INDEX.setdefault(ch.guild.id, {})
+    if marked is None:
+        vcs.pop(ch.id, None)
+    else:
+        vcs[ch.id] = marked
 
-    deleted_vc_count = 0
-    not_found_count = 0
-    error_count = 0
+def _unindex_temp_vc(guild_id: int, vc_id: int):
+    TEMP_VC_INDEX.get(guild_id, {}).pop(vc_id, None)
 
-    # マーカー（センチネルロール）だけで判定
-    target_ids = set()
-    for guild in bot.guilds:
-        sentinel = _get_sentinel_role(guild)
-        for ch in guild.channels:
-            if isinstance(ch, discord.VoiceChannel):
-                if sentinel is not None and sentinel in ch.overwrites:
-                    target_ids.add(ch.id)
+def _seed_temp_vc_index(guild: discord.Guild):
+    TEMP_VC_INDEX[guild.id] = {}
+    for ch in guild.voice_channels:
+        _index_temp_vc(ch)
+
+@bot.event
+@_instrumented("event")
+async def on_guild_channel_create(channel):
+    _index_temp_vc(channel)
 
-    print(f"[CLEANUP] 対象VC数: {len(target_ids)} / ids={list(target_ids)}", flush=True)
+@bot.event
+@_instrumented("event")
+async def on_guild_channel_update(before, after):
+    _index_temp_vc(after)
 
-    for vc_id in list(target_ids):
-        deleted_this_id = False
-        for guild in bot.guilds:
+@bot.event
+@_instrumented("event")
+async def on_guild_channel_delete(channel):
+    _unindex_temp_vc(channel.guild.id, channel.id)
+
+@bot.event
+@_instrumented("event")
+async def on_guild_join(guild: discord.Guild):
+    _seed_temp_vc_index(guild)
+
+@bot.event
+@_instrumented("event")
+async def on_guild_remove(guild: discord.Guild):
+    TEMP_VC_INDEX.pop(guild.id, None)
+
+async def _cleanup_indexed_vcs(marked_only: bool, reason: str, guilds: list | None = None) -> list[dict]:
+    """
+    索引済みのVCをギルドごと・並列に削除し、ギルド単位の集計を返す。
+    marked_only=True ならセンチネル付きVCのみ（日次の自動実行）。guilds 省略時は全ギルド。
+    同時実行数の枠はシャードごとに持つ（あるシャードの混雑が他のシャードのギルドを待たせない）。
+    """
+    sems: dict[int, asyncio.Semaphore] = {}
+
+    async def _delete(guild: discord.Guild, ch: discord.VoiceChannel, stats: dict):
+        shard_id = guild.shard_id or 0
+        sem = sems.get(shard_id)
+        if sem is None:
+            sem = sems[shard_id] = asyncio.Semaphore(CLEANUP_CONCURRENCY)
+        async with sem:
+            try:
+                await _outbound(PRIO_COSMETIC, f"channel:{ch.id}", lambda: ch.delete(reason=reason))
+                stats["deleted"] += 1
+                print(f"[CLEANUP] ✅ 削除 vc_id={ch.id} guild={guild.name} ch={ch.name}", flush=True)
+            except discord.NotFound:
+                stats["not_found"] += 1
+            except Exception as e:
+                stats["errors"] += 1
+                print(f"[CLEANUP] ⚠️ 削除失敗 vc_id={ch.id} guild={guild.name} err={e}", flush=True)
+                return
+            _unindex_temp_vc(guild.id, ch.id)
+            stats["vc_ids"].append(ch.id)
+
+    async def _clean_guild(guild: discord.Guild) -> dict:
+        started = time.perf_counter()
+        stats = {"guild": guild, "deleted": 0, "not_found": 0, "errors": 0, "vc_ids": [], "elapsed": 0.0}
+        targets = []
+        for vc_id, marked in list(TEMP_VC_INDEX.get(guild.id, {}).items()):
+            if marked_only and not marked:
+                continue
             ch = guild.get_channel(vc_id)
-            if ch and isinstance(ch, discord.VoiceChannel):
-                try:
-                    await ch.delete(reason="日次クリーンアップ（Bot作成VC/マーカー付きVC）")
-                    deleted_vc_count += 1
-                    deleted_this_id = True
-                    print(f"[CLEANUP] ✅ 削除 vc_id={vc_id} guild={guild.name} ch={ch.name}", flush=True)
-                    break
-                except Exception as e:
-                    error_count += 1
-                    print(f"[CLEANUP] ⚠️ 削除失敗 vc_id={vc_id} guild={guild.name} err={e}", flush=True)
-        if not deleted_this_id:
-            not_found_count += 1
-            print(f"[CLEANUP] ❓ 見つからず/削除不可 vc_id={vc_id}", flush=True)
-        # メタ情報は必ず破棄
-        TEMP_VCS.pop(vc_id, None)
+            if isinstance(ch, discord.VoiceChannel):
+                targets.append(ch)
+            else:
+                stats["not_found"] += 1
+                stats["vc_ids"].append(vc_id)
+                _unindex_temp_vc(guild.id, vc_id)
+        await asyncio.gather(*(_delete(guild, ch, stats) for ch in targets))
+        stats["elapsed"] = time.perf_counter() - started
+        print(
+            f"[CLEANUP] guild={guild.name} 対象={len(targets)} 削除={stats['deleted']} "
+            f"未検出={stats['not_found']} エラー={stats['errors']} {stats['elapsed']:.2f}s",
+            flush=True,
+        )
+        return stats
 
-    # パスコード・スレッド紐付けも全消し
-    pass_cnt = len(VC_PASSCODES)
-    map_cnt = len(THREAD_TO_VC)
-    VC_PASSCODES.clear()
-    THREAD_TO_VC.clear()
-    print(f"[CLEANUP] 🔑 パスコードクリア: {pass_cnt} 件 / スレッド紐付けクリア: {map_cnt} 件", flush=True)
+    return list(await asyncio.gather(*(_clean_guild(g) for g in (bot.guilds if guilds is None else guilds))))
+
+# --- 日次クリーンアップタスク ---
+# VC の削除と結果の報告はシャードごとのループ（_shard_cleanup_loops）が、そのシャードのギルドだけを対象に行う。
+# 遅いシャード（削除が多い・429 を受けている）があっても、他のシャードの削除・報告や次回の実行を待たせない。
+# 募集情報・パスコード・スレッド紐付けはプロセス全体の状態なので、daily_cleanup_state が1回だけ片付ける。
+DAILY_CLEANUP_TIME = dtime(hour=8, minute=0, tzinfo=JST)
+_shard_cleanup_loops: dict[int, tasks.Loop] = {}
+
+def _local_shard_ids() -> list[int]:
+    """このプロセスが受け持つシャード番号（シャーディングなしなら [0]）"""
+    shards = getattr(bot, "shards", None)
+    return sorted(shards) if shards else [0]
+
+async def daily_cleanup_shard(shard_id: int) -> list[dict]:
+    """shard_id のギルドにあるマーカー付きVCを削除し、ギルドごとの結果を管理ログへ報告する"""
+    start_ts = discord.utils.utcnow()
+    guilds = [g for g in bot.guilds if (g.shard_id or 0) == shard_id]
+    print(f"[CLEANUP] ⏱️ 開始 shard={shard_id} guilds={len(guilds)} {start_ts.isoformat()} (JST 8:00 トリガ)", flush=True)
+
+    # マーカー（センチネルロール）付きVCだけが対象
+    results = await _cleanup_indexed_vcs(marked_only=True, reason="日次クリーンアップ（Bot作成VC/マーカー付きVC）", guilds=guilds)
+    deleted_vc_count = sum(r["deleted"] for r in results)
+    not_found_count = sum(r["not_found"] for r in results)
+    error_count = sum(r["errors"] for r in results)
+
+    # メタ情報は必ず破棄
+    for r in results:
+        for vc_id in r["vc_ids"]:
+            TEMP_VCS.pop(vc_id, None)
+            _persist("temp_vcs", vc_id)
 
     end_ts = discord.utils.utcnow()
+    guild_lines = "\n".join(
+        f"  - {r['guild'].name}: 削除 {r['deleted']} / {r['elapsed']:.2f}s"
+        for r in results if r["deleted"] or r["not_found"] or r["errors"]
+    )
     summary = (
-        f"🧹 日次クリーンアップ完了\n"
+        f"🧹 日次クリーンアップ完了 (shard {shard_id})\n"
         f"- 削除VC: {deleted_vc_count}\n"
         f"- 未検出/不可: {not_found_count}\n"
         f"- エラー: {error_count}\n"
         f"- 開始: {start_ts.isoformat()} / 終了: {end_ts.isoformat()}"
     )
+    if guild_lines:
+        summary += f"\n- サーバー別:\n{guild_lines}"
     print(f"[CLEANUP] 完了サマリ: {summary}", flush=True)
 
-    # 管理者ログチャンネルにも通知（設定されている場合のみ）
-    if 'ADMIN_LOG_CHANNEL_ID' in globals() and ADMIN_LOG_CHANNEL_ID and ADMIN_LOG_CHANNEL_ID != 0:
-        for guild in bot.guilds:
-            admin_log_ch = guild.get_channel(ADMIN_LOG_CHANNEL_ID)
-            if admin_log_ch:
-                try:
-                    await admin_log_ch.send(summary)
-                except Exception as e:
-                    print(f"[CLEANUP] 管理ログ送信失敗: {e}", flush=True)
-                break  # 最初に見つかったチャンネルへ1回だけ
+    # 管理者ログチャンネルにも通知（設定されているサーバーごとに、そのサーバーの結果だけ）
+    for r in results:
+        guild = r["guild"]
+        admin_log_ch = guild.get_channel(guild_config(guild.id)["admin_log_channel_id"])
+        if not admin_log_ch:
+            continue
+        try:
+            await _outbound_send(
+                PRIO_COSMETIC, admin_log_ch,
+                f"🧹 日次クリーンアップ完了\n"
+                f"- 削除VC: {r['deleted']}\n"
+                f"- 未検出/不可: {r['not_found']}\n"
+                f"- エラー: {r['errors']}\n"
+                f"- 開始: {start_ts.isoformat()} / 終了: {end_ts.isoformat()}"
+            )
+        except Exception as e:
+            print(f"[CLEANUP] 管理ログ送信失敗 guild={guild.name}: {e}", flush=True)
+    return results
+
+def _start_shard_cleanup_loops():
+    for shard_id in _local_shard_ids():
+        loop = _shard_cleanup_loops.get(shard_id)
+        if loop is None:
+            async def _run(shard_id=shard_id):
+                await daily_cleanup_shard(shard_id)
+            loop = _shard_cleanup_loops[shard_id] = tasks.loop(time=DAILY_CLEANUP_TIME)(_run)
+        if not loop.is_running():
+            loop.start()
+            print(f"[CLEANUP] shard={shard_id} の日次クリーンアップを登録しました", flush=True)
+
+@tasks.loop(time=DAILY_CLEANUP_TIME)
+async def daily_cleanup_state():
+    # 古い募集情報を破棄（永続化しているため放置すると増え続ける）
+    recruit_cutoff = time.time() - RECRUIT_RETENTION_DAYS * 86400
+    old_recruits = [mid for mid, d in RECRUITS.items() if d.get("created_at", 0) < recruit_cutoff]
+    for mid in old_recruits:
+        RECRUITS.pop(mid, None)
+        _recruit_last_embed.pop(mid, None)
+        _forget_message(mid)
+        _route_remove(mid)
+        _persist("recruits", mid)
+    print(f"[CLEANUP] 📝 古い募集情報を破棄: {len(old_recruits)} 件", flush=True)
+
+    # パスコード・スレッド紐付けも全消し
+    pass_cnt = len(VC_PASSCODES)
+    map_cnt = len(THREAD_TO_VC)
+    VC_PASSCODES.clear()
+    THREAD_TO_VC.clear()
+    STATE.mark_cleared("vc_passcodes")
+    STATE.mark_cleared("thread_to_vc")
+    print(f"[CLEANUP] 🔑 パスコードクリア: {pass_cnt} 件 / スレッド紐付けクリア: {map_cnt} 件", flush=True)
 
-@daily_cleanup_vcs.before_loop
+@daily_cleanup_state.before_loop
 async def before_cleanup():
     print("[CLEANUP] 待機: bot.wait_until_ready() …", flush=True)
     await bot.wait_until_ready()
@@ -1209,49 +3494,66 @@ async def before_cleanup():
     default_member_permissions=discord.Permissions(administrator=True),
     dm_permission=False
 )
+@_instrumented("command")
 async def manual_daily_cleanup(ctx):
     if not ctx.author.guild_permissions.administrator:
         await ctx.respond("❌ このコマンドは管理者のみ実行できます。", ephemeral=True)
         return
 
-    deleted_vc_count = 0
+    await ctx.defer(ephemeral=True)
 
-    # 対象候補を収集
-    target_ids = set(TEMP_VCS.keys())
-    for guild in bot.guilds:
-        sentinel = _get_sentinel_role(guild)
-        for ch in guild.channels:
-            if isinstance(ch, discord.VoiceChannel):
-                marked = False
-                if sentinel is not None and sentinel in ch.overwrites:
-                    marked = True
-                if (ch.id in TEMP_VCS) or marked or ch.name.startswith("募集VC："):
-                    target_ids.add(ch.id)
-
-    # 削除処理
-    for vc_id in list(target_ids):
-        for guild in bot.guilds:
-            ch = guild.get_channel(vc_id)
-            if ch and isinstance(ch, discord.VoiceChannel):
-                try:
-                    await ch.delete(reason="管理者による日次クリーン実行（Bot作成VC/マーカー付きVC）")
-                    deleted_vc_count += 1
-                    break
-                except Exception:
-                    pass
-        TEMP_VCS.pop(vc_id, None)
+    # 索引済みの候補（センチネル付き / TEMP_VCS登録 / 既定名）をまとめて削除
+    results = await _cleanup_indexed_vcs(marked_only=False, reason="管理者による日次クリーン実行（Bot作成VC/マーカー付きVC）")
+    deleted_vc_count = sum(r["deleted"] for r in results)
+    TEMP_VCS.clear()
+    STATE.mark_cleared("temp_vcs")
 
     # パスコード/スレッド紐付けも全消し
     VC_PASSCODES.clear()
     THREAD_TO_VC.clear()
+    STATE.mark_cleared("vc_passcodes")
+    STATE.mark_cleared("thread_to_vc")
 
     result_msg = (
         f"🧹 日次クリーンアップを実行しました。\n"
-        f"削除VC数: {deleted_vc_count}\n"
+        f"削除VC数: {deleted_vc_count}（所要 {max((r['elapsed'] for r in results), default=0.0):.2f}s）\n"
         f"パスコード・スレッド紐付けもリセットしました。"
     )
     await ctx.respond(result_msg, ephemeral=True)
 
+# --- 管理者専用: メンバー名の監査（無意味英字列の一括採点） ---
+@bot.slash_command(
+    name="299_名前監査",
+    description="メンバー名を採点し、無意味英字列の疑いがある人を一覧します（管理者専用）",
+    default_member_permissions=discord.Permissions(administrator=True),
+    dm_permission=False
+)
+@_instrumented("command")
+async def audit_member_names(
+    ctx,
+    件数: discord.Option(int, description="表示する最大件数（最大30）", required=False, default=20)
+):
+    if not ctx.author.guild_permissions.administrator:
+        await ctx.respond("❌ このコマンドは管理者のみ実行できます。", ephemeral=True)
+        return
+    await ctx.defer(ephemeral=True)
+
+    members = [m for m in ctx.guild.members if not m.bot]
+    # 大規模サーバーでもイベントループを止めないよう、採点は別スレッドで一括実行
+    scores = await asyncio.to_thread(gibberish_scores, [m.name for m in members])
+    flagged = sorted(
+        ((score, m) for m, score in zip(members, scores) if score is not None and score < GIBBERISH_THRESHOLD),
+        key=lambda x: x[0],
+    )
+    if not flagged:
+        await ctx.respond(f"✅ 対象 {len(members)} 人中、疑わしい名前は見つかりませんでした。", ephemeral=True)
+        return
+    lines = "\n".join(f"- {m.mention} `{m.name}` (score {score:.2f})" for score, m in flagged[:max(1, min(件数, 30))])
+    await ctx.respond(
+        f"🔎 名前監査結果（対象 {len(members)} 人 / 該当 {len(flagged)} 人 / しきい値 {GIBBERISH_THRESHOLD}）\n{lines}",
+        ephemeral=True
+    )
+
  # --- 起動前プリフライト: /users/@me でトークン疎通確認 & レート制限尊重 ---
 def preflight_check_sync(token: str):
     url = "https://discord.com/api/v10/users/@me"
@@ -1297,14 +3599,30 @@ def preflight_check_sync(token: str):
 
 # --- スラッシュコマンドはここより上へ！ ---
 @bot.event
+@_instrumented("event")
 async def on_ready():
     try:
         print("✅ on_ready() に入りました！")
         print(f"✅ ログインユーザー: {bot.user} (ID: {bot.user.id})")
         await bot.sync_commands()
         print("✅ スラッシュコマンドの同期に成功しました_20251028")
-        if not daily_cleanup_vcs.is_running():
-            daily_cleanup_vcs.start()
+        _start_shard_cleanup_loops()
+        if not daily_cleanup_state.is_running():
+            daily_cleanup_state.start()
+        if not flush_state.is_running():
+            flush_state.start()
+        if RUN_MODE == "gateway":
+            await _start_gateway_ipc()
+        global _event_loop_lag_task
+        if _event_loop_lag_task is None:
+            _event_loop_lag_task = asyncio.create_task(_measure_event_loop_lag())
+        # 一時VCの索引は起動時に1回だけ全走査して作る（以後はイベントで追従）
+        for guild in bot.guilds:
+            _seed_temp_vc_index(guild)
+        # モンスター一覧は裏で最新化（起動・ログインを外部サイトに待たせない）
+        global _monster_refresh_task
+        if _monster_refresh_task is None:
+            _monster_refresh_task = asyncio.create_task(_background_monster_refresh())
     except Exception as e:
         import traceback
         print(f"❌ on_ready() 内でエラー発生: {e}")
@@ -1312,20 +3630,65 @@ async def on_ready():
 
 print("[TRACE] about to enter __main__ block check", flush=True)
 # --- 起動処理 ---
-if __name__ == "__main__":
-    print("[TRACE] __main__ confirmed; running sync preflight then bot.run()", flush=True)
+async def run_bot(token: str):
+    """
+    HTTP と Discord ゲートウェイを同じイベントループで動かす。
+    HTTP はプリフライトやログインより先に受付を始める（待機中も Render のヘルスチェックに応答するため）。
+    """
+    # RUN_MODE=gateway では HTTP 側は別プロセス（RUN_MODE=http）が受け持つ
+    if RUN_MODE == "single":
+        await start_http_server()
+    try:
+        await asyncio.to_thread(preflight_check_sync, token)
+        print("[BOOT] bot.start() を開始します…", flush=True)
+        while True:
+            try:
+                await bot.start(token)
+                break  # 正常終了したらループ抜ける
+            except discord.HTTPException as e:
+                if "429" in str(e) or "Too Many Requests" in str(e):
+                    print("❌ 429 Too Many Requests 発生。1時間停止して再試行します…", flush=True)
+                    if not bot.is_closed():
+                        await bot.close()
+                    bot.clear()
+                    await asyncio.sleep(3600)  # 3600秒 = 1時間
+                else:
+                    raise
+    finally:
+        if not bot.is_closed():
+            await bot.close()
+        if _web_runner is not None:
+            await _web_runner.cleanup()
+        await close_http_session()
+
+if __name__ == "__main__" and RUN_MODE == "http":
+    print("[BOOT] RUN_MODE=http: HTTP 側だけを起動します（Discord には接続しない）", flush=True)
+    run_http_mode()
+elif __name__ == "__main__":
+    print("[TRACE] __main__ confirmed; running preflight then bot.start()", flush=True)
     if not TOKEN:
         print("❌ TOKEN が未設定です。環境変数 TOKEN を設定してください。", flush=True)
         raise SystemExit(1)
-    preflight_check_sync(TOKEN)
-    print("[BOOT] bot.run() を開始します…", flush=True)
-    while True:
+    if RUN_MODE == "single":
+        _start_tweet_pool()
+    # 永続化済みの状態を復元（on_ready 等のハンドラより前に済ませる）
+    STATE.load()
+    _rebuild_reaction_routes()
+    _start_gateway_recorder()
+    loop = bot.loop
+    main_task = loop.create_task(run_bot(TOKEN))
+    # bot.run() と同じく SIGINT/SIGTERM で止める（finally の保存まで通す）
+    for sig in (signal.SIGINT, signal.SIGTERM):
         try:
-            bot.run(TOKEN)
-            break  # 正常終了したらループ抜ける
-        except discord.HTTPException as e:
-            if "429" in str(e) or "Too Many Requests" in str(e):
-                print("❌ 429 Too Many Requests 発生。1時間停止して再試行します…", flush=True)
-                time.sleep(3600)  # 3600秒 = 1時間
-            else:
-                raise
\ No newline at end of file
+            loop.add_signal_handler(sig, main_task.cancel)
+        except NotImplementedError:
+            pass
+    try:
+        loop.run_until_complete(main_task)
+    except asyncio.CancelledError:
+        print("[BOOT] 停止シグナルを受けて終了します", flush=True)
+    finally:
+        # 未書き出しの変更を最後に保存
+        STATE.flush_sync()
+        if GATEWAY_RECORDER is not None:
+            GATEWAY_RECORDER.close()
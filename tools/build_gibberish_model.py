@@ -0,0 +1,98 @@
+"""
+無意味英字列判定（_is_gibberish_english）用の文字3-gramモデルを生成する。
+
+  pip install wordfreq
+  python tools/build_gibberish_model.py [出力先]   # 既定: assets/gibberish_ngrams.json
+
+学習データ:
+  - 英語の頻出語（wordfreq の上位 ENGLISH_WORDS 語、頻度の対数で重み付け）
+  - ローマ字の音節を2〜4個つないだ語（日本語由来のハンドル名を誤検知しないため）
+生成物は Bot 実行時に読むだけなので、wordfreq は実行環境には不要。
+"""
+import json
+import math
+import os
+import random
+import sys
+from collections import Counter, defaultdict
+
+ORDER = 3
+ALPHABET = "abcdefghijklmnopqrstuvwxyz"
+PAD, END = "^", "$"
+SMOOTHING = 0.1          # 1-gram の加算スムージング係数
+LAMBDAS = (0.6, 0.3, 0.1)  # 3-gram / 2-gram / 1-gram の補間重み
+ENGLISH_WORDS = 30000
+ROMAJI_WORDS = 20000
+
+ROMAJI_SYLLABLES = (
+    "a i u e o ka ki ku ke ko sa shi su se so ta chi tsu te to na ni nu ne no "
+    "ha hi fu he ho ma mi mu me mo ya yu yo ra ri ru re ro wa n "
+    "ga gi gu ge go za ji zu ze zo da de do ba bi bu be bo pa pi pu pe po "
+    "kya kyu kyo sha shu sho cha chu cho nya nyu nyo hya hyu hyo rya ryu ryo "
+    "gya gyu gyo ja ju jo bya byu byo"
+).split()
+
+
+def _training_words() -> list[tuple[str, float]]:
+    from wordfreq import top_n_list, word_frequency
+
+    words = []
+    for w in top_n_list("en", ENGLISH_WORDS):
+        if w.isascii() and w.isalpha():
+            weight = max(1.0, math.log10(word_frequency(w, "en") * 1e9))
+            words.append((w.lower(), weight))
+    rng = random.Random(0)
+    for _ in range(ROMAJI_WORDS):
+        words.append(("".join(rng.choice(ROMAJI_SYLLABLES) for _ in range(rng.randint(2, 4))), 1.0))
+    return words
+
+
+def build(words: list[tuple[str, float]]) -> dict:
+    """
+    3-gram/2-gram/1-gram を線形補間した P(c | ab) を対数で持つ。
+      table: 学習中に出現した "abc" の補間確率
+      back:  "abc" が未出現のときの "bc" による確率（= 3-gram 項が 0 の補間）
+      uni:   "bc" も未出現のときの "c" の確率
+    実行時は table → back → uni の順に辞書を引くだけで済む。
+    """
+    tri: dict[str, Counter] = defaultdict(Counter)
+    bi: dict[str, Counter] = defaultdict(Counter)
+    uni: Counter = Counter()
+    for word, weight in words:
+        s = PAD * (ORDER - 1) + word + END
+        for i in range(ORDER - 1, len(s)):
+            tri[s[i - 2:i]][s[i]] += weight
+            bi[s[i - 1]][s[i]] += weight
+            uni[s[i]] += weight
+
+    l3, l2, l1 = LAMBDAS
+    uni_total = sum(uni.values())
+    vocab = ALPHABET + END
+    p1 = {c: (uni[c] + SMOOTHING) / (uni_total + SMOOTHING * len(vocab)) for c in vocab}
+    p2 = {
+        b + c: nxt[c] / sum(nxt.values())
+        for b, nxt in bi.items() for c in nxt
+    }
+
+    table = {}
+    for ctx, nxt in tri.items():
+        total = sum(nxt.values())
+        for c, n in nxt.items():
+            table[ctx + c] = round(math.log(l3 * n / total + l2 * p2.get(ctx[1] + c, 0.0) + l1 * p1[c]), 3)
+    back = {bc: round(math.log(l2 * p + l1 * p1[bc[1]]), 3) for bc, p in p2.items()}
+    return {
+        "order": ORDER,
+        "pad": PAD,
+        "end": END,
+        "table": table,
+        "back": back,
+        "uni": {c: round(math.log(l1 * p), 3) for c, p in p1.items()},
+    }
+
+
+if __name__ == "__main__":
+    out = sys.argv[1] if len(sys.argv) > 1 else os.path.normpath(os.path.join(os.path.dirname(__file__), "..", "assets", "gibberish_ngrams.json"))
+    model = build(_training_words())
+    with open(out, "w", encoding="utf-8") as f:
+        json.dump(model, f, separators=(",", ":"), sort_keys=True)
+    print(f"wrote {out}: trigrams={len(model['table'])} bigrams={len(model['back'])} bytes={os.path.getsize(out)}")